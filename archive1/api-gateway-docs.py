@@ -1,86 +1,149 @@
+import abc
+import argparse
 import boto3
+import hashlib
 import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-def get_api_integrations_documentation(api_id, region_name='us-east-1'):
+from botocore.config import Config
+
+from apigateway_metrics import (DEFAULT_METRICS_DAYS, DEFAULT_SLOW_P99_MS, LATENCY_PERCENTILES, MAX_QUERIES_PER_REQUEST,
+                                REST_API_ERROR_METRIC, fetch_route_metrics, rest_api_dimensions, route_metric_queries)
+
+# Chamadas get_method simultâneas quando os métodos não vêm embutidos nas páginas de recursos
+DEFAULT_METHOD_WORKERS = 8
+# Tamanho máximo de página do GetResources
+RESOURCES_PAGE_SIZE = 500
+# Métodos HTTP de um Path Item do OpenAPI; 'x-amazon-apigateway-any-method' corresponde ao método ANY
+EXPORT_HTTP_METHODS = {
+    'get': 'GET', 'put': 'PUT', 'post': 'POST', 'delete': 'DELETE', 'options': 'OPTIONS',
+    'head': 'HEAD', 'patch': 'PATCH', 'x-amazon-apigateway-any-method': 'ANY'
+}
+# APIs processadas em paralelo na regeneração incremental (--all / --apis)
+DEFAULT_API_WORKERS = 4
+# Cache de fingerprints (deployments por stage e hash de cada recurso) da regeneração incremental
+FINGERPRINT_CACHE_FILE = '.api-docs-fingerprints.json'
+DOC_FILE_NAME = 'api_integrations_doc.md'
+# Localização de parâmetros do OpenAPI -> prefixo usado pelo API Gateway em requestParameters
+EXPORT_PARAMETER_LOCATIONS = {'path': 'path', 'query': 'querystring', 'header': 'header'}
+
+def describe_method(method):
+    """Extrai da representação de um método (get_method ou embutida no get_resources) os detalhes documentados."""
+    details = {}
+    integration = method.get('methodIntegration')
+    if integration:
+        integration_type = integration.get('type')
+        integration_uri = integration.get('uri')
+        integration_method = integration.get('httpMethod') # Método HTTP da integração (backend)
+
+        details['integration_type'] = integration_type
+        details['integration_uri'] = integration_uri
+        details['integration_method'] = integration_method
+        details['request_templates'] = integration.get('requestTemplates')
+        details['passthrough_behavior'] = integration.get('passthroughBehavior')
+        details['connection_type'] = integration.get('connectionType')
+        details['connection_id'] = integration.get('connectionId')
+
+        # Exemplo: Para integração com Lambda, você pode extrair o nome da função
+        if integration_type == 'AWS_PROXY' and integration_uri and 'lambda' in integration_uri:
+            # Ex: arn:aws:apigateway:us-east-1:lambda:path/2015-03-31/functions/arn:aws:lambda:us-east-1:ACCOUNT_ID:function:FunctionName/invocations
+            # Ou arn:aws:lambda:us-east-1:ACCOUNT_ID:function:FunctionName
+            if "/functions/" in integration_uri:
+                lambda_function_name = integration_uri.split("/functions/")[-1].split("/")[0]
+            elif "function:" in integration_uri: # Direct Lambda ARN
+                lambda_function_name = integration_uri.split("function:")[-1].split(":")[0]
+            else:
+                lambda_function_name = "N/A (parse error)"
+            details['lambda_function_name'] = lambda_function_name
+
+        # Adicione mais campos da integração conforme necessário
+    else:
+        details['integration_details'] = "No integration found for this method."
+
+    # Você também pode querer extrair method_response, method_request, etc.
+    details['method_request_parameters'] = method.get('requestParameters')
+    details['method_responses'] = method.get('methodResponses')
+    return details
+
+def create_client(region_name):
+    # Retries adaptativos para respeitar o limite de requisições da API de gerenciamento do API Gateway
+    return boto3.client('apigateway', region_name=region_name,
+                        config=Config(retries={'max_attempts': 10, 'mode': 'adaptive'}))
+
+def iter_resource_pages(client, api_id):
+    """
+    Lê os recursos (caminhos/endpoints) da API, página a página, com o paginator do get_resources
+    (sem o limite de 500 de uma única chamada) e com embed=['methods'], de modo que os detalhes
+    dos métodos e integrações chegam nas mesmas páginas.
+    """
+    paginator = client.get_paginator('get_resources')
+    for page in paginator.paginate(restApiId=api_id, embed=['methods'], PaginationConfig={'PageSize': RESOURCES_PAGE_SIZE}):
+        yield page.get('items', [])
+
+def fetch_resources(client, api_id):
+    return [resource for page in iter_resource_pages(client, api_id) for resource in page]
+
+def document_resources(client, api_id, resources, max_workers=DEFAULT_METHOD_WORKERS):
+    """
+    Gera a documentação dos recursos informados. Apenas métodos que não vierem embutidos
+    são consultados com get_method, em paralelo.
+    """
+    documentation = {}
+    pending_methods = []
+    for resource in resources:
+        resource_path = resource.get('path')
+        documentation[resource_path] = {}
+
+        # 'resourceMethods' contém um dicionário de métodos HTTP (GET, POST, etc.)
+        for http_method, method in resource.get('resourceMethods', {}).items():
+            if method.get('httpMethod'):
+                documentation[resource_path][http_method] = describe_method(method)
+            else:
+                # Método não embutido na página: consultado individualmente abaixo
+                documentation[resource_path][http_method] = {}
+                pending_methods.append((resource_path, resource.get('id'), http_method))
+
+    def fetch_method(pending_method):
+        resource_path, resource_id, http_method = pending_method
+        try:
+            method_response = client.get_method(restApiId=api_id, resourceId=resource_id, httpMethod=http_method)
+            return pending_method, describe_method(method_response)
+        except client.exceptions.NotFoundException:
+            return pending_method, {'integration_details': "Method not found or not configured."}
+        except Exception as e:
+            return pending_method, {'integration_details': f"Error getting method details: {e}"}
+
+    if pending_methods:
+        print(f"Consultando {len(pending_methods)} métodos não embutidos com get_method ({max_workers} em paralelo).")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for (resource_path, _, http_method), details in executor.map(fetch_method, pending_methods):
+                documentation[resource_path][http_method] = details
+    return documentation
+
+def iter_documented_resources(client, api_id, max_workers=DEFAULT_METHOD_WORKERS):
+    """Gera (caminho, métodos) página a página: a memória fica limitada a uma página de recursos."""
+    for resources in iter_resource_pages(client, api_id):
+        yield from document_resources(client, api_id, resources, max_workers).items()
+
+def get_api_integrations_documentation(api_id, region_name='us-east-1', max_workers=DEFAULT_METHOD_WORKERS):
     """
     Gera a documentação das integrações de um API Gateway.
 
     Args:
         api_id (str): O ID do API Gateway (ex: 'abcdef123').
         region_name (str): A região AWS onde o API Gateway está localizado.
+        max_workers (int): Número máximo de chamadas get_method simultâneas.
 
     Returns:
         dict: Um dicionário contendo a estrutura da API e detalhes de integração.
     """
-    client = boto3.client('apigateway', region_name=region_name)
-    documentation = {}
+    client = create_client(region_name)
 
     try:
-        # 1. Obter recursos (caminhos/endpoints) da API
-        resources_response = client.get_resources(restApiId=api_id, limit=500) # Ajuste o limite conforme necessário
-        resources = resources_response.get('items', [])
-
-        # Loop através de cada recurso
-        for resource in resources:
-            resource_path = resource.get('path')
-            resource_id = resource.get('id')
-            
-            documentation[resource_path] = {}
-            
-            # 2. Obter métodos para cada recurso
-            # 'resourceMethods' contém um dicionário de métodos HTTP (GET, POST, etc.)
-            if 'resourceMethods' in resource:
-                for http_method, method_details in resource['resourceMethods'].items():
-                    documentation[resource_path][http_method] = {}
-                    
-                    # 3. Obter detalhes da integração para cada método
-                    try:
-                        method_response = client.get_method(
-                            restApiId=api_id,
-                            resourceId=resource_id,
-                            httpMethod=http_method
-                        )
-                        
-                        integration = method_response.get('methodIntegration')
-                        if integration:
-                            integration_type = integration.get('type')
-                            integration_uri = integration.get('uri')
-                            integration_method = integration.get('httpMethod') # Método HTTP da integração (backend)
-                            
-                            documentation[resource_path][http_method]['integration_type'] = integration_type
-                            documentation[resource_path][http_method]['integration_uri'] = integration_uri
-                            documentation[resource_path][http_method]['integration_method'] = integration_method
-                            documentation[resource_path][http_method]['request_templates'] = integration.get('requestTemplates')
-                            documentation[resource_path][http_method]['passthrough_behavior'] = integration.get('passthroughBehavior')
-                            documentation[resource_path][http_method]['connection_type'] = integration.get('connectionType')
-                            documentation[resource_path][http_method]['connection_id'] = integration.get('connectionId')
-
-                            # Exemplo: Para integração com Lambda, você pode extrair o nome da função
-                            if integration_type == 'AWS_PROXY' and integration_uri and 'lambda' in integration_uri:
-                                # Ex: arn:aws:apigateway:us-east-1:lambda:path/2015-03-31/functions/arn:aws:lambda:us-east-1:ACCOUNT_ID:function:FunctionName/invocations
-                                # Ou arn:aws:lambda:us-east-1:ACCOUNT_ID:function:FunctionName
-                                if "/functions/" in integration_uri:
-                                    lambda_function_name = integration_uri.split("/functions/")[-1].split("/")[0]
-                                elif "function:" in integration_uri: # Direct Lambda ARN
-                                    lambda_function_name = integration_uri.split("function:")[-1].split(":")[0]
-                                else:
-                                    lambda_function_name = "N/A (parse error)"
-                                documentation[resource_path][http_method]['lambda_function_name'] = lambda_function_name
-                            
-                            # Adicione mais campos da integração conforme necessário
-                        else:
-                            documentation[resource_path][http_method]['integration_details'] = "No integration found for this method."
-                            
-                        # Você também pode querer extrair method_response, method_request, etc.
-                        documentation[resource_path][http_method]['method_request_parameters'] = method_response.get('requestParameters')
-                        documentation[resource_path][http_method]['method_responses'] = method_response.get('methodResponses')
-
-
-                    except client.exceptions.NotFoundException:
-                        documentation[resource_path][http_method]['integration_details'] = "Method not found or not configured."
-                    except Exception as e:
-                        documentation[resource_path][http_method]['integration_details'] = f"Error getting method details: {e}"
-
+        # Recursos lidos com os métodos embutidos; os que não vierem embutidos são consultados em paralelo
+        return dict(iter_documented_resources(client, api_id, max_workers))
     except client.exceptions.NotFoundException:
         print(f"API Gateway with ID '{api_id}' not found in region '{region_name}'.")
         return {}
@@ -88,49 +151,522 @@ def get_api_integrations_documentation(api_id, region_name='us-east-1'):
         print(f"An error occurred: {e}")
         return {}
 
-    return documentation
+def get_export_document(api_id, stage_name, region_name='us-east-1'):
+    """
+    Obtém a definição completa de um stage em uma única chamada get_export
+    (OpenAPI 3 com as extensões de integração do API Gateway).
+    """
+    client = create_client(region_name)
+    response = client.get_export(restApiId=api_id, stageName=stage_name, exportType='oas30',
+                                 parameters={'extensions': 'integrations'}, accepts='application/json')
+    return json.loads(response['body'].read())
+
+def load_export_document(export_file):
+    """Carrega um export (JSON) salvo anteriormente, para gerar a documentação offline."""
+    with open(export_file) as f:
+        return json.load(f)
+
+def _method_from_export(operation):
+    """Converte uma operação do export para o formato retornado pelo get_method, usado por describe_method."""
+    method = {}
+    integration = operation.get('x-amazon-apigateway-integration')
+    if integration:
+        # No export os enums vêm em minúsculas (ex: 'aws_proxy', 'when_no_match')
+        method['methodIntegration'] = {
+            'type': integration.get('type', '').upper() or None,
+            'uri': integration.get('uri'),
+            'httpMethod': integration.get('httpMethod'),
+            'requestTemplates': integration.get('requestTemplates'),
+            'passthroughBehavior': integration.get('passthroughBehavior', '').upper() or None,
+            'connectionType': integration.get('connectionType', '').upper() or None,
+            'connectionId': integration.get('connectionId')
+        }
+
+    request_parameters = {}
+    for parameter in operation.get('parameters', []):
+        location = EXPORT_PARAMETER_LOCATIONS.get(parameter.get('in'))
+        if location:
+            request_parameters[f"method.request.{location}.{parameter['name']}"] = parameter.get('required', False)
+    if request_parameters:
+        method['requestParameters'] = request_parameters
+
+    method_responses = {}
+    for status_code, response in operation.get('responses', {}).items():
+        method_response = {'statusCode': status_code}
+        if response.get('headers'):
+            method_response['responseParameters'] = {f"method.response.header.{header}": False
+                                                     for header in response['headers']}
+        models = {content_type: content['schema']['$ref'].split('/')[-1]
+                  for content_type, content in response.get('content', {}).items()
+                  if '$ref' in content.get('schema', {})}
+        if models:
+            method_response['responseModels'] = models
+        method_responses[status_code] = method_response
+    if method_responses:
+        method['methodResponses'] = method_responses
+    return method
+
+def iter_export_resources(document):
+    """Gera (caminho, métodos) a partir dos caminhos de um export OpenAPI 3 do stage."""
+    for resource_path, path_item in document.get('paths', {}).items():
+        methods = {}
+        for export_method, operation in path_item.items():
+            http_method = EXPORT_HTTP_METHODS.get(export_method.lower())
+            if http_method:
+                methods[http_method] = describe_method(_method_from_export(operation))
+        yield resource_path, methods
+
+def get_api_integrations_documentation_from_export(document):
+    """
+    Gera a documentação das integrações a partir de um export OpenAPI 3 do stage,
+    com a mesma estrutura de get_api_integrations_documentation, sem nenhuma chamada adicional à AWS.
+    Caminhos sem métodos (ex: '/' sem métodos configurados) não aparecem no export.
+
+    Args:
+        document (dict): O export do stage (get_export_document ou load_export_document).
+
+    Returns:
+        dict: Um dicionário contendo a estrutura da API e detalhes de integração.
+    """
+    return dict(iter_export_resources(document))
+
+def enrich_with_metrics(resources, cloudwatch_client, api_name, stages, days=DEFAULT_METRICS_DAYS, slow_p99_ms=DEFAULT_SLOW_P99_MS):
+    """
+    Anexa a cada método as métricas do CloudWatch por stage (latência e IntegrationLatency p50/p90/p99,
+    Count e 5XXError dos últimos `days` dias) em details['metrics'][stage].
+    Os recursos são agrupados até encher uma chamada GetMetricData (500 consultas) e repassados em seguida,
+    então a renderização continua em streaming. As métricas por método exigem métricas detalhadas no stage.
+    """
+    queries_per_target = len(route_metric_queries([], REST_API_ERROR_METRIC))
+    buffered, targets = [], {}
+
+    def flush():
+        metrics = fetch_route_metrics(cloudwatch_client, targets, REST_API_ERROR_METRIC, days, slow_p99_ms) if targets else {}
+        for path, methods in buffered:
+            for http_method, details in methods.items():
+                details['metrics'] = {stage: metrics[(path, http_method, stage)] for stage in stages}
+            yield path, methods
+        buffered.clear()
+        targets.clear()
+
+    for path, methods in resources:
+        new_targets = len(methods) * len(stages)
+        if targets and (len(targets) + new_targets) * queries_per_target > MAX_QUERIES_PER_REQUEST:
+            yield from flush()
+        buffered.append((path, methods))
+        for http_method in methods:
+            for stage in stages:
+                targets[(path, http_method, stage)] = rest_api_dimensions(api_name, stage, path, http_method)
+    yield from flush()
+
+def format_latency(metrics, prefix='latency'):
+    """Resumo de uma linha, ex: 'p50 12.0 ms / p90 40.5 ms / p99 310.2 ms'."""
+    return ' / '.join(f"{percentile} {metrics[f'{prefix}_{percentile}_ms']} ms" for percentile in LATENCY_PERCENTILES
+                      if metrics.get(f'{prefix}_{percentile}_ms') is not None) or 'sem dados'
+
+def render_markdown_section(path, methods):
+    """Renderiza em Markdown a documentação de um caminho e seus métodos."""
+    lines = [f"## Caminho: `{path}`\n\n"]
+    for method, details in methods.items():
+        slow_stages = {stage: metrics['latency_p99_ms'] for stage, metrics in details.get('metrics', {}).items() if metrics['slow']}
+        if slow_stages:
+            # Rotas lentas ficam visíveis já no título do método
+            slowest = max(slow_stages.values())
+            lines.append(f"### Método: `{method}` — ⚠️ **LENTO** (p99 de {slowest} ms em {', '.join(sorted(slow_stages))})\n")
+        else:
+            lines.append(f"### Método: `{method}`\n")
+        lines.append(f"- **Tipo de Integração:** {details.get('integration_type', 'N/A')}\n")
+        lines.append(f"- **URI de Integração:** `{details.get('integration_uri', 'N/A')}`\n")
+        lines.append(f"- **Método HTTP da Integração:** {details.get('integration_method', 'N/A')}\n")
+        if 'lambda_function_name' in details:
+            lines.append(f"- **Função Lambda (estimado):** `{details['lambda_function_name']}`\n")
+        lines.append(f"- **Templates de Requisição:**\n")
+        request_templates = details.get('request_templates')
+        if request_templates:
+            for content_type, template in request_templates.items():
+                lines.append(f"  - `{content_type}`:\n")
+                lines.append(f"    ```\n{template}\n    ```\n")
+        else:
+            lines.append("  Nenhum.\n")
+        for stage, metrics in details.get('metrics', {}).items():
+            error_rate = f"{metrics['error_rate']:.2%}" if metrics['error_rate'] is not None else 'N/A'
+            lines.append(f"- **Desempenho ({stage}, últimos {metrics['days']} dias):** {metrics['count']:.0f} requisições, "
+                         f"5xx: {metrics['errors_5xx']:.0f} ({error_rate})\n")
+            lines.append(f"  - Latência: {format_latency(metrics)}\n")
+            lines.append(f"  - Latência da integração: {format_latency(metrics, 'integration_latency')}\n")
+        lines.append("\n")
+    return ''.join(lines)
+
+def render_markdown(title, sections):
+    return f"# Documentação da API Gateway: {title}\n\n" + ''.join(sections)
+
+class DocumentationSink(abc.ABC):
+    """
+    Destino da renderização em streaming: recebe um recurso por vez em write(caminho, métodos).
+    A saída é gravada em um arquivo temporário e só substitui o arquivo final em close(), então
+    uma renderização interrompida (abort) não deixa um documento pela metade.
+    """
+    extension = ''
+
+    def __init__(self, output_path, title):
+        self.output_path = output_path
+        self.title = title
+        self._file = None
+        self._temp_path = None
+
+    def open(self):
+        directory = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=directory, prefix='.api-docs-')
+        self._file = os.fdopen(fd, 'w')
+        self.write_header()
+
+    def write_header(self):
+        pass
+
+    @abc.abstractmethod
+    def write(self, path, methods):
+        """Grava um recurso (caminho e seus métodos) no arquivo temporário."""
+
+    def write_footer(self):
+        pass
+
+    def close(self):
+        self.write_footer()
+        self._file.close()
+        os.replace(self._temp_path, self.output_path)
+
+    def abort(self):
+        # Tolera destinos que não chegaram a abrir (falha em open() de um destino anterior)
+        if self._file is not None:
+            self._file.close()
+        if self._temp_path is not None and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+class MarkdownSink(DocumentationSink):
+    extension = '.md'
+
+    def write_header(self):
+        self._file.write(render_markdown(self.title, []))
+
+    def write(self, path, methods):
+        self._file.write(render_markdown_section(path, methods))
+
+class JsonLinesSink(DocumentationSink):
+    """Um objeto JSON por linha: {"path": ..., "methods": {...}}."""
+    extension = '.jsonl'
+
+    def write(self, path, methods):
+        self._file.write(json.dumps({'path': path, 'methods': methods}) + '\n')
+
+class OpenApiSummarySink(DocumentationSink):
+    """
+    Resumo OpenAPI 3 (caminhos, métodos, parâmetros, respostas e integração de cada operação),
+    escrito incrementalmente: cada caminho é serializado e descartado assim que chega.
+    """
+    extension = '.openapi.json'
+    OPENAPI_METHODS = {http_method: export_method for export_method, http_method in EXPORT_HTTP_METHODS.items()}
+    OPENAPI_PARAMETER_LOCATIONS = {location: openapi_location for openapi_location, location in EXPORT_PARAMETER_LOCATIONS.items()}
+
+    def write_header(self):
+        self._file.write('{"openapi": "3.0.1", "info": ' + json.dumps({'title': self.title, 'version': '1.0'}) + ', "paths": {')
+        self._first_path = True
+
+    def _operation(self, details):
+        operation = {'summary': details.get('integration_type') or details.get('integration_details', 'N/A')}
+        parameters = []
+        for parameter, required in (details.get('method_request_parameters') or {}).items():
+            _, _, location, name = parameter.split('.', 3)
+            if location in self.OPENAPI_PARAMETER_LOCATIONS:
+                parameters.append({'name': name, 'in': self.OPENAPI_PARAMETER_LOCATIONS[location], 'required': bool(required)})
+        if parameters:
+            operation['parameters'] = parameters
+        operation['responses'] = {status_code: {'description': f'{status_code} response'}
+                                  for status_code in (details.get('method_responses') or {})}
+        if details.get('metrics'):
+            operation['x-route-metrics'] = details['metrics']
+        if details.get('integration_type'):
+            operation['x-amazon-apigateway-integration'] = {
+                'type': details['integration_type'].lower(),
+                'uri': details.get('integration_uri'),
+                'httpMethod': details.get('integration_method')
+            }
+        return operation
+
+    def write(self, path, methods):
+        operations = {self.OPENAPI_METHODS.get(method, method.lower()): self._operation(details)
+                      for method, details in methods.items()}
+        self._file.write(('' if self._first_path else ', ') + json.dumps(path) + ': ' + json.dumps(operations))
+        self._first_path = False
+
+    def write_footer(self):
+        self._file.write('}}\n')
+
+# Formatos de saída disponíveis; novos destinos basta registrar aqui
+DOCUMENTATION_SINKS = {'markdown': MarkdownSink, 'jsonl': JsonLinesSink, 'openapi': OpenApiSummarySink}
+
+def render_documentation(resources, sinks):
+    """
+    Renderização em passagem única: cada (caminho, métodos) do gerador é entregue a todos os destinos
+    e descartado em seguida, sem montar o dicionário completo da API. Retorna o número de caminhos.
+    """
+    count = 0
+    try:
+        for sink in sinks:
+            sink.open()
+        for path, methods in resources:
+            for sink in sinks:
+                sink.write(path, methods)
+            count += 1
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    for sink in sinks:
+        sink.close()
+    return count
+
+def load_fingerprint_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'apis': {}}
+    except ValueError as e:
+        print(f"Cache de fingerprints '{cache_file}' inválido, ignorando: {e}")
+        return {'apis': {}}
+
+def save_fingerprint_cache(cache_file, cache):
+    # Gravação atômica: uma execução interrompida não deixa o cache pela metade
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.api-docs-fingerprints-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(temp_path, cache_file)
+
+def list_rest_apis(client):
+    apis = []
+    for page in client.get_paginator('get_rest_apis').paginate(PaginationConfig={'PageSize': RESOURCES_PAGE_SIZE}):
+        apis.extend({'id': api['id'], 'name': api.get('name')} for api in page.get('items', []))
+    return apis
+
+def deployment_fingerprint(client, api_id):
+    """Deployment atual e datas de cada stage da API: muda a cada novo deployment ou alteração de stage."""
+    stages = client.get_stages(restApiId=api_id).get('item', [])
+    return {
+        stage['stageName']: {
+            'deployment_id': stage.get('deploymentId'),
+            'created_date': stage['createdDate'].isoformat() if stage.get('createdDate') else None,
+            'last_updated_date': stage['lastUpdatedDate'].isoformat() if stage.get('lastUpdatedDate') else None
+        }
+        for stage in stages
+    }
+
+def resource_fingerprint(resource):
+    """Hash do conteúdo de um recurso, incluindo os métodos e integrações embutidos."""
+    content = json.dumps(resource, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def write_markdown(output_path, title, sections):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as f:
+        f.write(render_markdown(title, sections))
+
+def regenerate_api_documentation(client, api, entry, output_dir, max_workers=DEFAULT_METHOD_WORKERS, force=False):
+    """
+    Regenera a documentação de uma API usando a entrada do cache de fingerprints.
+    Se os deployments dos stages não mudaram, nada é consultado além do get_stages e o Markdown
+    vem do cache. Caso contrário os recursos são relidos (páginas do get_resources), mas apenas os
+    recursos cujo hash mudou são documentados e renderizados novamente; os demais vêm do cache.
+    Observação: a documentação reflete os recursos atuais da API, que só são reavaliados após um novo deployment.
+
+    Returns:
+        tuple: (nova entrada do cache, resumo da execução da API)
+    """
+    api_id = api['id']
+    output_path = os.path.join(output_dir, api_id, DOC_FILE_NAME)
+    fingerprint = deployment_fingerprint(client, api_id)
+    entry = entry or {}
+
+    if not force and entry.get('deployments') == fingerprint and entry.get('name') == api['name']:
+        if not os.path.exists(output_path):
+            write_markdown(output_path, api['name'] or api_id, [entry['resources'][path]['section'] for path in sorted(entry['resources'])])
+        return entry, {'api_id': api_id, 'status': 'unchanged'}
+
+    cached_resources = {} if force else entry.get('resources', {})
+    resources = fetch_resources(client, api_id)
+    changed_resources = [resource for resource in resources
+                         if cached_resources.get(resource.get('path'), {}).get('hash') != resource_fingerprint(resource)]
+    documentation = document_resources(client, api_id, changed_resources, max_workers)
+
+    new_resources = {}
+    for resource in resources:
+        resource_path = resource.get('path')
+        if resource_path in documentation:
+            new_resources[resource_path] = {
+                'hash': resource_fingerprint(resource),
+                'documentation': documentation[resource_path],
+                'section': render_markdown_section(resource_path, documentation[resource_path])
+            }
+        else:
+            new_resources[resource_path] = cached_resources[resource_path]
+
+    write_markdown(output_path, api['name'] or api_id, [new_resources[path]['section'] for path in sorted(new_resources)])
+    new_entry = {'name': api['name'], 'deployments': fingerprint, 'resources': new_resources}
+    return new_entry, {
+        'api_id': api_id,
+        'status': 'updated',
+        'resources': len(resources),
+        'changed_resources': len(changed_resources),
+        'removed_resources': len(set(cached_resources) - set(new_resources))
+    }
+
+def regenerate_documentation(api_ids=None, output_dir='.', cache_file=None, region_name='us-east-1',
+                             max_workers=DEFAULT_METHOD_WORKERS, api_workers=DEFAULT_API_WORKERS, force=False):
+    """
+    Regeneração incremental da documentação de várias APIs (todas da região, ou as de api_ids),
+    gravando '<output_dir>/<api_id>/api_integrations_doc.md'. APIs sem novo deployment custam
+    apenas um get_stages; o cache de fingerprints é atualizado ao final.
+    """
+    cache_file = cache_file or os.path.join(output_dir, FINGERPRINT_CACHE_FILE)
+    cache = load_fingerprint_cache(cache_file)
+    client = create_client(region_name)
+
+    apis = list_rest_apis(client)
+    if api_ids:
+        missing = set(api_ids) - {api['id'] for api in apis}
+        for api_id in sorted(missing):
+            print(f"API Gateway with ID '{api_id}' not found in region '{region_name}'.")
+        apis = [api for api in apis if api['id'] in api_ids]
+    else:
+        # Execução completa: APIs removidas saem do cache
+        cache['apis'] = {api_id: entry for api_id, entry in cache['apis'].items() if api_id in {api['id'] for api in apis}}
+
+    def regenerate(api):
+        try:
+            return api, *regenerate_api_documentation(client, api, cache['apis'].get(api['id']), output_dir, max_workers, force)
+        except Exception as e:
+            print(f"An error occurred ({api['id']}): {e}")
+            return api, cache['apis'].get(api['id']), {'api_id': api['id'], 'status': 'failed', 'error': str(e)}
+
+    results = []
+    with ThreadPoolExecutor(max_workers=api_workers) as executor:
+        for api, entry, result in executor.map(regenerate, apis):
+            if entry:
+                cache['apis'][api['id']] = entry
+            results.append(result)
+            print(f"{api['id']} ({api['name']}): {result['status']}"
+                  + (f", {result['changed_resources']}/{result['resources']} recursos atualizados" if result['status'] == 'updated' else ''))
+
+    save_fingerprint_cache(cache_file, cache)
+    counts = {status: sum(1 for result in results if result['status'] == status) for status in ('unchanged', 'updated', 'failed')}
+    print(f"\n{len(results)} APIs: {counts['unchanged']} sem alterações, {counts['updated']} atualizadas, {counts['failed']} com erro.")
+    return results
 
 # --- Como usar o script ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Gera a documentação das integrações de um API Gateway (REST).')
     # Substitua pelo seu ID do API Gateway e a região
-    YOUR_API_GATEWAY_ID = 'YOUR_API_GATEWAY_ID_HERE' # Ex: 'abcdef123'
-    YOUR_AWS_REGION = 'us-east-1' # Ex: 'sa-east-1' para São Paulo
+    parser.add_argument('api_id', nargs='?', default='YOUR_API_GATEWAY_ID_HERE', help="ID do API Gateway (ex: 'abcdef123')")
+    parser.add_argument('--region', default='us-east-1', help="Região AWS (ex: 'sa-east-1' para São Paulo)")
+    parser.add_argument('--from-export', action='store_true',
+                        help='Documenta a partir do export OpenAPI 3 do stage (uma única chamada get_export) em vez de percorrer recursos e métodos')
+    parser.add_argument('--stage', help='Stage exportado com --from-export')
+    parser.add_argument('--export-file', help='Export salvo anteriormente (JSON); gera a documentação offline (implica --from-export)')
+    parser.add_argument('--save-export', help='Salva o export obtido com --from-export neste arquivo para uso offline')
+    parser.add_argument('--formats', nargs='+', choices=sorted(DOCUMENTATION_SINKS), default=['markdown'],
+                        help='Formatos gerados em uma única passagem (padrão: markdown)')
+    parser.add_argument('--output', default='api_integrations_doc',
+                        help="Caminho base dos arquivos gerados; a extensão vem do formato (padrão: 'api_integrations_doc')")
+    parser.add_argument('--metrics-days', type=int,
+                        help='Anexa a cada método as métricas do CloudWatch (latência p50/p90/p99, Count, 5xx) dos últimos N dias')
+    parser.add_argument('--metrics-stages', nargs='+',
+                        help='Stages das métricas (padrão: o --stage do export ou todos os stages da API)')
+    parser.add_argument('--slow-p99-ms', type=float, default=DEFAULT_SLOW_P99_MS,
+                        help=f'Latência p99 a partir da qual um método é destacado como lento (padrão: {DEFAULT_SLOW_P99_MS} ms)')
+    parser.add_argument('--all', action='store_true', help='Regenera incrementalmente a documentação de todas as APIs REST da região')
+    parser.add_argument('--apis', nargs='+', help='Regenera incrementalmente a documentação apenas destas APIs (IDs)')
+    parser.add_argument('--output-dir', default='.', help="Diretório de saída de --all/--apis ('<dir>/<api_id>/api_integrations_doc.md')")
+    parser.add_argument('--fingerprint-cache', help=f"Cache de fingerprints de --all/--apis (padrão: '<output-dir>/{FINGERPRINT_CACHE_FILE}')")
+    parser.add_argument('--force', action='store_true', help='Ignora o cache de fingerprints e regenera tudo')
+    parser.add_argument('--workers', type=int, default=DEFAULT_API_WORKERS, help='APIs processadas em paralelo em --all/--apis')
+    args = parser.parse_args()
 
-    if YOUR_API_GATEWAY_ID == 'YOUR_API_GATEWAY_ID_HERE':
+    YOUR_API_GATEWAY_ID = args.api_id
+    YOUR_AWS_REGION = args.region
+
+    if args.all or args.apis:
+        # A regeneração incremental grava apenas '<output-dir>/<api_id>/api_integrations_doc.md', sem métricas
+        ignored = [flag for flag, given in (('--formats', args.formats != parser.get_default('formats')),
+                                            ('--output', args.output != parser.get_default('output')),
+                                            ('--metrics-days', args.metrics_days is not None)) if given]
+        if ignored:
+            parser.error(f"{', '.join(ignored)} não é suportado com --all/--apis (use --output-dir)")
+        results = regenerate_documentation(None if args.all else args.apis, args.output_dir, args.fingerprint_cache,
+                                            YOUR_AWS_REGION, api_workers=args.workers, force=args.force)
+        raise SystemExit(1 if any(result['status'] == 'failed' for result in results) else 0)
+
+    resources = None
+    not_found_error = ()
+    title = YOUR_API_GATEWAY_ID
+    if args.export_file:
+        print(f"Gerando documentação a partir do export salvo em '{args.export_file}'...")
+        export_document = load_export_document(args.export_file)
+        resources = iter_export_resources(export_document)
+        title = export_document.get('info', {}).get('title', YOUR_API_GATEWAY_ID)
+    elif YOUR_API_GATEWAY_ID == 'YOUR_API_GATEWAY_ID_HERE':
         print("Por favor, substitua 'YOUR_API_GATEWAY_ID_HERE' pelo ID real do seu API Gateway.")
         print("Você pode encontrar o ID na console do API Gateway, na URL ou na coluna ID.")
+    elif args.from_export:
+        if not args.stage:
+            parser.error('--from-export requer --stage (ou use --export-file)')
+        print(f"Exportando o stage '{args.stage}' do API Gateway ID: {YOUR_API_GATEWAY_ID} na região: {YOUR_AWS_REGION}...")
+        try:
+            export_document = get_export_document(YOUR_API_GATEWAY_ID, args.stage, YOUR_AWS_REGION)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            export_document = None
+        if export_document is not None:
+            if args.save_export:
+                with open(args.save_export, 'w') as f:
+                    json.dump(export_document, f, indent=2)
+                print(f"Export salvo em '{args.save_export}'")
+            resources = iter_export_resources(export_document)
+            # O título do export é o nome da API (dimensão ApiName das métricas)
+            title = export_document.get('info', {}).get('title', YOUR_API_GATEWAY_ID)
     else:
         print(f"Gerando documentação para API Gateway ID: {YOUR_API_GATEWAY_ID} na região: {YOUR_AWS_REGION}...")
-        api_doc = get_api_integrations_documentation(YOUR_API_GATEWAY_ID, YOUR_AWS_REGION)
-
-        if api_doc:
-            # Exemplo de como imprimir a documentação em JSON formatado
-            print("\n--- Documentação da API ---")
-            print(json.dumps(api_doc, indent=2))
-
-            # Você pode então processar 'api_doc' para gerar outros formatos
-            # Por exemplo, para gerar um arquivo Markdown simples:
-            with open('api_integrations_doc.md', 'w') as f:
-                f.write(f"# Documentação da API Gateway: {YOUR_API_GATEWAY_ID}\n\n")
-                for path, methods in api_doc.items():
-                    f.write(f"## Caminho: `{path}`\n\n")
-                    for method, details in methods.items():
-                        f.write(f"### Método: `{method}`\n")
-                        f.write(f"- **Tipo de Integração:** {details.get('integration_type', 'N/A')}\n")
-                        f.write(f"- **URI de Integração:** `{details.get('integration_uri', 'N/A')}`\n")
-                        f.write(f"- **Método HTTP da Integração:** {details.get('integration_method', 'N/A')}\n")
-                        if 'lambda_function_name' in details:
-                            f.write(f"- **Função Lambda (estimado):** `{details['lambda_function_name']}`\n")
-                        f.write(f"- **Templates de Requisição:**\n")
-                        request_templates = details.get('request_templates')
-                        if request_templates:
-                            for content_type, template in request_templates.items():
-                                f.write(f"  - `{content_type}`:\n")
-                                f.write(f"    ```\n{template}\n    ```\n")
-                        else:
-                            f.write("  Nenhum.\n")
-                        f.write("\n")
-            print("\nDocumentação Markdown salva em 'api_integrations_doc.md'")
-        else:
-            print("Nenhuma documentação gerada.")
+        client = create_client(YOUR_AWS_REGION)
+        resources = iter_documented_resources(client, YOUR_API_GATEWAY_ID)
+        not_found_error = client.exceptions.NotFoundException
 
+    if resources is not None and args.metrics_days:
+        metrics_stages = args.metrics_stages or ([args.stage] if args.stage else None)
+        if metrics_stages is None and not args.export_file:
+            metrics_stages = [stage['stageName'] for stage in create_client(YOUR_AWS_REGION).get_stages(restApiId=YOUR_API_GATEWAY_ID).get('item', [])]
+        if not metrics_stages:
+            parser.error('--metrics-days requer --metrics-stages (ou --stage) para exports salvos')
+        # As métricas de APIs REST são identificadas pelo nome da API
+        api_name = title if args.export_file or args.from_export else create_client(YOUR_AWS_REGION).get_rest_api(restApiId=YOUR_API_GATEWAY_ID)['name']
+        cloudwatch_client = boto3.client('cloudwatch', region_name=YOUR_AWS_REGION,
+                                         config=Config(retries={'max_attempts': 10, 'mode': 'adaptive'}))
+        resources = enrich_with_metrics(resources, cloudwatch_client, api_name, metrics_stages, args.metrics_days, args.slow_p99_ms)
+
+    count = 0
+    if resources is not None:
+        # Markdown, JSON Lines e resumo OpenAPI escritos simultaneamente, um recurso por vez
+        sinks = [DOCUMENTATION_SINKS[name](args.output + DOCUMENTATION_SINKS[name].extension, title) for name in args.formats]
+        try:
+            count = render_documentation(resources, sinks)
+        except not_found_error:
+            print(f"API Gateway with ID '{YOUR_API_GATEWAY_ID}' not found in region '{YOUR_AWS_REGION}'.")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    if count:
+        print(f"\n{count} caminhos documentados.")
+        for sink in sinks:
+            print(f"Documentação salva em '{sink.output_path}'")
+    else:
+        print("Nenhuma documentação gerada.")
@@ -0,0 +1,337 @@
+import argparse
+import datetime
+import gzip
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    # orjson is optional: the standard json module parses the same lines, only slower
+    loads = json.loads
+
+# Byte ranges handed to each worker process; gzip files cannot be split and are one chunk each
+DEFAULT_CHUNK_BYTES = 64 * 1024 * 1024
+# Relative error of the latency quantiles (1% means p99 = 200 ms is reported within 198-202 ms)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_TOP_ROUTES = 20
+# Routes with fewer requests are left out of the slow-route report (their p99 is noise)
+DEFAULT_MIN_REQUESTS = 100
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch with log-spaced buckets (the DDSketch scheme): a value v lands in bucket
+    ceil(log(v) / log(gamma)), so every quantile is returned within the relative accuracy regardless of the
+    distribution. Merging two sketches adds their bucket counts, which makes per-chunk results exact to
+    combine across processes. Memory grows with the log of the value range, not with the number of values.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.max = 0.0
+        # Latencies are mostly integer milliseconds: the bucket of a value is computed once per worker
+        self._index_cache = {}
+
+    def add(self, value):
+        self.count += 1
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = self._index_cache.get(value)
+        if index is None:
+            index = self._index_cache[value] = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError('Cannot merge sketches with different relative accuracy.')
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(i-1), gamma^i], within the relative accuracy of every value in it
+                return min(2 * self.gamma ** index / (self.gamma + 1), self.max)
+        return self.max
+
+    def __getstate__(self):
+        # The index cache is per process and not worth pickling back to the parent
+        state = dict(self.__dict__)
+        state['_index_cache'] = {}
+        return state
+
+
+def route_key_of(record):
+    """
+    Route key as apigateway.py extracts it ('GET /items/{id}'): $context.routeKey for HTTP APIs,
+    otherwise '<httpMethod> <resourcePath>' for REST API access logs.
+    """
+    route_key = record.get('routeKey')
+    if route_key and route_key != '-':
+        return route_key
+    method = record.get('httpMethod')
+    resource_path = record.get('resourcePath')
+    if method and resource_path:
+        return f"{method} {resource_path}"
+    return '-'
+
+
+def _latency(record, field):
+    value = record.get(field)
+    if value is None or value == '-' or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def split_chunks(paths, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """(path, start, end) byte ranges of at most chunk_bytes; each range is fixed to line boundaries when read."""
+    chunks = []
+    for path in paths:
+        if path.endswith('.gz'):
+            chunks.append((path, 0, None))
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_bytes):
+            chunks.append((path, start, min(start + chunk_bytes, size)))
+    return chunks
+
+
+def _iter_chunk_lines(path, start, end):
+    if end is None:
+        with gzip.open(path, 'rb') as f:
+            yield from f
+        return
+    with open(path, 'rb') as f:
+        if start:
+            # A line crossing the start belongs to the previous chunk
+            f.seek(start - 1)
+            if f.read(1) != b'\n':
+                f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def analyze_chunk(chunk, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Parses one chunk (runs in a worker process). Returns the partial statistics:
+    {'routes': {(route_key, status): {'count', 'latency', 'integration_latency'}}, 'lines', 'invalid', 'first_epoch_ms', 'last_epoch_ms'}.
+    """
+    routes = {}
+    lines = invalid = 0
+    first_epoch = last_epoch = None
+    for line in _iter_chunk_lines(*chunk):
+        lines += 1
+        try:
+            record = loads(line)
+        except ValueError:
+            invalid += 1
+            continue
+        if not isinstance(record, dict):
+            invalid += 1
+            continue
+
+        key = (route_key_of(record), str(record.get('status', '-')))
+        stats = routes.get(key)
+        if stats is None:
+            stats = routes[key] = {'count': 0, 'latency': LatencySketch(relative_accuracy),
+                                   'integration_latency': LatencySketch(relative_accuracy)}
+        stats['count'] += 1
+        latency = _latency(record, 'responseLatency')
+        if latency is not None:
+            stats['latency'].add(latency)
+        integration_latency = _latency(record, 'integrationLatency')
+        if integration_latency is not None:
+            stats['integration_latency'].add(integration_latency)
+
+        epoch = record.get('requestTimeEpoch')
+        if isinstance(epoch, (int, float)) or (isinstance(epoch, str) and epoch.isdigit()):
+            epoch = int(epoch)
+            first_epoch = epoch if first_epoch is None else min(first_epoch, epoch)
+            last_epoch = epoch if last_epoch is None else max(last_epoch, epoch)
+    return {'routes': routes, 'lines': lines, 'invalid': invalid, 'first_epoch_ms': first_epoch, 'last_epoch_ms': last_epoch}
+
+
+def merge_stats(total, partial):
+    for key, stats in partial['routes'].items():
+        merged = total['routes'].get(key)
+        if merged is None:
+            total['routes'][key] = stats
+            continue
+        merged['count'] += stats['count']
+        merged['latency'].merge(stats['latency'])
+        merged['integration_latency'].merge(stats['integration_latency'])
+    total['lines'] += partial['lines']
+    total['invalid'] += partial['invalid']
+    for field, pick in (('first_epoch_ms', min), ('last_epoch_ms', max)):
+        if partial[field] is not None:
+            total[field] = partial[field] if total[field] is None else pick(total[field], partial[field])
+    return total
+
+
+def analyze_logs(paths, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Splits the logs into chunks, parses them on a process pool and merges the partial sketches as they arrive."""
+    chunks = split_chunks(paths, chunk_bytes)
+    total = {'routes': {}, 'lines': 0, 'invalid': 0, 'first_epoch_ms': None, 'last_epoch_ms': None}
+    print(f"Analyzing {len(chunks)} chunks from {len(paths)} files ({workers or os.cpu_count()} processes, parser: {loads.__module__}).")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for partial in executor.map(analyze_chunk, chunks, [relative_accuracy] * len(chunks)):
+            merge_stats(total, partial)
+    return total
+
+
+def _quantiles(sketch):
+    return {f'p{round(q * 100)}_ms': (round(value, 1) if value is not None else None)
+            for q, value in ((q, sketch.quantile(q)) for q in QUANTILES)}
+
+
+def build_report(total, top=DEFAULT_TOP_ROUTES, min_requests=DEFAULT_MIN_REQUESTS, tfvars=None):
+    """
+    Aggregates the (route, status) sketches per route and returns the hot-route (most requests) and
+    slow-route (highest p99 among routes with at least min_requests) reports. With the tfvars produced by
+    apigateway.py, each route is annotated with its Lambda function, and configured routes without traffic are listed.
+    """
+    route_lambdas = {}
+    for item in (tfvars or {}).get('api_gateway_config', []):
+        for route in item['routes']:
+            route_lambdas[route['route_key']] = item['function_name']
+
+    routes = {}
+    for (route_key, status), stats in total['routes'].items():
+        route = routes.get(route_key)
+        if route is None:
+            route = routes[route_key] = {'count': 0, 'errors_5xx': 0, 'statuses': {},
+                                         'latency': LatencySketch(stats['latency'].relative_accuracy),
+                                         'integration_latency': LatencySketch(stats['latency'].relative_accuracy)}
+        route['count'] += stats['count']
+        route['statuses'][status] = {'count': stats['count'], **_quantiles(stats['latency'])}
+        if status.startswith('5'):
+            route['errors_5xx'] += stats['count']
+        route['latency'].merge(stats['latency'])
+        route['integration_latency'].merge(stats['integration_latency'])
+
+    span_seconds = None
+    if total['first_epoch_ms'] is not None and total['last_epoch_ms'] > total['first_epoch_ms']:
+        span_seconds = (total['last_epoch_ms'] - total['first_epoch_ms']) / 1000
+
+    summaries = []
+    for route_key, route in routes.items():
+        summary = {
+            'route_key': route_key,
+            'count': route['count'],
+            'average_rps': round(route['count'] / span_seconds, 3) if span_seconds else None,
+            'error_rate_5xx': round(route['errors_5xx'] / route['count'], 4),
+            'latency': _quantiles(route['latency']),
+            'integration_latency': _quantiles(route['integration_latency']),
+            'statuses': route['statuses']
+        }
+        if route_key in route_lambdas:
+            summary['function_name'] = route_lambdas[route_key]
+        summaries.append(summary)
+
+    hot_routes = sorted(summaries, key=lambda summary: (-summary['count'], summary['route_key']))[:top]
+    slow_candidates = [summary for summary in summaries
+                       if summary['count'] >= min_requests and summary['latency']['p99_ms'] is not None]
+    slow_routes = sorted(slow_candidates, key=lambda summary: (-summary['latency']['p99_ms'], summary['route_key']))[:top]
+
+    report = {
+        'generated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'lines': total['lines'],
+        'invalid_lines': total['invalid'],
+        'routes': len(routes),
+        'span_seconds': span_seconds,
+        'relative_accuracy': next(iter(routes.values()))['latency'].relative_accuracy if routes else None,
+        'hot_routes': hot_routes,
+        'slow_routes': slow_routes
+    }
+    if tfvars is not None:
+        report['routes_without_traffic'] = sorted(set(route_lambdas) - set(routes))
+    return report
+
+
+def print_table(title, routes):
+    print(f"\n{title}")
+    print(f"{'route':50} {'requests':>10} {'rps':>8} {'5xx':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route in routes:
+        latency = route['latency']
+        rps = f"{route['average_rps']:.1f}" if route['average_rps'] is not None else '-'
+        print(f"{route['route_key'][:50]:50} {route['count']:>10} {rps:>8} {route['error_rate_5xx']:>7.2%} "
+              + ' '.join(f"{latency[field]:>9.1f}" if latency[field] is not None else f"{'-':>9}"
+                         for field in ('p50_ms', 'p95_ms', 'p99_ms')))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hot-route and slow-route reports from API Gateway access logs (JSON lines, optionally .gz).")
+    parser.add_argument('paths', nargs='+', help='Access log files or directories.')
+    parser.add_argument('--workers', type=int, help='Parser processes (default: one per CPU).')
+    parser.add_argument('--chunk-mb', type=int, default=DEFAULT_CHUNK_BYTES // (1024 * 1024), help='Chunk size handed to each process.')
+    parser.add_argument('--relative-accuracy', type=float, default=DEFAULT_RELATIVE_ACCURACY, help='Relative error of the latency quantiles.')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_ROUTES, help='Routes listed in each report.')
+    parser.add_argument('--min-requests', type=int, default=DEFAULT_MIN_REQUESTS, help='Minimum requests for the slow-route report.')
+    parser.add_argument('--tfvars', help='terraform.tfvars.json from apigateway.py, to annotate routes with their Lambda function.')
+    parser.add_argument('--report-file', default='access-log-report.json', help='Output JSON report.')
+    args = parser.parse_args()
+
+    log_files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            log_files.extend(os.path.join(root, name) for root, _, names in os.walk(path) for name in sorted(names))
+        else:
+            log_files.append(path)
+    if not log_files:
+        print("Error: no log files found.")
+        sys.exit(1)
+
+    tfvars = None
+    if args.tfvars:
+        with open(args.tfvars) as f:
+            tfvars = json.load(f)
+
+    started = time.monotonic()
+    total = analyze_logs(log_files, args.workers, args.chunk_mb * 1024 * 1024, args.relative_accuracy)
+    elapsed = time.monotonic() - started
+    size_mb = sum(os.path.getsize(path) for path in log_files) / (1024 * 1024)
+    print(f"Parsed {total['lines']} lines ({size_mb:.0f} MB on disk) in {elapsed:.1f}s ({size_mb / elapsed if elapsed else 0:.0f} MB/s); "
+          f"{total['invalid']} invalid lines.")
+
+    report = build_report(total, args.top, args.min_requests, tfvars)
+    print_table('Hot routes (most requests):', report['hot_routes'])
+    print_table(f"Slow routes (highest p99, at least {args.min_requests} requests):", report['slow_routes'])
+    if report.get('routes_without_traffic'):
+        print(f"\nConfigured routes without traffic: {report['routes_without_traffic']}")
+    with open(args.report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to '{args.report_file}'.")
@@ -1,6 +1,48 @@
+import argparse
 import boto3
+import datetime
 import json
+import math
+import os
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.config import Config
+
+from apigateway_metrics import (DEFAULT_METRICS_DAYS, DEFAULT_SLOW_P99_MS, HTTP_API_ERROR_METRIC, fetch_lambda_durations,
+                                fetch_route_metrics, http_api_dimensions)
+
+# Bounded pool for the Lambda control-plane calls (the API is throttled per account)
+DEFAULT_LAMBDA_WORKERS = 8
+# APIs exported at the same time in export-all mode (the API Gateway management API is also throttled)
+DEFAULT_API_WORKERS = 4
+# Adaptive retries back off when concurrent calls hit the per-account API rate limits
+CLIENT_CONFIG = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
+# Account-level throttling applied by API Gateway when neither the route nor the stage sets a limit
+ACCOUNT_THROTTLING_RATE_LIMIT = 10000
+ACCOUNT_THROTTLING_BURST_LIMIT = 5000
+# A Lambda behind at least this many routes is reported as a shared bottleneck when oversubscribed
+DEFAULT_SHARED_ROUTE_THRESHOLD = 5
+# CloudWatch Duration statistic used as the invocation duration by the throughput analysis
+DEFAULT_DURATION_STAT = 'p99'
+# Cold-start risk: score >= HIGH is 'high', >= MEDIUM is 'medium'
+COLD_START_HIGH_SCORE = 50
+COLD_START_MEDIUM_SCORE = 25
+# Runtimes with slow initialization (JVM / CLR) unless SnapStart is enabled
+SLOW_INIT_RUNTIME_PREFIXES = ('java', 'dotnet')
+# Provisioned concurrency is suggested for functions at or above this average traffic
+DEFAULT_PC_MIN_RPS = 1.0
+# Provisioned concurrency = average RPS x duration x headroom (covers peaks above the average)
+DEFAULT_PC_HEADROOM = 2.0
+
+# Lambda configurations fetched during this run, keyed by function name and shared across APIs
+_lambda_configurations = {}
+_lambda_configurations_lock = threading.Lock()
+# Lambda control-plane calls in flight across all concurrent exports (each export has its own thread pool)
+_lambda_api_slots = threading.BoundedSemaphore(DEFAULT_LAMBDA_WORKERS)
 
 def get_all_items(client, method, key, **kwargs):
     """Helper to handle pagination for Boto3 list/get methods."""
@@ -18,23 +60,211 @@ def get_lambda_name_from_arn(lambda_arn):
         return parts[6]
     return None
 
-def extract_apigw_config(api_gateway_name):
+def fetch_lambda_configurations(lambda_client, function_names, max_workers=DEFAULT_LAMBDA_WORKERS):
+    """
+    Fetches the configuration of each distinct Lambda function concurrently.
+    Uses get_function_configuration: get_function also returns a presigned code URL and package
+    metadata that are not needed here. Results are cached for the rest of the run, and a function
+    already being fetched by a concurrent export is waited on instead of fetched again. At most
+    DEFAULT_LAMBDA_WORKERS calls are in flight across all exports, whatever max_workers each one uses.
+    A function that could not be fetched maps to the exception raised. Only configurations and
+    ResourceNotFoundException are kept for the rest of the run; other errors (throttling, access denied)
+    are retried by the next export that needs the function.
+    """
+    owned = []
+    with _lambda_configurations_lock:
+        for function_name in sorted(set(function_names)):
+            if function_name not in _lambda_configurations:
+                _lambda_configurations[function_name] = {'ready': threading.Event(), 'result': None}
+                owned.append(function_name)
+        entries = {function_name: _lambda_configurations[function_name] for function_name in function_names}
+
+    def fetch(function_name):
+        entry = entries[function_name]
+        try:
+            with _lambda_api_slots:
+                entry['result'] = lambda_client.get_function_configuration(FunctionName=function_name)
+        except Exception as e:
+            entry['result'] = e
+            if not isinstance(e, lambda_client.exceptions.ResourceNotFoundException):
+                with _lambda_configurations_lock:
+                    if _lambda_configurations.get(function_name) is entry:
+                        del _lambda_configurations[function_name]
+        finally:
+            entry['ready'].set()
+
+    if owned:
+        print(f"Fetching configuration of {len(owned)} Lambda functions ({max_workers} workers).")
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(owned))) as executor:
+            list(executor.map(fetch, owned))
+
+    configurations = {}
+    for function_name, entry in entries.items():
+        entry['ready'].wait()
+        configurations[function_name] = entry['result']
+    return configurations
+
+def build_api_index(apigw_client):
+    """Lists every API in the account once and returns a name -> [ApiId] index."""
+    api_index = {}
+    for api in get_all_items(apigw_client, 'get_apis', 'Items'):
+        api_index.setdefault(api.get('Name'), []).append(api['ApiId'])
+    return api_index
+
+def attach_route_metrics(api_gateway_config, api_id, apigw_client, cloudwatch_client, days, slow_p99_ms=DEFAULT_SLOW_P99_MS):
+    """
+    Adds a 'metrics' entry ({stage: latency/integration latency p50/p90/p99, count, 5xx}) to every route
+    of the tfvars structure, fetched for all routes and stages in batched GetMetricData calls.
+    Returns the (route_key, stage) pairs whose p99 latency is above slow_p99_ms.
+    """
+    stages = [stage['StageName'] for stage in get_all_items(apigw_client, 'get_stages', 'Items', ApiId=api_id)]
+    route_keys = {route['route_key'] for item in api_gateway_config for route in item['routes']}
+    targets = {(route_key, stage): http_api_dimensions(api_id, stage, route_key) for route_key in route_keys for stage in stages}
+    metrics = fetch_route_metrics(cloudwatch_client, targets, HTTP_API_ERROR_METRIC, days, slow_p99_ms)
+    for item in api_gateway_config:
+        for route in item['routes']:
+            route['metrics'] = {stage: metrics[(route['route_key'], stage)] for stage in stages}
+    return sorted(key for key, route_metrics in metrics.items() if route_metrics['slow'])
+
+def cold_start_profile(config):
+    """Attributes of a function configuration that drive its cold-start time."""
+    layers = config.get('Layers', [])
+    code_size = config.get('CodeSize', 0) + sum(layer.get('CodeSize', 0) for layer in layers)
+    return {
+        'runtime': config.get('Runtime'),
+        'package_type': config.get('PackageType', 'Zip'),
+        'code_size_mb': round(code_size / (1024 * 1024), 2),
+        'layers': len(layers),
+        'memory_size': config.get('MemorySize', 128),
+        'architectures': config.get('Architectures', ['x86_64']),
+        'vpc_attached': bool(config.get('VpcConfig', {}).get('SubnetIds')),
+        'snap_start': config.get('SnapStart', {}).get('ApplyOn', 'None') != 'None'
+    }
+
+def score_cold_start(profile):
+    """
+    0-100 cold-start risk score from the package size (code plus layers, or a container image), the runtime,
+    the VPC attachment (ENI setup on scale-out) and the memory size (CPU is allocated in proportion to memory).
+    Returns (score, level, reasons).
+    """
+    score, reasons = 0, []
+    if profile['package_type'] == 'Image':
+        score += 25
+        reasons.append('container image package')
+    elif profile['code_size_mb'] > 50:
+        score += 30
+        reasons.append(f"{profile['code_size_mb']} MB of code and layers")
+    elif profile['code_size_mb'] > 20:
+        score += 20
+        reasons.append(f"{profile['code_size_mb']} MB of code and layers")
+    elif profile['code_size_mb'] > 5:
+        score += 10
+        reasons.append(f"{profile['code_size_mb']} MB of code and layers")
+
+    if (profile['runtime'] or '').startswith(SLOW_INIT_RUNTIME_PREFIXES):
+        if profile['snap_start']:
+            score += 10
+            reasons.append(f"{profile['runtime']} runtime (SnapStart enabled)")
+        else:
+            score += 30
+            reasons.append(f"{profile['runtime']} runtime without SnapStart")
+    else:
+        score += 5
+
+    if profile['vpc_attached']:
+        score += 10
+        reasons.append('attached to a VPC')
+
+    if profile['memory_size'] < 512:
+        score += 15
+        reasons.append(f"{profile['memory_size']} MB of memory (little CPU for initialization)")
+    elif profile['memory_size'] < 1024:
+        score += 8
+
+    level = 'high' if score >= COLD_START_HIGH_SCORE else 'medium' if score >= COLD_START_MEDIUM_SCORE else 'low'
+    return min(score, 100), level, reasons
+
+def attach_cold_start_suggestions(api_gateway_config, lambda_configurations, min_rps=DEFAULT_PC_MIN_RPS,
+                                  headroom=DEFAULT_PC_HEADROOM):
+    """
+    Adds a 'cold_start' profile and 'suggested_settings' to every function of the tfvars structure and a
+    'cold_start' entry (risk and traffic) to each of its routes. Traffic comes from the route 'metrics'
+    (see attach_route_metrics); without them provisioned concurrency is not suggested.
+    Provisioned concurrency is suggested for medium/high risk functions serving at least min_rps on average,
+    sized as average RPS x integration latency p50 x headroom.
+    """
+    for item in api_gateway_config:
+        config = lambda_configurations.get(item['function_name'], {})
+        profile = cold_start_profile(config)
+        score, level, reasons = score_cold_start(profile)
+        item['cold_start'] = dict(profile, score=score, level=level, reasons=reasons)
+
+        function_rps, duration_ms = None, None
+        for route in item['routes']:
+            metrics = route.get('metrics')
+            route_rps = None
+            if metrics:
+                route_rps = sum(stage['count'] / (stage['days'] * 86400) for stage in metrics.values())
+                function_rps = (function_rps or 0) + route_rps
+                durations = [stage['integration_latency_p50_ms'] for stage in metrics.values() if stage['integration_latency_p50_ms']]
+                if durations:
+                    duration_ms = max(duration_ms or 0, *durations)
+            route['cold_start'] = {
+                'score': score,
+                'level': level,
+                'requests_per_day': round(route_rps * 86400, 1) if route_rps is not None else None
+            }
+
+        suggested = {}
+        if level != 'low' and function_rps is not None and function_rps >= min_rps:
+            # Without a measured duration, assume invocations take one second
+            suggested['provisioned_concurrency'] = max(1, math.ceil(function_rps * (duration_ms or 1000) / 1000 * headroom))
+        if profile['memory_size'] < 512 and level != 'low':
+            suggested['memory_size'] = 512
+        if (profile['runtime'] or '').startswith('java') and not profile['snap_start']:
+            suggested['snap_start'] = 'PublishedVersions'
+        item['suggested_settings'] = suggested
+
+def cold_start_report(config_data):
+    """Routes ranked by cold-start risk, then traffic (the routes whose users hit cold starts most often first)."""
+    rows = []
+    for item in config_data['api_gateway_config']:
+        for route in item['routes']:
+            if 'cold_start' not in route:
+                continue
+            rows.append({
+                'route_key': route['route_key'],
+                'function_name': item['function_name'],
+                'score': route['cold_start']['score'],
+                'level': route['cold_start']['level'],
+                'requests_per_day': route['cold_start']['requests_per_day'],
+                'reasons': item['cold_start']['reasons'],
+                'suggested_settings': item['suggested_settings']
+            })
+    rows.sort(key=lambda row: (-row['score'], -(row['requests_per_day'] or 0), row['route_key']))
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+    return rows
+
+def extract_apigw_config(api_gateway_name, api_id=None, apigw_client=None, lambda_client=None,
+                         metrics_days=None, cloudwatch_client=None, slow_p99_ms=DEFAULT_SLOW_P99_MS, cold_start=False,
+                         lambda_errors=None):
     """
     Extracts API Gateway v2 configuration (routes and Lambda integrations)
     and formats it for Terraform tfvars.
+    When api_id is given the API listing is skipped; clients can be shared between concurrent exports.
+    With metrics_days, each route also gets its CloudWatch latency, count and 5xx numbers per stage.
+    With cold_start, each function gets its cold-start risk and suggested settings (see attach_cold_start_suggestions).
+    Functions whose configuration could not be fetched (other than not found) are appended to lambda_errors.
     """
-    apigw_client = boto3.client('apigatewayv2')
-    lambda_client = boto3.client('lambda')
+    apigw_client = apigw_client or boto3.client('apigatewayv2', config=CLIENT_CONFIG)
+    lambda_client = lambda_client or boto3.client('lambda', config=CLIENT_CONFIG)
 
     try:
         # 1. Find the API Gateway ID by name
         # List APIs and find the one with the matching name
-        apis = get_all_items(apigw_client, 'get_apis', 'Items')
-        api_id = None
-        for api in apis:
-            if api.get('Name') == api_gateway_name:
-                api_id = api['ApiId']
-                break
+        if api_id is None:
+            api_id = next(iter(build_api_index(apigw_client).get(api_gateway_name, [])), None)
 
         if not api_id:
             print(f"Error: API Gateway with name '{api_gateway_name}' not found.")
@@ -62,7 +292,18 @@ def extract_apigw_config(api_gateway_name):
                     integration_id_to_routes[integration_id] = []
                 integration_id_to_routes[integration_id].append(route)
 
-        # 6. Build the api_gateway_config structure
+        # 6. Fetch the details of every distinct Lambda function behind the routes at once
+        lambda_names = set()
+        for integration_id in integration_id_to_routes:
+            integration_details = integration_id_to_details.get(integration_id, {})
+            if (integration_details.get('IntegrationType') == 'AWS_PROXY' and
+                'lambda' in integration_details.get('IntegrationUri', '')):
+                lambda_name = get_lambda_name_from_arn(integration_details['IntegrationUri'])
+                if lambda_name:
+                    lambda_names.add(lambda_name)
+        lambda_configurations = fetch_lambda_configurations(lambda_client, lambda_names)
+
+        # 7. Build the api_gateway_config structure
         api_gateway_config_map = {} # Use a map to group by Lambda ARN initially
 
         for integration_id, route_list in integration_id_to_routes.items():
@@ -86,30 +327,30 @@ def extract_apigw_config(api_gateway_name):
 
                 # If this Lambda ARN is not yet in our config map, get Lambda details
                 if lambda_arn not in api_gateway_config_map:
-                    try:
-                        lambda_details = lambda_client.get_function(FunctionName=lambda_name)
-                        config = lambda_details.get('Configuration', {})
-                        # Note: Getting CloudWatch Log retention directly is not trivial via get_function
-                        # Assuming a default or requiring manual check. Using a placeholder.
-                        log_retention_days = 7 # Placeholder
-
-                        api_gateway_config_map[lambda_arn] = {
-                            "function_name": config.get('FunctionName', lambda_name),
-                            "handler": config.get('Handler', 'index.handler'), # Default handler if not found
-                            "runtime": config.get('Runtime', 'python3.9'),    # Default runtime if not found
-                            "description": config.get('Description', f"Lambda function {lambda_name}"),
-                            "cloudwatch_logs_retention_in_days": log_retention_days,
-                            "routes": [] # Initialize the list of routes for this lambda
-                        }
-                        print(f"Processing Lambda: {lambda_name}")
-
-                    except lambda_client.exceptions.ResourceNotFoundException:
+                    config = lambda_configurations[lambda_name]
+                    if isinstance(config, lambda_client.exceptions.ResourceNotFoundException):
                         print(f"Warning: Lambda function '{lambda_name}' not found. Skipping routes associated with it.")
                         continue
-                    except Exception as e:
-                        print(f"Error fetching details for Lambda '{lambda_name}': {e}")
+                    if isinstance(config, Exception):
+                        print(f"Error fetching details for Lambda '{lambda_name}': {config}")
+                        if lambda_errors is not None:
+                            lambda_errors.append(lambda_name)
                         continue
 
+                    # Note: Getting CloudWatch Log retention directly is not trivial via get_function_configuration
+                    # Assuming a default or requiring manual check. Using a placeholder.
+                    log_retention_days = 7 # Placeholder
+
+                    api_gateway_config_map[lambda_arn] = {
+                        "function_name": config.get('FunctionName', lambda_name),
+                        "handler": config.get('Handler', 'index.handler'), # Default handler if not found
+                        "runtime": config.get('Runtime', 'python3.9'),    # Default runtime if not found
+                        "description": config.get('Description', f"Lambda function {lambda_name}"),
+                        "cloudwatch_logs_retention_in_days": log_retention_days,
+                        "routes": [] # Initialize the list of routes for this lambda
+                    }
+                    print(f"Processing Lambda: {lambda_name}")
+
                 # Add routes associated with this Lambda
                 for route in route_list:
                     route_key = route.get('RouteKey')
@@ -151,6 +392,19 @@ def extract_apigw_config(api_gateway_name):
             #     print(f"Skipping HTTP_PROXY integration for ID {integration_id}. Not supported by current tfvars structure.")
             # ... handle other types ...
 
+        # 8. Attach per-route performance numbers
+        if metrics_days:
+            cloudwatch_client = cloudwatch_client or boto3.client('cloudwatch', config=CLIENT_CONFIG)
+            slow_routes = attach_route_metrics(list(api_gateway_config_map.values()), api_id, apigw_client,
+                                               cloudwatch_client, metrics_days, slow_p99_ms)
+            for route_key, stage in slow_routes:
+                print(f"Warning: slow route '{route_key}' on stage '{stage}' (p99 latency above {slow_p99_ms} ms).")
+
+        # 9. Score cold-start risk and suggest settings for each function
+        if cold_start:
+            attach_cold_start_suggestions(list(api_gateway_config_map.values()),
+                                          {name: config for name, config in lambda_configurations.items() if not isinstance(config, Exception)})
+
     except Exception as e:
         print(f"An error occurred: {e}")
         return None
@@ -167,19 +421,408 @@ def extract_apigw_config(api_gateway_name):
 
     return tfvars_data
 
+def safe_file_name(name):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('_') or 'api'
+
+def export_apis(api_names, output_dir, max_workers=DEFAULT_API_WORKERS, metrics_days=None, slow_p99_ms=DEFAULT_SLOW_P99_MS,
+                cold_start=False):
+    """
+    Exports several APIs concurrently: the account's APIs are listed once, each API is written to
+    <output_dir>/<name>/terraform.tfvars.json as soon as its export finishes, and the Lambda
+    configuration cache is shared by all exports. A manifest.json summarizes the run.
+    With cold_start, a cold-start-report.json ranking the routes is written next to each tfvars file.
+    Returns the manifest.
+    """
+    apigw_client = boto3.client('apigatewayv2', config=CLIENT_CONFIG)
+    lambda_client = boto3.client('lambda', config=CLIENT_CONFIG)
+    cloudwatch_client = boto3.client('cloudwatch', config=CLIENT_CONFIG) if metrics_days else None
+    api_index = build_api_index(apigw_client)
+    print(f"Found {sum(len(ids) for ids in api_index.values())} APIs in the account.")
+
+    targets = []
+    for name in (api_names or sorted(api_index, key=str)):
+        api_ids = api_index.get(name)
+        if not api_ids:
+            print(f"Error: API Gateway with name '{name}' not found.")
+            targets.append({'name': name, 'api_id': None})
+            continue
+        if len(api_ids) > 1:
+            print(f"Warning: {len(api_ids)} APIs named '{name}'. Exporting each one to its own directory.")
+        targets.extend({'name': name, 'api_id': api_id, 'directory': safe_file_name(name)} for api_id in api_ids)
+
+    # Different names may sanitize to the same directory (also on case-insensitive file systems)
+    directory_counts = {}
+    for target in targets:
+        if target['api_id']:
+            directory_counts[target['directory'].lower()] = directory_counts.get(target['directory'].lower(), 0) + 1
+    for target in targets:
+        if target['api_id'] and directory_counts[target['directory'].lower()] > 1:
+            target['directory'] = f"{target['directory']}-{target['api_id']}"
+
+    def export(target):
+        started = time.monotonic()
+        lambda_errors = []
+        config_data = extract_apigw_config(target['name'], target['api_id'], apigw_client, lambda_client,
+                                           metrics_days, cloudwatch_client, slow_p99_ms, cold_start, lambda_errors)
+        entry = {'name': target['name'], 'api_id': target['api_id'], 'status': 'failed',
+                 'duration_seconds': round(time.monotonic() - started, 3)}
+        if lambda_errors:
+            # A tfvars file without these functions would make Terraform destroy their routes
+            entry['error'] = f"Could not fetch Lambda functions: {sorted(lambda_errors)}"
+        elif config_data:
+            tfvars_file = os.path.join(output_dir, target['directory'], 'terraform.tfvars.json')
+            os.makedirs(os.path.dirname(tfvars_file), exist_ok=True)
+            with open(tfvars_file, 'w') as f:
+                json.dump(config_data, f, indent=2)
+            if cold_start:
+                with open(os.path.join(os.path.dirname(tfvars_file), 'cold-start-report.json'), 'w') as f:
+                    json.dump(cold_start_report(config_data), f, indent=2)
+            entry.update({
+                'status': 'exported',
+                'file': tfvars_file,
+                'lambdas': len(config_data['api_gateway_config']),
+                'routes': sum(len(item['routes']) for item in config_data['api_gateway_config'])
+            })
+        return entry
+
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.monotonic()
+    results = [{'name': target['name'], 'api_id': None, 'status': 'not_found'} for target in targets if not target['api_id']]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(export, target) for target in targets if target['api_id']]
+        for future in as_completed(futures):
+            entry = future.result()
+            results.append(entry)
+            print(f"[{len(results)}/{len(targets)}] {entry['name']}: {entry['status']}")
+
+    manifest = {
+        'generated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'duration_seconds': round(time.monotonic() - started, 3),
+        'lambda_functions_fetched': len(_lambda_configurations),
+        'apis': sorted(results, key=lambda entry: (str(entry['name']), entry['api_id'] or ''))
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def route_throttle_limits(route, stage):
+    """
+    Effective throttling of a route on a stage: the stage's per-route settings, then the route's own
+    RouteSettings, then the stage defaults and finally the account-level limits.
+    Returns (rate_limit, burst_limit, source).
+    """
+    for source, settings in (('route', stage.get('RouteSettings', {}).get(route.get('RouteKey'))),
+                             ('route', route.get('RouteSettings')),
+                             ('stage_default', stage.get('DefaultRouteSettings'))):
+        if settings and settings.get('ThrottlingRateLimit') is not None:
+            return settings['ThrottlingRateLimit'], settings.get('ThrottlingBurstLimit'), source
+    return ACCOUNT_THROTTLING_RATE_LIMIT, ACCOUNT_THROTTLING_BURST_LIMIT, 'account'
+
+def collect_route_demands(apigw_client, api_id, api_name, stage_names=None):
+    """One entry per (stage, route) backed by a Lambda proxy integration, with its throttling limits."""
+    routes = get_all_items(apigw_client, 'get_routes', 'Items', ApiId=api_id)
+    integrations = {intg['IntegrationId']: intg for intg in get_all_items(apigw_client, 'get_integrations', 'Items', ApiId=api_id)}
+    stages = [stage for stage in get_all_items(apigw_client, 'get_stages', 'Items', ApiId=api_id)
+              if not stage_names or stage['StageName'] in stage_names]
+
+    demands = []
+    for route in routes:
+        integration = integrations.get(route.get('IntegrationId'), {})
+        if integration.get('IntegrationType') != 'AWS_PROXY' or 'lambda' not in integration.get('IntegrationUri', ''):
+            continue
+        lambda_name = get_lambda_name_from_arn(integration['IntegrationUri'])
+        if not lambda_name:
+            continue
+        arn_parts = integration['IntegrationUri'].split(':')
+        for stage in stages:
+            rate_limit, burst_limit, source = route_throttle_limits(route, stage)
+            demands.append({
+                'api_id': api_id,
+                'api_name': api_name,
+                'stage': stage['StageName'],
+                'route_key': route.get('RouteKey'),
+                'lambda_name': lambda_name,
+                'qualifier': arn_parts[7] if len(arn_parts) > 7 else None,
+                'rate_limit': rate_limit,
+                'burst_limit': burst_limit,
+                'limit_source': source,
+                'integration_timeout_ms': integration.get('TimeoutMilliseconds')
+            })
+    return demands
+
+def fetch_lambda_concurrency(lambda_client, function_names, max_workers=DEFAULT_LAMBDA_WORKERS):
+    """
+    Reserved and provisioned concurrency of each distinct function, fetched concurrently.
+    Returns name -> {'reserved': int or None, 'provisioned': {qualifier: allocated}} (or the exception raised).
+    """
+    def fetch(function_name):
+        try:
+            with _lambda_api_slots:
+                reserved = lambda_client.get_function_concurrency(FunctionName=function_name).get('ReservedConcurrentExecutions')
+                provisioned = {
+                    item['FunctionArn'].split(':')[-1]: item.get('AllocatedProvisionedConcurrentExecutions', 0)
+                    for item in get_all_items(lambda_client, 'list_provisioned_concurrency_configs',
+                                              'ProvisionedConcurrencyConfigs', FunctionName=function_name)
+                }
+            return function_name, {'reserved': reserved, 'provisioned': provisioned}
+        except Exception as e:
+            return function_name, e
+
+    function_names = sorted(set(function_names))
+    if not function_names:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(function_names))) as executor:
+        return dict(executor.map(fetch, function_names))
+
+def analyze_throughput(route_demands, lambda_configurations, lambda_concurrency, unreserved_concurrency,
+                       durations_ms=None, assumed_duration_ms=None, shared_route_threshold=DEFAULT_SHARED_ROUTE_THRESHOLD):
+    """
+    Relates route throttling to what each Lambda can serve. By Little's law a function with a concurrency
+    ceiling C and invocations lasting D seconds serves at most C / D requests per second. The ceiling is the
+    reserved concurrency, or the account's unreserved pool (shared with every other function) when none is set.
+    D is the measured duration when durations_ms has one for the function, then assumed_duration_ms, and
+    otherwise the function timeout (worst case: every invocation runs to the timeout). Capacity findings
+    based on the timeout are only warnings, since real invocations are usually much shorter.
+
+    Only routes with their own (route or stage) throttling are compared with capacity: a route limited only
+    by the account-level throttle shares that limit with every API in the region, so it is reported apart.
+
+    Flags:
+      - routes whose own rate limit exceeds that capacity (their configured RPS can never be served);
+      - routes whose burst limit exceeds the concurrency ceiling;
+      - routes invoking an alias whose rate limit exceeds what its provisioned concurrency serves warm,
+        and unqualified routes of functions that only have provisioned concurrency on aliases;
+      - integrations that time out before the function does (the function keeps holding concurrency);
+      - Lambdas whose summed route rate limits exceed capacity, as shared bottlenecks when behind
+        shared_route_threshold or more routes;
+      - Lambdas behind routes without their own throttling.
+    """
+    durations_ms = durations_ms or {}
+    routes_by_lambda = {}
+    for demand in route_demands:
+        routes_by_lambda.setdefault(demand['lambda_name'], []).append(demand)
+
+    lambdas, routes, findings = [], [], []
+    for lambda_name, demands in sorted(routes_by_lambda.items()):
+        config = lambda_configurations.get(lambda_name)
+        concurrency = lambda_concurrency.get(lambda_name)
+        if isinstance(config, Exception) or isinstance(concurrency, Exception) or config is None or concurrency is None:
+            error = config if isinstance(config, Exception) else concurrency
+            findings.append({'severity': 'warning', 'type': 'lambda_unavailable', 'lambda': lambda_name,
+                             'message': f"Could not read the configuration or concurrency of '{lambda_name}': {error}"})
+            continue
+
+        timeout_ms = config.get('Timeout', 3) * 1000
+        if durations_ms.get(lambda_name):
+            duration_ms, duration_source = durations_ms[lambda_name], 'measured'
+        elif assumed_duration_ms:
+            duration_ms, duration_source = assumed_duration_ms, 'assumed'
+        else:
+            duration_ms, duration_source = timeout_ms, 'timeout'
+        capacity_severity = 'warning' if duration_source == 'timeout' else 'error'
+        if concurrency['reserved'] is not None:
+            concurrency_limit, concurrency_source = concurrency['reserved'], 'reserved'
+        else:
+            concurrency_limit, concurrency_source = unreserved_concurrency, 'unreserved_account_pool'
+        max_rps = concurrency_limit * 1000 / duration_ms
+        throttled = [demand for demand in demands if demand['limit_source'] != 'account']
+        unthrottled = [demand for demand in demands if demand['limit_source'] == 'account']
+        demand_rps = sum(demand['rate_limit'] for demand in throttled)
+
+        lambda_entry = {
+            'lambda_name': lambda_name,
+            'timeout_ms': timeout_ms,
+            'duration_ms': duration_ms,
+            'duration_source': duration_source,
+            'concurrency_limit': concurrency_limit,
+            'concurrency_source': concurrency_source,
+            'provisioned_concurrency': concurrency['provisioned'],
+            'max_rps': round(max_rps, 2),
+            'route_count': len(demands),
+            'unthrottled_route_count': len(unthrottled),
+            'summed_route_rate_limit': demand_rps,
+            'utilization': round(demand_rps / max_rps, 2) if max_rps else None
+        }
+        lambdas.append(lambda_entry)
+
+        for demand in demands:
+            route_flags = []
+            route_name = f"{demand['api_name']}/{demand['stage']} {demand['route_key']}"
+            provisioned = concurrency['provisioned'].get(demand['qualifier']) if demand['qualifier'] else None
+            warm_rps = provisioned * 1000 / duration_ms if provisioned else None
+            if demand['limit_source'] != 'account':
+                if demand['rate_limit'] > max_rps:
+                    route_flags.append('unservable_rate')
+                    findings.append({'severity': capacity_severity, 'type': 'unservable_rate', 'lambda': lambda_name, 'route': route_name,
+                                     'message': f"{route_name} allows {demand['rate_limit']} RPS ({demand['limit_source']} limit) but "
+                                                f"'{lambda_name}' serves at most {max_rps:.1f} RPS "
+                                                f"({concurrency_limit} concurrent invocations of {duration_ms:.0f} ms, {duration_source} duration)."})
+                if demand['burst_limit'] is not None and demand['burst_limit'] > concurrency_limit:
+                    route_flags.append('burst_exceeds_concurrency')
+                    findings.append({'severity': 'warning', 'type': 'burst_exceeds_concurrency', 'lambda': lambda_name, 'route': route_name,
+                                     'message': f"{route_name} allows bursts of {demand['burst_limit']} requests but '{lambda_name}' "
+                                                f"runs at most {concurrency_limit} at once ({concurrency_source})."})
+                if warm_rps is not None and demand['rate_limit'] > warm_rps:
+                    route_flags.append('rate_exceeds_provisioned')
+                    findings.append({'severity': 'warning', 'type': 'rate_exceeds_provisioned', 'lambda': lambda_name, 'route': route_name,
+                                     'message': f"{route_name} allows {demand['rate_limit']} RPS but the {provisioned} provisioned "
+                                                f"instances of '{lambda_name}:{demand['qualifier']}' serve {warm_rps:.1f} RPS warm; "
+                                                f"the rest spills over to on-demand instances with cold starts."})
+            if concurrency['provisioned'] and not demand['qualifier']:
+                route_flags.append('provisioned_not_used')
+                findings.append({'severity': 'warning', 'type': 'provisioned_not_used', 'lambda': lambda_name, 'route': route_name,
+                                 'message': f"{route_name} invokes '{lambda_name}' unqualified, so the provisioned concurrency of "
+                                            f"{sorted(concurrency['provisioned'])} never serves it."})
+            if demand['integration_timeout_ms'] and demand['integration_timeout_ms'] < timeout_ms:
+                route_flags.append('integration_timeout_below_function_timeout')
+                findings.append({'severity': 'warning', 'type': 'integration_timeout_below_function_timeout', 'lambda': lambda_name,
+                                 'route': route_name,
+                                 'message': f"{route_name} times out after {demand['integration_timeout_ms']} ms but '{lambda_name}' "
+                                            f"may run for {timeout_ms} ms, holding concurrency after the client got a 504."})
+            routes.append(dict(demand, provisioned_concurrency=provisioned,
+                               warm_rps=round(warm_rps, 2) if warm_rps is not None else None, flags=route_flags))
+
+        if demand_rps > max_rps:
+            shared = len(throttled) >= shared_route_threshold
+            findings.append({
+                'severity': capacity_severity if shared else 'warning',
+                'type': 'shared_bottleneck' if shared else 'oversubscribed',
+                'lambda': lambda_name,
+                'message': f"'{lambda_name}' is behind {len(throttled)} throttled routes allowing {demand_rps} RPS in total, "
+                           f"{demand_rps / max_rps if max_rps else float('inf'):.1f}x the {max_rps:.1f} RPS it can serve "
+                           f"({duration_source} duration)."
+            })
+        if unthrottled:
+            findings.append({
+                'severity': 'warning',
+                'type': 'unthrottled_routes',
+                'lambda': lambda_name,
+                'message': f"'{lambda_name}' is behind {len(unthrottled)} routes limited only by the account-level throttle "
+                           f"({ACCOUNT_THROTTLING_RATE_LIMIT} RPS shared by every API in the region); set route or stage "
+                           f"throttling at or below the {max_rps:.1f} RPS it can serve."
+            })
+
+    severity_order = {'error': 0, 'warning': 1}
+    findings.sort(key=lambda finding: (severity_order[finding['severity']], finding['type'], finding['lambda'], finding.get('route', '')))
+    return {'lambdas': lambdas, 'routes': routes, 'findings': findings}
+
+def run_throughput_analysis(api_names=None, stage_names=None, durations_ms=None, assumed_duration_ms=None,
+                            shared_route_threshold=DEFAULT_SHARED_ROUTE_THRESHOLD, max_workers=DEFAULT_API_WORKERS,
+                            metrics_days=DEFAULT_METRICS_DAYS, duration_stat=DEFAULT_DURATION_STAT):
+    """
+    Collects route limits for the given APIs (every API when api_names is None) and analyzes them together.
+    Unless durations_ms is given, each function's duration is its CloudWatch Duration `duration_stat` over the
+    last metrics_days days (metrics_days=None skips the lookup).
+    """
+    apigw_client = boto3.client('apigatewayv2', config=CLIENT_CONFIG)
+    lambda_client = boto3.client('lambda', config=CLIENT_CONFIG)
+    api_index = build_api_index(apigw_client)
+
+    targets = []
+    for name in (api_names or sorted(api_index, key=str)):
+        if not api_index.get(name):
+            print(f"Error: API Gateway with name '{name}' not found.")
+        targets.extend((name, api_id) for api_id in api_index.get(name, []))
+
+    route_demands = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for demands in executor.map(lambda target: collect_route_demands(apigw_client, target[1], target[0], stage_names), targets):
+            route_demands.extend(demands)
+    print(f"Found {len(route_demands)} Lambda-backed routes across {len(targets)} APIs.")
+
+    lambda_names = {demand['lambda_name'] for demand in route_demands}
+    lambda_configurations = fetch_lambda_configurations(lambda_client, lambda_names)
+    lambda_concurrency = fetch_lambda_concurrency(lambda_client, lambda_names)
+    unreserved_concurrency = lambda_client.get_account_settings()['AccountLimit']['UnreservedConcurrentExecutions']
+    if durations_ms is None and metrics_days and lambda_names:
+        cloudwatch_client = boto3.client('cloudwatch', config=CLIENT_CONFIG)
+        durations_ms = fetch_lambda_durations(cloudwatch_client, {name: (name, None) for name in lambda_names},
+                                              duration_stat, metrics_days)
+        print(f"Measured the {duration_stat} duration of {sum(1 for value in durations_ms.values() if value)} of "
+              f"{len(lambda_names)} Lambda functions over the last {metrics_days} days.")
+
+    report = analyze_throughput(route_demands, lambda_configurations, lambda_concurrency, unreserved_concurrency,
+                                durations_ms, assumed_duration_ms, shared_route_threshold)
+    report['generated_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    report['unreserved_concurrency'] = unreserved_concurrency
+    report['duration_stat'] = duration_stat if metrics_days else None
+    return report
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python extract_apigw_config.py <api_gateway_name>")
+    parser = argparse.ArgumentParser(description="Exports API Gateway v2 routes and Lambda integrations to terraform.tfvars.json.")
+    parser.add_argument('api_gateway_name', nargs='?', help='Name of a single API to export to ./terraform.tfvars.json.')
+    parser.add_argument('--all', action='store_true', help='Export every API in the account (one tfvars file per API plus a manifest).')
+    parser.add_argument('--apis', nargs='+', help='Export only these API names, concurrently, like --all.')
+    parser.add_argument('--output-dir', default='tfvars', help='Output directory for --all/--apis.')
+    parser.add_argument('--workers', type=int, default=DEFAULT_API_WORKERS, help='APIs exported at the same time with --all/--apis.')
+    parser.add_argument('--metrics-days', type=int,
+                        help='Attach CloudWatch latency p50/p90/p99, count and 5xx numbers of the last N days to each route '
+                             '(with --analyze-throughput: window of the measured Lambda durations, default 7).')
+    parser.add_argument('--slow-p99-ms', type=float, default=DEFAULT_SLOW_P99_MS,
+                        help='p99 latency above which a route is reported as slow.')
+    parser.add_argument('--cold-start', action='store_true',
+                        help='Score cold-start risk per route, add suggested settings to the tfvars and write cold-start-report.json '
+                             '(provisioned concurrency needs --metrics-days for traffic).')
+    parser.add_argument('--analyze-throughput', action='store_true',
+                        help='Instead of exporting, relate route throttling limits to Lambda concurrency and timeouts.')
+    parser.add_argument('--stages', nargs='+', help='Stages considered by --analyze-throughput (default: all).')
+    parser.add_argument('--assumed-duration-ms', type=float,
+                        help='Invocation duration used by --analyze-throughput for Lambdas without measured Duration metrics '
+                             '(default: the function timeout).')
+    parser.add_argument('--duration-stat', default=DEFAULT_DURATION_STAT,
+                        help='CloudWatch Duration statistic (e.g. p90, p99) measured over --metrics-days days by --analyze-throughput.')
+    parser.add_argument('--shared-route-threshold', type=int, default=DEFAULT_SHARED_ROUTE_THRESHOLD,
+                        help='Routes behind one oversubscribed Lambda to report it as a shared bottleneck.')
+    parser.add_argument('--report-file', default='throughput-report.json', help='Output file for --analyze-throughput.')
+    args = parser.parse_args()
+
+    if args.analyze_throughput:
+        api_names = [args.api_gateway_name] if args.api_gateway_name else args.apis
+        if not (api_names or args.all):
+            parser.print_usage()
+            sys.exit(1)
+        report = run_throughput_analysis(None if args.all else api_names, args.stages,
+                                         assumed_duration_ms=args.assumed_duration_ms,
+                                         shared_route_threshold=args.shared_route_threshold,
+                                         metrics_days=args.metrics_days or DEFAULT_METRICS_DAYS, duration_stat=args.duration_stat)
+        with open(args.report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        for finding in report['findings']:
+            print(f"[{finding['severity'].upper()}] {finding['message']}")
+        print(f"Analyzed {len(report['lambdas'])} Lambda functions behind {len(report['routes'])} routes: "
+              f"{len(report['findings'])} findings (report: {args.report_file}).")
+        sys.exit(1 if any(finding['severity'] == 'error' for finding in report['findings']) else 0)
+
+    if args.all or args.apis:
+        manifest = export_apis(None if args.all else args.apis, args.output_dir, args.workers, args.metrics_days, args.slow_p99_ms,
+                               args.cold_start)
+        failed = [entry['name'] for entry in manifest['apis'] if entry['status'] != 'exported']
+        print(f"Exported {len(manifest['apis']) - len(failed)} of {len(manifest['apis'])} APIs to '{args.output_dir}' "
+              f"in {manifest['duration_seconds']}s (manifest: {os.path.join(args.output_dir, 'manifest.json')}).")
+        if failed:
+            print(f"Failed to export: {failed}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if not args.api_gateway_name:
+        parser.print_usage()
         sys.exit(1)
 
-    api_gateway_name = sys.argv[1]
-    config_data = extract_apigw_config(api_gateway_name)
+    config_data = extract_apigw_config(args.api_gateway_name, metrics_days=args.metrics_days, slow_p99_ms=args.slow_p99_ms,
+                                       cold_start=args.cold_start)
 
     if config_data:
         tfvars_file = "terraform.tfvars.json"
         with open(tfvars_file, 'w') as f:
             json.dump(config_data, f, indent=2)
         print(f"Successfully generated {tfvars_file}")
+        if args.cold_start:
+            report = cold_start_report(config_data)
+            with open('cold-start-report.json', 'w') as f:
+                json.dump(report, f, indent=2)
+            for row in report[:10]:
+                print(f"  {row['rank']:>3}. {row['route_key']} -> {row['function_name']}: {row['level']} ({row['score']}), "
+                      f"suggested {row['suggested_settings'] or 'nothing'}")
+            print("Cold-start ranking saved to cold-start-report.json")
     else:
         print("Failed to generate configuration.")
-
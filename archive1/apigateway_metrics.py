@@ -0,0 +1,117 @@
+import datetime
+
+# GetMetricData accepts at most 500 metric queries per request
+MAX_QUERIES_PER_REQUEST = 500
+DEFAULT_METRICS_DAYS = 7
+# A route whose p99 latency exceeds this is flagged as slow in the generated documents
+DEFAULT_SLOW_P99_MS = 1000
+NAMESPACE = 'AWS/ApiGateway'
+LAMBDA_NAMESPACE = 'AWS/Lambda'
+LATENCY_PERCENTILES = ('p50', 'p90', 'p99')
+# The 5xx metric is named differently for REST (v1) and HTTP (v2) APIs
+REST_API_ERROR_METRIC = '5XXError'
+HTTP_API_ERROR_METRIC = '5xx'
+
+
+def rest_api_dimensions(api_name, stage, resource_path, http_method):
+    """Per-method dimensions of a REST API (requires detailed CloudWatch metrics on the stage)."""
+    return [{'Name': 'ApiName', 'Value': api_name}, {'Name': 'Stage', 'Value': stage},
+            {'Name': 'Resource', 'Value': resource_path}, {'Name': 'Method', 'Value': http_method}]
+
+
+def http_api_dimensions(api_id, stage, route_key):
+    """Per-route dimensions of an HTTP API (requires detailed route metrics on the stage)."""
+    return [{'Name': 'ApiId', 'Value': api_id}, {'Name': 'Stage', 'Value': stage}, {'Name': 'Route', 'Value': route_key}]
+
+
+def lambda_dimensions(function_name, qualifier=None):
+    """Dimensions of a Lambda function, or of one of its aliases/versions when qualifier is given."""
+    dimensions = [{'Name': 'FunctionName', 'Value': function_name}]
+    if qualifier:
+        dimensions.append({'Name': 'Resource', 'Value': f'{function_name}:{qualifier}'})
+    return dimensions
+
+
+def route_metric_queries(dimensions, error_metric):
+    """(field, metric name, statistic) for each number collected per route and stage."""
+    queries = []
+    for metric_name, prefix in (('Latency', 'latency'), ('IntegrationLatency', 'integration_latency')):
+        queries.extend((f'{prefix}_{percentile}_ms', metric_name, percentile) for percentile in LATENCY_PERCENTILES)
+    queries.append(('count', 'Count', 'Sum'))
+    queries.append(('errors_5xx', error_metric, 'Sum'))
+    return [{'field': field, 'metric_name': metric_name, 'stat': stat, 'dimensions': dimensions}
+            for field, metric_name, stat in queries]
+
+
+def fetch_metric_values(cloudwatch_client, queries, days=DEFAULT_METRICS_DAYS, now=None):
+    """
+    Runs the queries (dicts with metric_name, stat, dimensions and an optional namespace, AWS/ApiGateway
+    by default) over the last `days` days and returns one aggregated value per query, in order.
+    Queries are packed into GetMetricData requests of up to 500 queries each, with a single period spanning
+    the whole window. Sums of periods without data are 0; other statistics are None.
+    """
+    end = (now or datetime.datetime.now(datetime.timezone.utc)).replace(second=0, microsecond=0)
+    start = end - datetime.timedelta(days=days)
+    period = days * 86400
+
+    values = {}
+    paginator = cloudwatch_client.get_paginator('get_metric_data')
+    for offset in range(0, len(queries), MAX_QUERIES_PER_REQUEST):
+        metric_queries = [{
+            'Id': f'q{offset + index}',
+            'MetricStat': {
+                'Metric': {'Namespace': query.get('namespace', NAMESPACE), 'MetricName': query['metric_name'],
+                           'Dimensions': query['dimensions']},
+                'Period': period,
+                'Stat': query['stat']
+            },
+            'ReturnData': True
+        } for index, query in enumerate(queries[offset:offset + MAX_QUERIES_PER_REQUEST])]
+        for page in paginator.paginate(MetricDataQueries=metric_queries, StartTime=start, EndTime=end):
+            for result in page.get('MetricDataResults', []):
+                values.setdefault(result['Id'], []).extend(result.get('Values', []))
+
+    results = []
+    for index, query in enumerate(queries):
+        query_values = values.get(f'q{index}', [])
+        if query['stat'] == 'Sum':
+            results.append(sum(query_values))
+        else:
+            # The window may straddle two periods: keep the worst percentile
+            results.append(round(max(query_values), 1) if query_values else None)
+    return results
+
+
+def fetch_route_metrics(cloudwatch_client, targets, error_metric, days=DEFAULT_METRICS_DAYS,
+                        slow_p99_ms=DEFAULT_SLOW_P99_MS, now=None):
+    """
+    Fetches latency percentiles, request count and 5xx errors for every target over the last `days` days.
+    targets maps a caller-chosen key (e.g. (route, stage)) to its CloudWatch dimensions.
+    Returns key -> metrics dict; routes without traffic get None values and a count of 0.
+    """
+    queries = []
+    for key, dimensions in targets.items():
+        queries.extend(dict(query, key=key) for query in route_metric_queries(dimensions, error_metric))
+
+    metrics = {key: {} for key in targets}
+    for query, value in zip(queries, fetch_metric_values(cloudwatch_client, queries, days, now)):
+        metrics[query['key']][query['field']] = value
+
+    for route_metrics in metrics.values():
+        route_metrics['error_rate'] = (round(route_metrics['errors_5xx'] / route_metrics['count'], 4)
+                                       if route_metrics['count'] else None)
+        route_metrics['slow'] = (route_metrics['latency_p99_ms'] or 0) > slow_p99_ms
+        route_metrics['days'] = days
+    return metrics
+
+
+def fetch_lambda_durations(cloudwatch_client, targets, stat='p99', days=DEFAULT_METRICS_DAYS, now=None):
+    """
+    Measured invocation duration (ms) of each target over the last `days` days, using the Duration
+    statistic `stat` (e.g. 'p90' or 'p99'). targets maps a caller-chosen key to (function_name, qualifier).
+    Returns key -> duration, None for functions without invocations in the window.
+    """
+    keys = list(targets)
+    queries = [{'metric_name': 'Duration', 'stat': stat, 'namespace': LAMBDA_NAMESPACE, 'dimensions': lambda_dimensions(*targets[key])}
+               for key in keys]
+    return dict(zip(keys, fetch_metric_values(cloudwatch_client, queries, days, now)))
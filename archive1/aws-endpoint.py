@@ -1,9 +1,17 @@
 import boto3
 import argparse
+import atexit
 import logging
 import os
+import sys
 import ipaddress
 
+
+# Módulos (tracing e cache de metadados) compartilhados com as ferramentas de rede em archive2/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'archive2'))
+from aws_metadata_cache import install_metadata_cache
+from aws_tracing import TRACER, traced
+
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -70,6 +78,7 @@ def get_aws_resource(service_name, region_name='sa-east-1',
         logging.error(f"Erro ao obter recurso para {service_name}: {e}")
         raise
 
+@traced()
 def create_vpc_endpoints(service_names, vpc_id, subnet_ids, security_group_ids, region,
                          aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -128,6 +137,7 @@ def create_vpc_endpoints(service_names, vpc_id, subnet_ids, security_group_ids,
             logging.error(f"Erro ao criar VPC Endpoint para '{service_name}': {e}")
     return created_endpoints
 
+@traced()
 def identify_routable_network(vpc_id, region,
                               aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -156,6 +166,7 @@ def identify_routable_network(vpc_id, region,
         logging.error(f"Erro ao identificar rede roteável: {e}")
         return None
 
+@traced()
 def associate_subnets_to_route_table(route_table_id, subnet_ids, region,
                                      aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -200,6 +211,7 @@ def associate_subnets_to_route_table(route_table_id, subnet_ids, region,
             logging.error(f"Erro ao associar subnet '{subnet_id}' à tabela de roteamento '{route_table_id}': {e}")
     return successful_associations
 
+@traced()
 def create_private_nat_gateway(subnet_id, region,
                                aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -234,6 +246,7 @@ def create_private_nat_gateway(subnet_id, region,
         logging.error(f"Erro ao criar NAT Gateway privado: {e}")
         return None
 
+@traced()
 def get_subnet_for_nat_gateway(vpc_id, main_vpc_cidr, region,
                                aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -275,6 +288,7 @@ def get_subnet_for_nat_gateway(vpc_id, main_vpc_cidr, region,
         logging.error(f"Erro ao encontrar subnet para NAT Gateway: {e}")
         return None
 
+@traced()
 def create_subnets(vpc_id, base_cidr_block, num_subnets, subnet_prefix_length, tag_name_prefix, region,
                    aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -393,6 +407,7 @@ def create_subnets(vpc_id, base_cidr_block, num_subnets, subnet_prefix_length, t
 
     return created_subnet_ids
 
+@traced()
 def create_new_route_table_and_associate(vpc_id, subnet_ids, nat_gateway_id, region,
                                          aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -466,6 +481,7 @@ def create_new_route_table_and_associate(vpc_id, subnet_ids, nat_gateway_id, reg
         logging.error(f"Erro ao criar e associar nova tabela de roteamento: {e}")
         return None
 
+@traced()
 def get_existing_subnets_in_cidr(vpc_id, cidr_block, region,
                                   aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -492,6 +508,14 @@ def get_existing_subnets_in_cidr(vpc_id, cidr_block, region,
         logging.error(f"Erro ao buscar subnets existentes no CIDR '{cidr_block}': {e}")
         return []
 
+def next_step(steps, name, **attributes):
+    """Finaliza o span do passo anterior (se houver) e inicia o span do próximo passo do main."""
+    if steps:
+        steps[-1].finish()
+    span = TRACER.start_span(f'step.{name}', **attributes)
+    if span is not None:
+        steps.append(span)
+
 def main():
     parser = argparse.ArgumentParser(description="Script para configurar recursos de rede AWS em uma pipeline Harness.")
     parser.add_argument('--region', type=str, default='sa-east-1', help='Região AWS a ser usada.')
@@ -499,12 +523,24 @@ def main():
     parser.add_argument('--security-group-ids', nargs='+', required=True, help='IDs dos Security Groups para os VPC Endpoints.')
     parser.add_argument('--num-subnets', type=int, default=4, help='Número de subnets desejadas para o CIDR 100.99.0.0/16 (recomenda-se 2 ou 4 para AZs a e b).')
     parser.add_argument('--subnet-prefix-length', type=int, default=20, help='Comprimento do prefixo das novas subnets do 100.99.0.0/16 (e.g., 20 para /20).')
-    parser.add_argument('--new-subnet-tag-name-prefix', type=str, default='Harness', help='Prefixo do Tag Name para as novas subnets criadas (do 100.99.0.0/16). As tags finais serão 'Harness-app-non-routable-[AZ]' ou 'Harness-database-non-routable-[AZ]').')
+    parser.add_argument('--new-subnet-tag-name-prefix', type=str, default='Harness', help="Prefixo do Tag Name para as novas subnets criadas (do 100.99.0.0/16). As tags finais serão 'Harness-app-non-routable-[AZ]' ou 'Harness-database-non-routable-[AZ]').")
     parser.add_argument('--non-routable-cidr', type=str, default='100.99.0.0/16', help='CIDR a ser dividido em novas subnets (este será o CIDR "não roteável" via TGW).')
     parser.add_argument('--main-vpc-cidr', type=str, required=True, help='CIDR principal da VPC onde o NAT Gateway deve ser criado e onde as subnets roteáveis existentes estão.')
 
+    parser.add_argument('--trace-file', type=str, help='Arquivo do trace no formato Chrome/Perfetto (spans por passo e por chamada AWS).')
+    parser.add_argument('--trace-log', type=str, help='Arquivo JSON Lines com um registro estruturado por span.')
+    parser.add_argument('--no-metadata-cache', action='store_true', help='Não usa o cache em disco de metadados (e.g., AZs) entre execuções.')
+    parser.add_argument('--account-id', type=str, help='Conta AWS usada na partição do cache de metadados; obtida via STS se omitida.')
+
     args = parser.parse_args()
 
+    if args.trace_file or args.trace_log:
+        TRACER.enable(trace_file=args.trace_file, log_file=args.trace_log)
+        atexit.register(TRACER.export)
+    # Registrado após o export: handlers do atexit rodam em ordem inversa, então o último passo é finalizado antes
+    steps = []
+    atexit.register(lambda: steps and steps[-1].finish())
+
     aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
     aws_secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
     aws_session_token = os.environ.get('AWS_SESSION_TOKEN')
@@ -513,9 +549,21 @@ def main():
         logging.error("Variáveis de ambiente AWS_ACCESS_KEY_ID e/ou AWS_SECRET_ACCESS_KEY não encontradas. Por favor, configure-as na pipeline do Harness.")
         exit(1)
 
+    if not args.no_metadata_cache:
+        # Cache em disco (por conta) das chamadas de metadados, como describe_availability_zones. A conta vem do
+        # STS: o access key de credenciais temporárias muda a cada execução e nunca acertaria o cache
+        try:
+            account_id = args.account_id or get_aws_client(
+                'sts', args.region, aws_access_key_id, aws_secret_access_key, aws_session_token
+            ).get_caller_identity()['Account']
+            install_metadata_cache(account_id)
+        except Exception as e:
+            logging.warning(f"Não foi possível identificar a conta via STS ({e}); cache de metadados desativado.")
+
     logging.info(f"Iniciando configuração de rede na VPC '{args.vpc_id}' na região '{args.region}'.")
     
     # 1. Identificar a tabela de roteamento roteável (com TGW)
+    next_step(steps, 'identify_routable_network', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 1: Identificando tabela de roteamento roteável (com TGW).")
     routable_route_table_id = identify_routable_network(args.vpc_id, args.region,
                                                         aws_access_key_id, aws_secret_access_key, aws_session_token)
@@ -525,6 +573,7 @@ def main():
         exit(1)
 
     # 2. Identificar uma subnet existente para o NAT Gateway (no main_vpc_cidr)
+    next_step(steps, 'nat_subnet', vpc_id=args.vpc_id, region=args.region)
     logging.info(f"Passo 2: Identificando uma subnet para o NAT Gateway no CIDR '{args.main_vpc_cidr}'.")
     nat_gateway_subnet_id = get_subnet_for_nat_gateway(args.vpc_id, args.main_vpc_cidr, args.region,
                                                        aws_access_key_id, aws_secret_access_key, aws_session_token)
@@ -534,6 +583,7 @@ def main():
         exit(1)
     
     # 3. Criar NAT Gateway privado
+    next_step(steps, 'nat_gateway', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 3: Criando NAT Gateway privado.")
     nat_gateway_id = create_private_nat_gateway(nat_gateway_subnet_id, args.region,
                                                 aws_access_key_id, aws_secret_access_key, aws_session_token)
@@ -543,6 +593,7 @@ def main():
         exit(1)
 
     # 4. Criar as novas subnets (do non-routable-cidr, e.g., 100.99.0.0/16)
+    next_step(steps, 'subnets', vpc_id=args.vpc_id, region=args.region)
     logging.info(f"Passo 4: Criando as novas subnets a partir do CIDR '{args.non_routable_cidr}' (somente AZs 'a' e 'b').")
     created_subnets = create_subnets(
         args.vpc_id,
@@ -559,6 +610,7 @@ def main():
         exit(1)
 
     # 5. Criar uma NOVA Tabela de Roteamento para as Novas Subnets e associá-las, com rota para NAT GW
+    next_step(steps, 'route_table', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 5: Criando uma NOVA tabela de roteamento para as subnets recém-criadas (do 100.99.0.0/16) e associando-as com rota para NAT Gateway.")
     new_non_routable_rt_id = create_new_route_table_and_associate(
         args.vpc_id,
@@ -573,6 +625,7 @@ def main():
         exit(1)
     
     # 6. Associar subnets EXISTENTES do main_vpc_cidr à Tabela de Roteamento do TGW
+    next_step(steps, 'associate_existing_subnets', vpc_id=args.vpc_id, region=args.region)
     logging.info(f"Passo 6: Verificando e associando subnets existentes do CIDR '{args.main_vpc_cidr}' à Tabela de Roteamento do TGW ('{routable_route_table_id}').")
     
     existing_main_cidr_subnets = get_existing_subnets_in_cidr(
@@ -594,6 +647,7 @@ def main():
         logging.warning(f"Nenhuma subnet existente encontrada no CIDR '{args.main_vpc_cidr}' para associação à RT do TGW.")
 
     # 7. Criar VPC Endpoints (nas novas subnets do 100.99.0.0/16)
+    next_step(steps, 'vpc_endpoints', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 7: Criando VPC Endpoints nas subnets recém-criadas (do 100.99.0.0/16) e Gateway Endpoints.")
     
     # Lidar com S3 Gateway Endpoint
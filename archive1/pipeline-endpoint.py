@@ -1,7 +1,14 @@
 import boto3
 import argparse
+import atexit
 import logging
 import os
+import sys
+
+
+# Módulo de tracing compartilhado com as ferramentas de rede em archive2/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'archive2'))
+from aws_tracing import TRACER, traced
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,6 +29,7 @@ def get_aws_resource(service_name, region_name='sa-east-1'):
         logging.error(f"Erro ao obter recurso para {service_name}: {e}")
         raise
 
+@traced()
 def create_vpc_endpoints(service_names, vpc_id, subnet_ids, security_group_ids, region='sa-east-1'):
     """
     Cria VPC Endpoints para os serviços especificados.
@@ -58,6 +66,7 @@ def create_vpc_endpoints(service_names, vpc_id, subnet_ids, security_group_ids,
             logging.error(f"Erro ao criar VPC Endpoint para '{service_name}': {e}")
     return created_endpoints
 
+@traced()
 def identify_routable_network(vpc_id, region='sa-east-1'):
     """
     Identifica uma subnet roteável em uma VPC que tenha uma tabela de roteamento
@@ -92,6 +101,7 @@ def identify_routable_network(vpc_id, region='sa-east-1'):
         logging.error(f"Erro ao identificar rede roteável: {e}")
         return None
 
+@traced()
 def create_private_nat_gateway(subnet_id, region='sa-east-1'):
     """
     Cria um NAT Gateway privado na subnet especificada.
@@ -126,6 +136,7 @@ def create_private_nat_gateway(subnet_id, region='sa-east-1'):
         logging.error(f"Erro ao criar NAT Gateway privado: {e}")
         return None
 
+@traced()
 def get_vpc_cidrs(vpc_id, target_cidr_prefix='100.99.0.0/16', region='sa-east-1'):
     """
     Lista os CIDRs associados à VPC com um prefixo específico.
@@ -149,6 +160,7 @@ def get_vpc_cidrs(vpc_id, target_cidr_prefix='100.99.0.0/16', region='sa-east-1'
         logging.error(f"Erro ao listar CIDRs da VPC: {e}")
         return []
 
+@traced()
 def create_subnets(vpc_id, cidr_block, num_subnets, tag_name, region='sa-east-1'):
     """
     Cria um número especificado de subnets em diferentes AZs dentro de um CIDR block.
@@ -249,6 +261,7 @@ def create_subnets(vpc_id, cidr_block, num_subnets, tag_name, region='sa-east-1'
     return created_subnet_ids
 
 
+@traced()
 def create_and_associate_route_table(vpc_id, subnet_ids, nat_gateway_id, region='sa-east-1'):
     """
     Cria uma nova tabela de roteamento, associa as subnets e adiciona uma rota para o NAT Gateway.
@@ -302,6 +315,14 @@ def create_and_associate_route_table(vpc_id, subnet_ids, nat_gateway_id, region=
         logging.error(f"Erro ao criar e associar tabela de roteamento: {e}")
         return None
 
+def next_step(steps, name, **attributes):
+    """Finaliza o span do passo anterior (se houver) e inicia o span do próximo passo do main."""
+    if steps:
+        steps[-1].finish()
+    span = TRACER.start_span(f'step.{name}', **attributes)
+    if span is not None:
+        steps.append(span)
+
 def main():
     parser = argparse.ArgumentParser(description="Script para configurar recursos de rede AWS em uma pipeline Harness.")
     parser.add_argument('--region', type=str, default='sa-east-1', help='Região AWS a ser usada.')
@@ -311,8 +332,18 @@ def main():
     parser.add_argument('--subnet-tag-name', type=str, default='Harness-Managed-Subnet', help='Tag Name para as subnets criadas.')
     parser.add_argument('--target-vpc-cidr', type=str, default='100.99.0.0/16', help='Prefixo CIDR da VPC para identificar os blocos.')
 
+    parser.add_argument('--trace-file', type=str, help='Arquivo do trace no formato Chrome/Perfetto (spans por passo e por chamada AWS).')
+    parser.add_argument('--trace-log', type=str, help='Arquivo JSON Lines com um registro estruturado por span.')
+
     args = parser.parse_args()
 
+    if args.trace_file or args.trace_log:
+        TRACER.enable(trace_file=args.trace_file, log_file=args.trace_log)
+        atexit.register(TRACER.export)
+    # Registrado após o export: handlers do atexit rodam em ordem inversa, então o último passo é finalizado antes
+    steps = []
+    atexit.register(lambda: steps and steps[-1].finish())
+
     # Credenciais AWS devem ser configuradas via variáveis de ambiente ou ~/.aws/credentials
     # boto3 automaticamente buscará por elas.
 
@@ -338,6 +369,7 @@ def main():
     ]
 
     # 1. Criar os endpoints da foto
+    next_step(steps, 'vpc_endpoints', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 1: Criando VPC Endpoints...")
     # Para criar os endpoints, precisamos de IDs de subnets existentes e Security Groups.
     # Neste exemplo, estamos usando os IDs passados como argumento.
@@ -353,6 +385,7 @@ def main():
     # Portanto, este passo será executado depois do passo 3.
 
     # 2. Identificar a rede roteável e criar NAT Gateway privado
+    next_step(steps, 'nat_gateway', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 2: Identificando rede roteável e criando NAT Gateway privado...")
     routable_subnet_id = identify_routable_network(args.vpc_id, args.region)
     nat_gateway_id = None
@@ -363,6 +396,7 @@ def main():
         exit(1) # Abortar se não puder criar o NAT GW
 
     # 3. Listar CIDRs associados à VPC com 100.99.0.0/16 e criar subnets
+    next_step(steps, 'subnets', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 3: Listando CIDRs e criando subnets...")
     vpc_cidrs = get_vpc_cidrs(args.vpc_id, args.target_vpc_cidr, args.region)
     created_subnets = []
@@ -397,6 +431,7 @@ def main():
 
 
     # 4. Criar nova tabela de roteamento, incluir subnets e NAT Gateway
+    next_step(steps, 'route_table', vpc_id=args.vpc_id, region=args.region)
     logging.info("Passo 4: Criando e configurando nova tabela de roteamento...")
     if created_subnets and nat_gateway_id:
         create_and_associate_route_table(args.vpc_id, created_subnets, nat_gateway_id, args.region)
@@ -0,0 +1,184 @@
+import base64
+import copy
+import datetime
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+CASSETTE_MODES = ('record', 'replay')
+CASSETTE_FORMAT_VERSION = 1
+
+
+class CassetteMiss(Exception):
+    """Chamada feita em modo replay que não existe no cassette."""
+
+
+def encode_value(value):
+    """Converte uma resposta do botocore em algo serializável em JSON (datetimes e bytes são marcados)."""
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    # Streams e outros objetos não são reproduzíveis: registra apenas o tipo
+    return {'__unserializable__': type(value).__name__}
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if set(value) == {'__datetime__'}:
+            return datetime.datetime.fromisoformat(value['__datetime__'])
+        if set(value) == {'__bytes__'}:
+            return base64.b64decode(value['__bytes__'])
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+def _interaction_key(service, operation, params):
+    return (service, operation, json.dumps(encode_value(params), sort_keys=True))
+
+
+class Cassette:
+    """
+    Camada de gravação/reprodução de chamadas AWS no nível do botocore.
+    Em modo 'record' cada chamada real (parâmetros, status e resposta parseada) é registrada na ordem
+    em que ocorreu; em modo 'replay' as chamadas são respondidas a partir do arquivo, sem rede e sem
+    credenciais reais. Chamadas idênticas são respondidas na ordem em que foram gravadas, o que mantém
+    a reprodução determinística mesmo com chamadas concorrentes a operações diferentes.
+    latency controla a latência simulada no replay: None (sem espera), 'recorded' (duração gravada)
+    ou um número de segundos; latency_overrides permite um valor por operação ({'CreateNatGateway': 2.0}).
+    """
+
+    def __init__(self, path, mode, latency=None, latency_overrides=None):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Modo de cassette inválido '{mode}'. Use um de {CASSETTE_MODES}.")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_overrides = latency_overrides or {}
+        self.interactions = []
+        self.call_counts = defaultdict(int)
+        self.simulated_latency = 0.0
+        self._lock = threading.Lock()
+        self._pending = {}
+        if mode == 'replay':
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.interactions = data['interactions']
+        self._pending = defaultdict(deque)
+        for interaction in self.interactions:
+            key = _interaction_key(interaction['service'], interaction['operation'], interaction['params'])
+            self._pending[key].append(interaction)
+        logging.info(f"Cassette '{self.path}' carregado com {len(self.interactions)} interações.")
+
+    def save(self):
+        """Grava as interações registradas no arquivo do cassette (somente em modo 'record')."""
+        if self.mode != 'record':
+            return
+        with self._lock:
+            data = {'version': CASSETTE_FORMAT_VERSION, 'interactions': list(self.interactions)}
+        with open(self.path, 'w') as f:
+            json.dump(data, f, indent=2)
+        logging.info(f"Cassette '{self.path}' gravado com {len(data['interactions'])} interações.")
+
+    def install(self, session=None):
+        """
+        Registra os hooks do cassette na sessão informada (ou na sessão default do boto3).
+        Deve ser chamado antes da criação dos clientes, pois eles copiam os handlers da sessão.
+        """
+        if session is None:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        session.events.register('provide-client-params.*.*', self._capture_params)
+        if self.mode == 'record':
+            session.events.register('after-call.*.*', self._record)
+        else:
+            session.events.register('before-call.*.*', self._replay)
+        return session
+
+    def _capture_params(self, params, model, context, **kwargs):
+        context['cassette_params'] = copy.deepcopy(params)
+        context['cassette_started_at'] = time.monotonic()
+
+    def _record(self, http_response, parsed, model, context, **kwargs):
+        response = {key: item for key, item in parsed.items() if key != 'ResponseMetadata'}
+        interaction = {
+            'service': model.service_model.service_name,
+            'operation': model.name,
+            'params': encode_value(context.get('cassette_params', {})),
+            'status_code': http_response.status_code,
+            'response': encode_value(response),
+            'duration': round(time.monotonic() - context.get('cassette_started_at', time.monotonic()), 4)
+        }
+        with self._lock:
+            interaction['sequence'] = len(self.interactions)
+            self.interactions.append(interaction)
+            self.call_counts[model.name] += 1
+
+    def _replay(self, model, context, **kwargs):
+        service = model.service_model.service_name
+        key = _interaction_key(service, model.name, context.get('cassette_params', {}))
+        with self._lock:
+            queue = self._pending.get(key)
+            if not queue:
+                raise CassetteMiss(f"Chamada '{service}.{model.name}' com parâmetros {key[2]} não encontrada no cassette '{self.path}'.")
+            # A última resposta de uma sequência é mantida para chamadas repetidas (ex.: polling de waiters)
+            interaction = queue.popleft() if len(queue) > 1 else queue[0]
+            self.call_counts[model.name] += 1
+
+        delay = self.latency_overrides.get(model.name, self.latency)
+        if delay == 'recorded':
+            delay = interaction.get('duration', 0.0)
+        if delay:
+            with self._lock:
+                self.simulated_latency += delay
+            time.sleep(delay)
+
+        http_response = AWSResponse(None, interaction['status_code'], {}, None)
+        parsed = decode_value(interaction['response'])
+        parsed.setdefault('ResponseMetadata', {})['HTTPStatusCode'] = interaction['status_code']
+        return http_response, parsed
+
+    def summary(self):
+        """Resumo da execução: número de chamadas por operação e latência simulada total."""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'total_calls': sum(self.call_counts.values()),
+                'calls_by_operation': dict(sorted(self.call_counts.items())),
+                'simulated_latency_seconds': round(self.simulated_latency, 3)
+            }
+
+
+def parse_latency(value):
+    """Converte o argumento de latência da linha de comando ('recorded' ou segundos)."""
+    if value is None or value == 'recorded':
+        return value
+    return float(value)
+
+
+def parse_latency_overrides(values):
+    """Converte uma lista 'Operacao=segundos' em um dicionário de latências por operação."""
+    overrides = {}
+    for item in values or []:
+        operation, _, seconds = item.partition('=')
+        if not operation or not seconds:
+            raise ValueError(f"Latência por operação inválida '{item}'. Use o formato Operacao=segundos.")
+        overrides[operation] = parse_latency(seconds)
+    return overrides
@@ -0,0 +1,118 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+from aws_cassette import decode_value, encode_value
+
+# Operações de metadados que mudam raramente e o TTL (segundos) de cada uma no cache
+METADATA_OPERATION_TTLS = {
+    ('ec2', 'DescribeAvailabilityZones'): 24 * 3600,
+    ('ec2', 'DescribeRegions'): 7 * 24 * 3600,
+    ('ec2', 'DescribeVpcEndpointServices'): 6 * 3600,
+    ('ec2', 'DescribeInstanceTypes'): 7 * 24 * 3600,
+    ('ec2', 'DescribeInstanceTypeOfferings'): 24 * 3600,
+    ('ec2', 'DescribePrefixLists'): 6 * 3600
+}
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'networking-metadata')
+
+
+class MetadataCache:
+    """
+    Cache em disco, entre execuções, das respostas das operações de METADATA_OPERATION_TTLS.
+    A chave é (partição, região, serviço, operação, parâmetros); a partição identifica a conta (os nomes
+    de AZ, por exemplo, variam por conta). Cada entrada é um arquivo JSON gravado de forma atômica
+    (arquivo temporário + os.replace), então execuções concorrentes nunca leem uma entrada parcial.
+    Um acerto responde a chamada no hook before-call do botocore, sem requisição à AWS.
+    """
+
+    def __init__(self, directory, partition, ttls=None):
+        self.directory = directory
+        self.partition = partition
+        self.ttls = dict(METADATA_OPERATION_TTLS if ttls is None else ttls)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def install(self, session=None):
+        """
+        Registra os hooks na sessão informada (ou na sessão default do boto3), antes da criação dos clientes.
+        Deve ser instalado antes do limitador de taxa para que acertos não consumam tokens.
+        """
+        if session is None:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        session.events.register('provide-client-params.*.*', self._capture_key)
+        session.events.register('before-call.*.*', self._lookup)
+        session.events.register('after-call.*.*', self._store)
+        return session
+
+    def _path(self, cache_key):
+        return os.path.join(self.directory, f'{cache_key}.json')
+
+    def _capture_key(self, params, model, context, **kwargs):
+        operation = (model.service_model.service_name, model.name)
+        if operation not in self.ttls:
+            return
+        key_material = json.dumps([self.partition, context.get('client_region'), *operation, encode_value(copy.deepcopy(params))],
+                                  sort_keys=True)
+        context['metadata_cache_key'] = hashlib.sha256(key_material.encode()).hexdigest()
+
+    def _lookup(self, model, context, **kwargs):
+        cache_key = context.get('metadata_cache_key')
+        if cache_key is None:
+            return None
+        try:
+            with open(self._path(cache_key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        ttl = self.ttls[(model.service_model.service_name, model.name)]
+        if entry is None or time.time() - entry['stored_at'] > ttl:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        context['metadata_cache_hit'] = True
+        parsed = decode_value(entry['response'])
+        parsed.setdefault('ResponseMetadata', {})['HTTPStatusCode'] = 200
+        return AWSResponse(None, 200, {}, None), parsed
+
+    def _store(self, http_response, parsed, model, context, **kwargs):
+        cache_key = context.get('metadata_cache_key')
+        if cache_key is None or context.get('metadata_cache_hit') or http_response.status_code != 200:
+            return
+        entry = {
+            'operation': f'{model.service_model.service_name}.{model.name}',
+            'stored_at': time.time(),
+            'response': encode_value({key: item for key, item in parsed.items() if key != 'ResponseMetadata'})
+        }
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f'.{cache_key}-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self._path(cache_key))
+        except OSError as e:
+            # O cache é apenas uma otimização: falhas de escrita não afetam a execução
+            logging.warning(f"Não foi possível gravar '{entry['operation']}' no cache de metadados: {e}")
+
+    def summary(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def install_metadata_cache(partition, directory=None, session=None):
+    """Cria e instala o cache de metadados (diretório de NETWORKING_METADATA_CACHE ou o padrão em ~/.cache)."""
+    cache = MetadataCache(directory or os.environ.get('NETWORKING_METADATA_CACHE', DEFAULT_CACHE_DIR), partition)
+    cache.install(session)
+    return cache
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+
+import boto3
+
+# Buckets de throttling da API do EC2 (capacidade, reposição por segundo), conforme a documentação de request throttling
+EC2_THROTTLING_BUCKETS = {
+    'describe': (100, 20.0),
+    'mutating': (50, 5.0)
+}
+NON_MUTATING_PREFIXES = ('Describe', 'Get', 'List', 'Search')
+THROTTLING_ERROR_CODES = {'RequestLimitExceeded', 'Throttling', 'ThrottlingException', 'TooManyRequestsException'}
+
+
+def api_category(operation_name):
+    """Classifica uma operação como 'describe' (não mutável) ou 'mutating', como nos buckets do EC2."""
+    return 'describe' if operation_name.startswith(NON_MUTATING_PREFIXES) else 'mutating'
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe com taxa adaptativa: cada throttle recebido reduz a taxa de reposição
+    pela metade (até min_rate) e cada chamada bem-sucedida a recupera aos poucos até max_rate.
+    """
+
+    def __init__(self, capacity, max_rate, min_rate=0.5, recovery_step=0.05):
+        self.capacity = capacity
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.recovery_step = recovery_step
+        self.tokens = float(capacity)
+        self.acquired = 0
+        self.throttles = 0
+        self.wait_seconds = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Consome um token, bloqueando até que haja um disponível. Retorna o tempo de espera."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.acquired += 1
+                    self.wait_seconds += waited
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Esvazia o bucket para que as threads em espera respeitem a nova taxa imediatamente
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery_step)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'max_rate': self.max_rate,
+                'current_rate': round(self.rate, 3),
+                'acquired': self.acquired,
+                'throttles': self.throttles,
+                'wait_seconds': round(self.wait_seconds, 3)
+            }
+
+
+class AwsRateLimiter:
+    """
+    Limitador de chamadas AWS compartilhado por todas as threads do processo, com um token bucket
+    por serviço e categoria de API ('describe' ou 'mutating'), que reproduz os buckets separados do EC2.
+    max_rate é o orçamento do processo por serviço (usado para dividir o limite de uma conta entre várias
+    execuções): além do bucket da categoria, toda chamada consome um token do bucket do serviço, então
+    describes e mutações somados nunca passam de max_rate.
+    Cada tentativa é cobrada: a primeira no before-call e os retries (após throttle ou erro transitório)
+    no request-created, que o botocore emite a cada nova tentativa.
+    """
+
+    def __init__(self, buckets=None, max_rate=None):
+        self.bucket_config = dict(buckets or EC2_THROTTLING_BUCKETS)
+        self.max_rate = max_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def service_key(service_model):
+        # Mesmo identificador presente no nome do evento request-created
+        return service_model.service_id.hyphenize()
+
+    def bucket(self, service_key, operation_name):
+        category = api_category(operation_name)
+        key = f'{service_key}.{category}'
+        with self._lock:
+            if key not in self._buckets:
+                capacity, rate = self.bucket_config[category]
+                if self.max_rate:
+                    rate = min(rate, self.max_rate)
+                    capacity = max(1, min(capacity, int(self.max_rate)))
+                self._buckets[key] = TokenBucket(capacity, rate)
+            return self._buckets[key]
+
+    def buckets(self, service_key, operation_name):
+        """Buckets cobrados por uma chamada: o da categoria e, com max_rate, o orçamento do serviço."""
+        buckets = [self.bucket(service_key, operation_name)]
+        if self.max_rate:
+            key = f'{service_key}.budget'
+            with self._lock:
+                if key not in self._buckets:
+                    self._buckets[key] = TokenBucket(max(1, int(self.max_rate)), self.max_rate)
+                buckets.append(self._buckets[key])
+        return buckets
+
+    def acquire(self, service_key, operation_name):
+        return sum(bucket.acquire() for bucket in self.buckets(service_key, operation_name))
+
+    def install(self, session=None):
+        """Registra o limitador na sessão informada (ou na sessão default do boto3), antes da criação dos clientes."""
+        if session is None:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        session.events.register('before-call.*.*', self._before_call)
+        session.events.register('request-created.*.*', self._request_created)
+        session.events.register('needs-retry.*.*', self._needs_retry)
+        session.events.register('after-call.*.*', self._after_call)
+        return session
+
+    def _before_call(self, model, **kwargs):
+        waited = self.acquire(self.service_key(model.service_model), model.name)
+        if waited > 1:
+            logging.debug(f"Chamada '{model.name}' aguardou {waited:.2f}s no limitador de taxa.")
+
+    def _request_created(self, request, operation_name, event_name, **kwargs):
+        # A primeira tentativa já foi cobrada no before-call; os retries não passam por ele
+        if getattr(request, 'context', {}).get('retries', {}).get('attempt', 1) <= 1:
+            return
+        service_key = event_name.split('.')[1]
+        waited = self.acquire(service_key, operation_name)
+        if waited > 1:
+            logging.debug(f"Retry de '{operation_name}' aguardou {waited:.2f}s no limitador de taxa.")
+
+    def _needs_retry(self, response, operation, **kwargs):
+        if response is None:
+            return None
+        error_code = response[1].get('Error', {}).get('Code')
+        if error_code in THROTTLING_ERROR_CODES:
+            for bucket in self.buckets(self.service_key(operation.service_model), operation.name):
+                bucket.on_throttle()
+            logging.warning(f"Throttle '{error_code}' em '{operation.name}'. Taxa de '{api_category(operation.name)}' reduzida para "
+                            f"{self.bucket(self.service_key(operation.service_model), operation.name).rate:.2f}/s.")
+        return None
+
+    def _after_call(self, http_response, model, **kwargs):
+        if http_response.status_code < 300:
+            for bucket in self.buckets(self.service_key(model.service_model), model.name):
+                bucket.on_success()
+
+    def metrics(self):
+        """Métricas por bucket (categoria e orçamento do serviço): taxa atual, chamadas, throttles e tempo total de espera."""
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {key: bucket.metrics() for key, bucket in sorted(buckets.items())}
+
+
+# Instância única do processo, compartilhada por todas as threads
+_process_rate_limiter = None
+_process_rate_limiter_lock = threading.Lock()
+
+
+def install_process_rate_limiter(max_rate=None, session=None):
+    """Cria (uma única vez) e instala o limitador de taxa do processo. Retorna a instância."""
+    global _process_rate_limiter
+    with _process_rate_limiter_lock:
+        if _process_rate_limiter is None:
+            _process_rate_limiter = AwsRateLimiter(max_rate=max_rate)
+            _process_rate_limiter.install(session)
+        return _process_rate_limiter
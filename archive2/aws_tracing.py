@@ -0,0 +1,217 @@
+import contextvars
+import datetime
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import boto3
+
+# Parâmetros das funções de passo registrados automaticamente como atributos do span
+TRACED_ARGUMENTS = ('vpc_id', 'region', 'az_name', 'az_suffix', 'subnet_id', 'route_table_id', 'sg_id',
+                    'nat_gateway_id', 'base_cidr_block', 'cidr_block', 'main_vpc_cidr')
+# Parâmetros das chamadas AWS registrados como atributos do span
+TRACED_API_PARAMS = ('VpcId', 'SubnetId', 'RouteTableId', 'NatGatewayId', 'GroupId', 'AvailabilityZone',
+                     'ServiceName', 'CidrBlock', 'AssociationId', 'NatGatewayIds', 'VpcEndpointIds', 'GroupIds')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, tracer, name, attributes, parent):
+        self.tracer = tracer
+        self.span_id = next(tracer._ids)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = dict(attributes)
+        self.status = 'ok'
+        self.thread_id = threading.get_ident()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.status = 'error'
+        self.attributes['error'] = str(error)
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Finalizado em outro contexto (ex.: outra thread): o contexto original não é alterado
+                pass
+        self.tracer._finished(self)
+
+
+class Tracer:
+    """
+    Tracing por spans com aninhamento (via contextvars), atributos e durações, para os passos dos
+    scripts e para cada chamada AWS (hooks do botocore). Exporta um trace no formato Chrome/Perfetto
+    (chrome://tracing, ui.perfetto.dev) e um log estruturado em JSON Lines.
+    Enquanto não estiver habilitado, spans e decorators não registram nada.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._trace_file = None
+        self._log_file = None
+
+    def enable(self, trace_file=None, log_file=None, session=None):
+        """Habilita o tracing e registra os hooks de chamadas AWS na sessão (default do boto3 se omitida)."""
+        self.enabled = True
+        self._trace_file = trace_file
+        self._log_file = log_file
+        if session is None:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        session.events.register('provide-client-params.*.*', self._api_call_started)
+        session.events.register('after-call.*.*', self._api_call_finished)
+        session.events.register('after-call-error.*.*', self._api_call_failed)
+        return session
+
+    def start_span(self, name, **attributes):
+        """Inicia um span como filho do span atual e o torna o span atual até finish()."""
+        if not self.enabled:
+            return None
+        span = Span(self, name, attributes, _current_span.get())
+        span._token = _current_span.set(span)
+        return span
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            if span is not None:
+                span.set_error(e)
+            raise
+        finally:
+            if span is not None:
+                span.finish()
+
+    def _finished(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def _api_call_started(self, params, model, context, **kwargs):
+        if not self.enabled:
+            return
+        attributes = {'aws.service': model.service_model.service_name, 'aws.operation': model.name}
+        for key in TRACED_API_PARAMS:
+            if key in params:
+                attributes[key] = params[key]
+        span = Span(self, f'aws.{model.service_model.service_name}.{model.name}', attributes, _current_span.get())
+        context['trace_span'] = span
+
+    def _api_call_finished(self, http_response, parsed, model, context, **kwargs):
+        span = context.pop('trace_span', None)
+        if span is None:
+            return
+        span.set_attribute('http.status_code', http_response.status_code)
+        if http_response.status_code >= 300:
+            span.set_error(parsed.get('Error', {}).get('Code', 'erro'))
+        for value in parsed.values():
+            # IDs dos recursos criados/retornados (ex.: NatGateway.NatGatewayId, Subnet.SubnetId)
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    if key.endswith('Id') and isinstance(item, str):
+                        span.set_attribute(f'response.{key}', item)
+        span.finish()
+
+    def _api_call_failed(self, exception, context, **kwargs):
+        span = context.pop('trace_span', None)
+        if span is not None:
+            span.set_error(exception)
+            span.finish()
+
+    def export(self):
+        """Grava o trace Chrome/Perfetto e o log JSON Lines configurados em enable()."""
+        if not self.enabled:
+            return
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.started_at)
+        pid = os.getpid()
+        if self._trace_file:
+            events = [{
+                'name': span.name,
+                'cat': 'aws' if span.name.startswith('aws.') else 'step',
+                'ph': 'X',
+                'ts': int(span.started_at * 1_000_000),
+                'dur': int(span.duration * 1_000_000),
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': dict(span.attributes, span_id=span.span_id, parent_id=span.parent_id, status=span.status)
+            } for span in spans]
+            with open(self._trace_file, 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+            logging.info(f"Trace com {len(events)} spans gravado em '{self._trace_file}'.")
+        if self._log_file:
+            with open(self._log_file, 'w') as f:
+                for span in spans:
+                    f.write(json.dumps({
+                        'span_id': span.span_id,
+                        'parent_id': span.parent_id,
+                        'name': span.name,
+                        'start': datetime.datetime.fromtimestamp(span.started_at, datetime.timezone.utc).isoformat(),
+                        'duration_ms': round(span.duration * 1000, 3),
+                        'status': span.status,
+                        'thread_id': span.thread_id,
+                        'attributes': span.attributes
+                    }, default=str) + '\n')
+
+
+# Tracer do processo, usado pelos decorators dos scripts
+TRACER = Tracer()
+
+
+def with_current_span(function):
+    """
+    Envolve function para que, executada em outra thread (ex.: ThreadPoolExecutor, que não copia os
+    contextvars), seus spans sejam filhos do span atual de quem a submeteu.
+    """
+    parent = _current_span.get()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return wrapper
+
+
+def traced(name=None):
+    """Decorator que envolve a função em um span, registrando como atributos os argumentos de TRACED_ARGUMENTS."""
+    def decorator(function):
+        signature = inspect.signature(function)
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return function(*args, **kwargs)
+            bound = signature.bind_partial(*args, **kwargs)
+            attributes = {key: value for key, value in bound.arguments.items() if key in TRACED_ARGUMENTS}
+            with TRACER.span(span_name, **attributes):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
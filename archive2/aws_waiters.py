@@ -0,0 +1,194 @@
+import logging
+import math
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+# Evento global de cancelamento: quando setado, todos os waiters em andamento são interrompidos
+CANCEL_EVENT = threading.Event()
+
+
+class WaiterError(Exception):
+    """Erro base dos waiters."""
+
+
+class WaiterTimeout(WaiterError):
+    """O prazo total do waiter terminou antes de os recursos ficarem prontos."""
+
+
+class WaiterCancelled(WaiterError):
+    """O waiter foi cancelado (ex.: a pipeline recebeu SIGTERM)."""
+
+
+class WaiterFailed(WaiterError):
+    """Um ou mais recursos entraram em um estado terminal de falha."""
+
+
+class PollSchedule:
+    """
+    Intervalos de polling exponenciais até max_delay e depois constantes:
+    com initial_delay=1, factor=2 e max_delay=10 os intervalos são 1, 2, 4, 8, 10, 10, ...
+    """
+
+    def __init__(self, initial_delay=1.0, factor=2.0, max_delay=10.0):
+        self.initial_delay = initial_delay
+        self.factor = factor
+        self.max_delay = max_delay
+
+    def delays(self):
+        delay = self.initial_delay
+        while True:
+            yield min(delay, self.max_delay)
+            delay *= self.factor
+
+
+class WaitMetrics:
+    """Registra, por tipo de recurso, o tempo até ficar pronto e o número de polls de cada recurso."""
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, resource_type, resource_id, seconds, polls, outcome):
+        with self._lock:
+            self._samples.setdefault(resource_type, []).append({
+                'resource_id': resource_id,
+                'seconds': round(seconds, 3),
+                'polls': polls,
+                'outcome': outcome
+            })
+
+    def summary(self):
+        """Distribuição (p50/p90/máx) do tempo até ficar pronto por tipo de recurso, mais as amostras."""
+        with self._lock:
+            samples = {resource_type: list(items) for resource_type, items in self._samples.items()}
+        result = {}
+        for resource_type, items in samples.items():
+            ready = sorted(item['seconds'] for item in items if item['outcome'] == 'ready')
+            result[resource_type] = {
+                'count': len(items),
+                'ready': len(ready),
+                'p50_seconds': _percentile(ready, 50),
+                'p90_seconds': _percentile(ready, 90),
+                'max_seconds': ready[-1] if ready else None,
+                'total_polls': sum(item['polls'] for item in items),
+                'samples': items
+            }
+        return result
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    # Nearest-rank
+    index = max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+# Métricas do processo, incluídas no relatório da execução
+WAIT_METRICS = WaitMetrics()
+
+
+def wait_for_resources(describe_states, resource_ids, resource_type, ready_states, failed_states=(),
+                       schedule=None, deadline_seconds=600, cancel_event=CANCEL_EVENT, started_at=None):
+    """
+    Aguarda vários recursos em lote: a cada poll describe_states(ids_pendentes) deve retornar
+    {resource_id: estado} com uma única chamada de API. Recursos ausentes da resposta continuam pendentes.
+    started_at (time.monotonic()) permite medir o tempo até ficar pronto a partir da criação do recurso.
+    Retorna {resource_id: estado_final}; levanta WaiterFailed, WaiterTimeout ou WaiterCancelled.
+    """
+    schedule = schedule or PollSchedule()
+    started_at = started_at or time.monotonic()
+    deadline = time.monotonic() + deadline_seconds
+    pending = list(dict.fromkeys(resource_ids))
+    final_states = {}
+    polls = 0
+
+    for delay in schedule.delays():
+        if not pending:
+            break
+        polls += 1
+        states = describe_states(pending)
+        now = time.monotonic()
+        still_pending = []
+        for resource_id in pending:
+            state = states.get(resource_id)
+            if state in ready_states:
+                final_states[resource_id] = state
+                WAIT_METRICS.record(resource_type, resource_id, now - started_at, polls, 'ready')
+                logging.info(f"{resource_type} '{resource_id}' está '{state}' após {now - started_at:.1f}s ({polls} polls).")
+            elif state in failed_states:
+                final_states[resource_id] = state
+                WAIT_METRICS.record(resource_type, resource_id, now - started_at, polls, 'failed')
+            else:
+                still_pending.append(resource_id)
+        pending = still_pending
+
+        failed = {resource_id: state for resource_id, state in final_states.items() if state in failed_states}
+        if failed:
+            raise WaiterFailed(f"{resource_type}: recursos em estado de falha: {failed}")
+        if not pending:
+            break
+        if now + delay > deadline:
+            for resource_id in pending:
+                WAIT_METRICS.record(resource_type, resource_id, now - started_at, polls, 'timeout')
+            raise WaiterTimeout(f"{resource_type}: prazo de {deadline_seconds}s esgotado aguardando {pending}.")
+        # wait() retorna True se o cancelamento for solicitado durante a espera
+        if cancel_event.wait(delay):
+            for resource_id in pending:
+                WAIT_METRICS.record(resource_type, resource_id, time.monotonic() - started_at, polls, 'cancelled')
+            raise WaiterCancelled(f"{resource_type}: espera cancelada aguardando {pending}.")
+    return final_states
+
+
+def _not_found_as_pending(describe, not_found_code):
+    """Recursos recém-criados podem ainda não aparecer no describe (consistência eventual): tratados como pendentes."""
+    def wrapper(resource_ids):
+        try:
+            return describe(resource_ids)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == not_found_code:
+                return {}
+            raise
+    return wrapper
+
+
+def nat_gateway_states(ec2_client):
+    """Função describe_states para NAT Gateways (uma chamada describe_nat_gateways por poll)."""
+    def describe(nat_gateway_ids):
+        response = ec2_client.describe_nat_gateways(NatGatewayIds=nat_gateway_ids)
+        return {nat['NatGatewayId']: nat['State'] for nat in response['NatGateways']}
+    return _not_found_as_pending(describe, 'NatGatewayNotFound')
+
+
+def vpc_endpoint_states(ec2_client):
+    """Função describe_states para VPC Endpoints (uma chamada describe_vpc_endpoints por poll)."""
+    def describe(vpc_endpoint_ids):
+        response = ec2_client.describe_vpc_endpoints(VpcEndpointIds=vpc_endpoint_ids)
+        return {endpoint['VpcEndpointId']: endpoint['State'].lower() for endpoint in response['VpcEndpoints']}
+    return _not_found_as_pending(describe, 'InvalidVpcEndpointId.NotFound')
+
+
+def _missing_as_deleted(describe):
+    """Na remoção, um recurso que não aparece mais no describe já foi excluído."""
+    def wrapper(resource_ids):
+        states = describe(resource_ids)
+        return {resource_id: states.get(resource_id, 'deleted') for resource_id in resource_ids}
+    return wrapper
+
+
+def nat_gateway_deletion_states(ec2_client):
+    """Função describe_states para aguardar a remoção de NAT Gateways (filtro por ID não falha para IDs inexistentes)."""
+    def describe(nat_gateway_ids):
+        response = ec2_client.describe_nat_gateways(Filters=[{'Name': 'nat-gateway-id', 'Values': nat_gateway_ids}])
+        return {nat['NatGatewayId']: nat['State'] for nat in response['NatGateways']}
+    return _missing_as_deleted(describe)
+
+
+def vpc_endpoint_deletion_states(ec2_client):
+    """Função describe_states para aguardar a remoção de VPC Endpoints (e a liberação das ENIs de interface)."""
+    def describe(vpc_endpoint_ids):
+        response = ec2_client.describe_vpc_endpoints(Filters=[{'Name': 'vpc-endpoint-id', 'Values': vpc_endpoint_ids}])
+        return {endpoint['VpcEndpointId']: endpoint['State'].lower() for endpoint in response['VpcEndpoints']}
+    return _missing_as_deleted(describe)
@@ -0,0 +1,101 @@
+import argparse
+import compileall
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipapp
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Scripts e módulos das ferramentas de rede incluídos no bundle
+APP_FILES = [
+    'networking-setup.py',
+    'networking-fanout.py',
+    'networking-teardown.py',
+    'aws_cassette.py',
+    'aws_metadata_cache.py',
+    'aws_rate_limiter.py',
+    'aws_tracing.py',
+    'aws_waiters.py',
+    'cidr_allocator.py',
+    'nat_subnet_selector.py',
+    'run_lock.py'
+]
+# Serviços cujos modelos do botocore são mantidos no bundle (o restante é removido)
+DEFAULT_SERVICES = ['dynamodb', 'ec2', 'sts']
+
+def install_vendor(vendor_dir, requirements_file):
+    """Instala as dependências fixadas em requirements.txt no diretório vendor do bundle."""
+    logging.info(f"Instalando dependências de '{requirements_file}' em '{vendor_dir}'.")
+    subprocess.run(
+        # --no-deps: requirements.txt já fixa o fechamento completo das dependências
+        [sys.executable, '-m', 'pip', 'install', '--quiet', '--no-deps',
+         '--target', vendor_dir, '-r', requirements_file],
+        check=True
+    )
+    # Metadados de instalação e scripts não são usados em tempo de execução
+    for entry in os.listdir(vendor_dir):
+        if entry.endswith(('.dist-info', '.egg-info')) or entry == 'bin':
+            shutil.rmtree(os.path.join(vendor_dir, entry))
+
+def trim_botocore_data(vendor_dir, services):
+    """Remove do botocore os modelos de serviço não usados, mantendo os arquivos globais (endpoints, partições)."""
+    data_dir = os.path.join(vendor_dir, 'botocore', 'data')
+    removed = 0
+    for entry in os.listdir(data_dir):
+        entry_path = os.path.join(data_dir, entry)
+        if os.path.isdir(entry_path) and entry not in services:
+            shutil.rmtree(entry_path)
+            removed += 1
+    logging.info(f"{removed} modelos de serviço removidos do botocore; mantidos: {services}.")
+
+def compute_bundle_id(root_dir):
+    """Hash do conteúdo do bundle, usado como nome do diretório de extração no cache."""
+    digest = hashlib.sha256()
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(dir_path, file_name)
+            digest.update(os.path.relpath(file_path, root_dir).encode())
+            with open(file_path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um bundle executável (.pyz) das ferramentas de rede com dependências vendorizadas.")
+    parser.add_argument('--output', type=str, default='networking.pyz', help='Arquivo .pyz gerado.')
+    parser.add_argument('--requirements', type=str, default=os.path.join(SOURCE_DIR, 'requirements.txt'), help='Dependências fixadas a vendorizar.')
+    parser.add_argument('--services', nargs='+', default=DEFAULT_SERVICES, help='Serviços AWS cujos modelos do botocore são mantidos.')
+    parser.add_argument('--python', type=str, default='/usr/bin/env python3', help='Interpretador usado na linha shebang do bundle.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        app_dir = os.path.join(build_dir, 'app')
+        vendor_dir = os.path.join(build_dir, 'vendor')
+        os.makedirs(app_dir)
+
+        for file_name in APP_FILES:
+            shutil.copy2(os.path.join(SOURCE_DIR, file_name), app_dir)
+        shutil.copy2(os.path.join(SOURCE_DIR, 'bundle_main.py'), os.path.join(build_dir, '__main__.py'))
+
+        install_vendor(vendor_dir, args.requirements)
+        trim_botocore_data(vendor_dir, args.services)
+
+        # Bytecode pré-compilado evita a compilação na primeira execução do pipeline
+        compileall.compile_dir(build_dir, quiet=1, optimize=0)
+
+        with open(os.path.join(build_dir, 'BUNDLE_ID'), 'w') as f:
+            f.write(compute_bundle_id(build_dir))
+
+        zipapp.create_archive(build_dir, target=args.output, interpreter=args.python, compressed=True)
+
+    logging.info(f"Bundle '{args.output}' gerado ({os.path.getsize(args.output) / 1024 / 1024:.1f} MiB).")
+
+if __name__ == "__main__":
+    main()
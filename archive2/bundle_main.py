@@ -0,0 +1,67 @@
+"""
+Ponto de entrada (__main__.py) do bundle executável das ferramentas de rede gerado pelo build-bundle.py.
+Na primeira execução o conteúdo do bundle é extraído para um diretório de cache (o botocore precisa
+dos arquivos de modelo no sistema de arquivos); as execuções seguintes apenas reutilizam esse diretório.
+
+Uso: python networking.pyz {setup,fanout,teardown} [argumentos do script]
+"""
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+_BOOTSTRAP_STARTED = time.perf_counter()
+
+ENTRY_POINTS = {
+    'setup': 'networking-setup.py',
+    'fanout': 'networking-fanout.py',
+    'teardown': 'networking-teardown.py'
+}
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'networking-bundle')
+
+
+def extract_bundle(archive_path):
+    """Extrai o bundle para o cache (uma única vez por BUNDLE_ID) e retorna o diretório extraído."""
+    with zipfile.ZipFile(archive_path) as archive:
+        bundle_id = archive.read('BUNDLE_ID').decode().strip()
+        cache_dir = os.environ.get('NETWORKING_BUNDLE_CACHE', DEFAULT_CACHE_DIR)
+        bundle_dir = os.path.join(cache_dir, bundle_id)
+        if os.path.isdir(bundle_dir):
+            return bundle_dir
+
+        os.makedirs(cache_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=f'.{bundle_id}-', dir=cache_dir)
+        archive.extractall(staging_dir)
+    try:
+        # rename é atômico: execuções concorrentes nunca enxergam uma extração parcial
+        os.rename(staging_dir, bundle_dir)
+    except OSError:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if not os.path.isdir(bundle_dir):
+            raise
+    return bundle_dir
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ENTRY_POINTS:
+        print(f"Uso: python {os.path.basename(sys.argv[0])} {{{','.join(ENTRY_POINTS)}}} [argumentos]", file=sys.stderr)
+        sys.exit(2)
+
+    archive_path = os.path.dirname(os.path.abspath(__file__))
+    bundle_dir = extract_bundle(archive_path)
+    search_paths = [os.path.join(bundle_dir, 'app'), os.path.join(bundle_dir, 'vendor')]
+    sys.path[0:0] = search_paths
+    # Subprocessos (ex.: o runner de múltiplas VPCs) também precisam enxergar as dependências vendorizadas
+    os.environ['PYTHONPATH'] = os.pathsep.join(search_paths + [p for p in [os.environ.get('PYTHONPATH')] if p])
+    os.environ['NETWORKING_BUNDLE_BOOTSTRAP_SECONDS'] = f"{time.perf_counter() - _BOOTSTRAP_STARTED:.4f}"
+
+    script = os.path.join(bundle_dir, 'app', ENTRY_POINTS[sys.argv[1]])
+    sys.argv = [script] + sys.argv[2:]
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
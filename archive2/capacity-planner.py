@@ -0,0 +1,298 @@
+import argparse
+import datetime
+import json
+import logging
+import math
+import signal
+import sqlite3
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # O numpy é opcional (não faz parte do bundle): sem ele a regressão é feita em Python puro
+    np = None
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SECONDS_PER_DAY = 86400
+# Endereços reservados pela AWS em toda subnet
+AWS_RESERVED_IPS_PER_SUBNET = 5
+# Limites de tamanho de subnet na AWS (/16 a /28)
+MIN_SUBNET_PREFIX_LENGTH = 16
+MAX_SUBNET_PREFIX_LENGTH = 28
+# Tipos de subnet criados pelo networking-setup.py (tags '<tipo>-non-routable-<az>')
+SUBNET_TYPES = ('app', 'database')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subnet_snapshots (
+    captured_at REAL NOT NULL,
+    region TEXT NOT NULL,
+    vpc_id TEXT NOT NULL,
+    subnet_id TEXT NOT NULL,
+    availability_zone TEXT,
+    cidr_block TEXT,
+    name TEXT,
+    total_ips INTEGER NOT NULL,
+    available_ips INTEGER NOT NULL,
+    eni_count INTEGER NOT NULL,
+    PRIMARY KEY (subnet_id, captured_at)
+);
+CREATE INDEX IF NOT EXISTS subnet_snapshots_captured_at ON subnet_snapshots (captured_at);
+"""
+
+def open_store(store_file):
+    """Abre (criando se preciso) a série temporal local de capacidade das subnets em SQLite."""
+    connection = sqlite3.connect(store_file)
+    connection.executescript(SCHEMA)
+    return connection
+
+def capture_capacity(vpc_ids, region):
+    """Coleta, por subnet, os IPs livres (AvailableIpAddressCount) e o número de ENIs das VPCs informadas."""
+    import boto3 # Importado aqui: a análise offline não depende do boto3
+    ec2_client = boto3.client('ec2', region_name=region)
+
+    def paginate(operation, key, **kwargs):
+        items = []
+        for page in ec2_client.get_paginator(operation).paginate(**kwargs):
+            items.extend(page[key])
+        return items
+
+    captured_at = time.time()
+    rows = []
+    for vpc_id in vpc_ids:
+        vpc_filter = [{'Name': 'vpc-id', 'Values': [vpc_id]}]
+        eni_counts = {}
+        for interface in paginate('describe_network_interfaces', 'NetworkInterfaces', Filters=vpc_filter):
+            eni_counts[interface['SubnetId']] = eni_counts.get(interface['SubnetId'], 0) + 1
+        for subnet in paginate('describe_subnets', 'Subnets', Filters=vpc_filter):
+            prefix_length = int(subnet['CidrBlock'].split('/')[1])
+            rows.append({
+                'captured_at': captured_at,
+                'region': region,
+                'vpc_id': vpc_id,
+                'subnet_id': subnet['SubnetId'],
+                'availability_zone': subnet['AvailabilityZone'],
+                'cidr_block': subnet['CidrBlock'],
+                'name': next((tag['Value'] for tag in subnet.get('Tags', []) if tag['Key'] == 'Name'), None),
+                'total_ips': 2 ** (32 - prefix_length) - AWS_RESERVED_IPS_PER_SUBNET,
+                'available_ips': subnet['AvailableIpAddressCount'],
+                'eni_count': eni_counts.get(subnet['SubnetId'], 0)
+            })
+    return rows
+
+def store_snapshot(connection, rows):
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO subnet_snapshots VALUES (:captured_at, :region, :vpc_id, :subnet_id, :availability_zone, "
+            ":cidr_block, :name, :total_ips, :available_ips, :eni_count)",
+            rows
+        )
+
+def load_series(connection, since):
+    """Amostras desde o instante informado (epoch), ordenadas por subnet e por instante."""
+    cursor = connection.execute(
+        "SELECT captured_at, region, vpc_id, subnet_id, availability_zone, cidr_block, name, total_ips, available_ips, eni_count "
+        "FROM subnet_snapshots WHERE captured_at >= ? ORDER BY subnet_id, captured_at",
+        (since,)
+    )
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+def _grouped_slopes(group_index, days, values, group_count):
+    """
+    Inclinação da regressão linear (mínimos quadrados) de values em função de days, por grupo.
+    Com numpy todas as subnets são calculadas de uma vez (somas por grupo com bincount).
+    Grupos com uma única amostra (ou todas no mesmo instante) têm inclinação 0.
+    """
+    if np is not None:
+        group_index = np.asarray(group_index)
+        days = np.asarray(days, dtype=float)
+        values = np.asarray(values, dtype=float)
+        counts = np.bincount(group_index, minlength=group_count)
+        mean_days = np.bincount(group_index, days, group_count) / counts
+        mean_values = np.bincount(group_index, values, group_count) / counts
+        centered_days = days - mean_days[group_index]
+        covariance = np.bincount(group_index, centered_days * (values - mean_values[group_index]), group_count)
+        variance = np.bincount(group_index, centered_days ** 2, group_count)
+        slopes = np.zeros(group_count)
+        np.divide(covariance, variance, out=slopes, where=variance > 0)
+        return slopes.tolist()
+
+    sums = [[0, 0.0, 0.0] for _ in range(group_count)]
+    for group, day, value in zip(group_index, days, values):
+        sums[group][0] += 1
+        sums[group][1] += day
+        sums[group][2] += value
+    means = [(total_days / count, total_values / count) for count, total_days, total_values in sums]
+    covariance = [0.0] * group_count
+    variance = [0.0] * group_count
+    for group, day, value in zip(group_index, days, values):
+        centered_day = day - means[group][0]
+        covariance[group] += centered_day * (value - means[group][1])
+        variance[group] += centered_day ** 2
+    return [cov / var if var > 0 else 0.0 for cov, var in zip(covariance, variance)]
+
+def forecast_exhaustion(samples, now=None, warn_days=90):
+    """
+    Ajusta, por subnet, o crescimento diário de IPs em uso e de ENIs e projeta a data de esgotamento
+    (IPs livres da última amostra / crescimento diário). Subnets sem crescimento não têm data.
+    """
+    now = now or time.time()
+    subnet_ids = []
+    group_by_subnet = {}
+    latest = {}
+    group_index, days, used_ips, eni_counts = [], [], [], []
+    for sample in samples:
+        subnet_id = sample['subnet_id']
+        if subnet_id not in group_by_subnet:
+            group_by_subnet[subnet_id] = len(subnet_ids)
+            subnet_ids.append(subnet_id)
+        group_index.append(group_by_subnet[subnet_id])
+        days.append(sample['captured_at'] / SECONDS_PER_DAY)
+        used_ips.append(sample['total_ips'] - sample['available_ips'])
+        eni_counts.append(sample['eni_count'])
+        latest[subnet_id] = sample
+    if not subnet_ids:
+        return []
+
+    ip_growth = _grouped_slopes(group_index, days, used_ips, len(subnet_ids))
+    eni_growth = _grouped_slopes(group_index, days, eni_counts, len(subnet_ids))
+    sample_counts = [0] * len(subnet_ids)
+    for group in group_index:
+        sample_counts[group] += 1
+
+    forecasts = []
+    for group, subnet_id in enumerate(subnet_ids):
+        sample = latest[subnet_id]
+        days_to_exhaustion = None
+        exhaustion_date = None
+        if ip_growth[group] > 0:
+            days_to_exhaustion = sample['available_ips'] / ip_growth[group]
+            exhaustion_date = datetime.datetime.fromtimestamp(
+                sample['captured_at'] + days_to_exhaustion * SECONDS_PER_DAY, datetime.timezone.utc
+            ).date().isoformat()
+        used = sample['total_ips'] - sample['available_ips']
+        forecasts.append({
+            'vpc_id': sample['vpc_id'],
+            'subnet_id': subnet_id,
+            'name': sample['name'],
+            'availability_zone': sample['availability_zone'],
+            'cidr_block': sample['cidr_block'],
+            'samples': sample_counts[group],
+            'total_ips': sample['total_ips'],
+            'available_ips': sample['available_ips'],
+            'eni_count': sample['eni_count'],
+            'ips_per_eni': round(used / sample['eni_count'], 2) if sample['eni_count'] else None,
+            'ip_growth_per_day': round(ip_growth[group], 3),
+            'eni_growth_per_day': round(eni_growth[group], 3),
+            'days_to_exhaustion': round(days_to_exhaustion, 1) if days_to_exhaustion is not None else None,
+            'exhaustion_date': exhaustion_date,
+            'at_risk': days_to_exhaustion is not None and days_to_exhaustion <= warn_days
+        })
+    forecasts.sort(key=lambda item: (item['days_to_exhaustion'] is None, item['days_to_exhaustion'] or 0))
+    return forecasts
+
+def subnet_type(name):
+    for tag_type in SUBNET_TYPES:
+        if name and name.startswith(f'{tag_type}-non-routable-'):
+            return tag_type
+    return None
+
+def recommend_prefix_lengths(forecasts, horizon_days=365, ips_per_eni=None, headroom=0.3):
+    """
+    Recomenda o prefixo de cada tipo de subnet do create_subnets a partir da densidade projetada:
+    ENIs projetadas (atuais + crescimento diário * horizonte, na AZ mais carregada) * IPs por ENI
+    (observado, ou ips_per_eni para densidade de pods planejada) * (1 + headroom), mais os 5 IPs reservados.
+    """
+    recommendations = {}
+    for forecast in forecasts:
+        tag_type = subnet_type(forecast['name'])
+        if tag_type is None:
+            continue
+        projected_enis = forecast['eni_count'] + max(forecast['eni_growth_per_day'], 0) * horizon_days
+        density = ips_per_eni or forecast['ips_per_eni'] or 1.0
+        required_ips = math.ceil(projected_enis * density * (1 + headroom)) + AWS_RESERVED_IPS_PER_SUBNET
+        prefix_length = 32 - math.ceil(math.log2(max(required_ips, 1)))
+        prefix_length = min(MAX_SUBNET_PREFIX_LENGTH, max(MIN_SUBNET_PREFIX_LENGTH, prefix_length))
+        current = recommendations.get(tag_type)
+        if current is None or prefix_length < current['prefix_length']:
+            recommendations[tag_type] = {
+                'prefix_length': prefix_length,
+                'required_ips': required_ips,
+                'projected_enis': round(projected_enis, 1),
+                'ips_per_eni': density,
+                'sizing_subnet_id': forecast['subnet_id']
+            }
+    return recommendations
+
+def main():
+    parser = argparse.ArgumentParser(description="Acompanha a capacidade de IPs das subnets, projeta o esgotamento e recomenda prefixos para novas subnets.")
+    parser.add_argument('--store', type=str, default='subnet-capacity.db', help='Arquivo SQLite da série temporal de capacidade.')
+    parser.add_argument('--capture', action='store_true', help='Coleta um snapshot das VPCs informadas em --vpc-ids em vez de analisar.')
+    parser.add_argument('--vpc-ids', nargs='+', default=[], help='VPCs a coletar (somente com --capture).')
+    parser.add_argument('--region', type=str, default='sa-east-1', help='Região AWS usada na coleta.')
+    parser.add_argument('--interval', type=float, help='Coleta continuamente a cada N segundos (somente com --capture) até SIGTERM/SIGINT.')
+    parser.add_argument('--window-days', type=float, default=30, help='Janela de amostras (dias) usada no ajuste do crescimento.')
+    parser.add_argument('--warn-days', type=float, default=90, help='Subnets com esgotamento projetado dentro deste prazo (dias) são sinalizadas.')
+    parser.add_argument('--horizon-days', type=float, default=365, help='Horizonte (dias) de crescimento considerado na recomendação de prefixo.')
+    parser.add_argument('--ips-per-eni', type=float, help='IPs por ENI planejados (e.g., pods por nó); por padrão usa a densidade observada.')
+    parser.add_argument('--headroom', type=float, default=0.3, help='Folga proporcional sobre os IPs projetados na recomendação de prefixo.')
+    parser.add_argument('--fail-on-risk', action='store_true', help='Termina com código 1 se alguma subnet tiver esgotamento projetado dentro de --warn-days.')
+    parser.add_argument('--report', type=str, help='Arquivo JSON onde a projeção e as recomendações serão gravadas.')
+    args = parser.parse_args()
+
+    connection = open_store(args.store)
+
+    if args.capture:
+        if not args.vpc_ids:
+            logging.error("Informe --vpc-ids para coletar a capacidade das subnets.")
+            exit(1)
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        while True:
+            try:
+                rows = capture_capacity(args.vpc_ids, args.region)
+                store_snapshot(connection, rows)
+                logging.info(f"Capacidade de {len(rows)} subnets em {len(args.vpc_ids)} VPCs gravada em '{args.store}'.")
+            except Exception as e:
+                logging.error(f"Erro ao coletar a capacidade das subnets: {e}")
+                if not args.interval:
+                    exit(1)
+            if not args.interval or stop.wait(args.interval):
+                return
+
+    now = time.time()
+    samples = load_series(connection, now - args.window_days * SECONDS_PER_DAY)
+    if not samples:
+        logging.error(f"Nenhuma amostra nos últimos {args.window_days} dias em '{args.store}'. Execute com --capture primeiro.")
+        exit(1)
+
+    forecasts = forecast_exhaustion(samples, now=now, warn_days=args.warn_days)
+    recommendations = recommend_prefix_lengths(forecasts, args.horizon_days, args.ips_per_eni, args.headroom)
+
+    for forecast in forecasts:
+        if forecast['at_risk']:
+            logging.warning(f"Subnet '{forecast['subnet_id']}' ({forecast['name'] or forecast['cidr_block']}) da VPC '{forecast['vpc_id']}': "
+                            f"{forecast['available_ips']} IPs livres, +{forecast['ip_growth_per_day']} IPs/dia, "
+                            f"esgotamento projetado em {forecast['exhaustion_date']} ({forecast['days_to_exhaustion']} dias).")
+    at_risk = sum(1 for forecast in forecasts if forecast['at_risk'])
+    logging.info(f"{len(forecasts)} subnets analisadas ({len(samples)} amostras, regressão {'numpy' if np is not None else 'Python'}): "
+                 f"{at_risk} com esgotamento projetado em até {args.warn_days} dias.")
+    if recommendations:
+        overrides = ' '.join(f"{tag_type}={recommendation['prefix_length']}" for tag_type, recommendation in sorted(recommendations.items()))
+        logging.info(f"Prefixos recomendados para um horizonte de {args.horizon_days} dias: --subnet-prefix-overrides {overrides}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'generated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(), 'window_days': args.window_days,
+                       'forecasts': forecasts, 'recommendations': recommendations}, f, indent=2)
+
+    if args.fail_on_risk and at_risk:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
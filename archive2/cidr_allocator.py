@@ -0,0 +1,117 @@
+import bisect
+import ipaddress
+
+ALLOCATION_STRATEGIES = ('first-fit', 'best-fit')
+
+
+class CidrAllocator:
+    """
+    Alocador de blocos CIDR dentro de um pool, ciente dos ranges já ocupados na VPC.
+    Os ranges ocupados são mantidos como intervalos [inicio, fim] (inteiros) ordenados e
+    mesclados, então nenhum bloco candidato é materializado: cada alocação percorre apenas
+    os intervalos livres. Para o mesmo pool e os mesmos ranges ocupados o resultado é sempre o mesmo.
+    """
+
+    def __init__(self, pool_cidr, occupied_cidrs=(), strategy='first-fit'):
+        if strategy not in ALLOCATION_STRATEGIES:
+            raise ValueError(f"Estratégia de alocação inválida '{strategy}'. Use uma de {ALLOCATION_STRATEGIES}.")
+        self.pool = ipaddress.ip_network(pool_cidr)
+        self.strategy = strategy
+        self._pool_start = int(self.pool.network_address)
+        self._pool_end = int(self.pool.broadcast_address)
+        self._starts = []
+        self._ends = []
+        for cidr in occupied_cidrs:
+            self.mark_occupied(cidr)
+
+    def mark_occupied(self, cidr):
+        """
+        Marca um CIDR como ocupado. CIDRs fora do pool (ou de outra versão de IP) são ignorados;
+        CIDRs que cruzam a borda do pool são recortados.
+        """
+        network = ipaddress.ip_network(cidr)
+        if network.version != self.pool.version:
+            return
+        start = max(int(network.network_address), self._pool_start)
+        end = min(int(network.broadcast_address), self._pool_end)
+        if start > end:
+            return
+        self._insert_interval(start, end)
+
+    def _insert_interval(self, start, end):
+        idx = bisect.bisect_left(self._starts, start)
+        # Mescla com o intervalo anterior se houver sobreposição ou adjacência
+        if idx > 0 and self._ends[idx - 1] >= start - 1:
+            idx -= 1
+            start = self._starts[idx]
+            end = max(end, self._ends[idx])
+            del self._starts[idx], self._ends[idx]
+        # Mescla com os intervalos seguintes que ficarem cobertos ou adjacentes
+        while idx < len(self._starts) and self._starts[idx] <= end + 1:
+            end = max(end, self._ends[idx])
+            del self._starts[idx], self._ends[idx]
+        self._starts.insert(idx, start)
+        self._ends.insert(idx, end)
+
+    def free_ranges(self):
+        """Gera os intervalos livres (inicio, fim) do pool em ordem crescente de endereço."""
+        cursor = self._pool_start
+        for start, end in zip(self._starts, self._ends):
+            if start > cursor:
+                yield cursor, start - 1
+            cursor = end + 1
+        if cursor <= self._pool_end:
+            yield cursor, self._pool_end
+
+    def _first_aligned_block(self, gap_start, gap_end, block_size):
+        aligned = -(-gap_start // block_size) * block_size
+        if aligned + block_size - 1 <= gap_end:
+            return aligned
+        return None
+
+    def allocate(self, prefix_length):
+        """
+        Aloca um bloco com o prefixo informado e o marca como ocupado.
+        first-fit escolhe o primeiro intervalo livre onde o bloco cabe; best-fit escolhe o menor
+        intervalo livre onde o bloco cabe (empates resolvidos pelo menor endereço).
+        Retorna um ipaddress.IPv4Network/IPv6Network ou None se não houver espaço.
+        """
+        if prefix_length < self.pool.prefixlen or prefix_length > self.pool.max_prefixlen:
+            raise ValueError(f"Prefixo /{prefix_length} incompatível com o pool '{self.pool}'.")
+        block_size = 1 << (self.pool.max_prefixlen - prefix_length)
+
+        chosen = None
+        chosen_gap_size = None
+        for gap_start, gap_end in self.free_ranges():
+            block_start = self._first_aligned_block(gap_start, gap_end, block_size)
+            if block_start is None:
+                continue
+            if self.strategy == 'first-fit':
+                chosen = block_start
+                break
+            gap_size = gap_end - gap_start + 1
+            if chosen_gap_size is None or gap_size < chosen_gap_size:
+                chosen = block_start
+                chosen_gap_size = gap_size
+
+        if chosen is None:
+            return None
+        self._insert_interval(chosen, chosen + block_size - 1)
+        return ipaddress.ip_network((chosen, prefix_length))
+
+    def allocate_many(self, prefix_lengths):
+        """
+        Aloca vários blocos (prefixos mistos) em uma única requisição.
+        Os blocos maiores são alocados primeiro para reduzir fragmentação, mas o retorno segue
+        a ordem de prefix_lengths. Se algum bloco não couber, nada é alocado e None é retornado.
+        """
+        order = sorted(range(len(prefix_lengths)), key=lambda i: (prefix_lengths[i], i))
+        saved_starts, saved_ends = list(self._starts), list(self._ends)
+        allocated = [None] * len(prefix_lengths)
+        for i in order:
+            block = self.allocate(prefix_lengths[i])
+            if block is None:
+                self._starts, self._ends = saved_starts, saved_ends
+                return None
+            allocated[i] = block
+        return allocated
@@ -0,0 +1,112 @@
+import ipaddress
+
+# Endereços reservados pela AWS em toda subnet (rede, roteador, DNS, uso futuro e broadcast)
+AWS_RESERVED_IPS_PER_SUBNET = 5
+# Folga mínima de IPs livres para criar um NAT Gateway: a ENI do NAT (e IPs secundários de um NAT privado)
+# precisa de endereços, e subnets quase esgotadas fazem a criação falhar só depois da espera de vários minutos
+DEFAULT_MIN_FREE_IPS = 16
+MANAGED_TAG = ('ManagedBy', 'HarnessPipeline')
+
+
+def build_tag_index(resources, id_key):
+    """Índice {id: {chave_da_tag: valor}} montado uma única vez para consultar tags em O(1)."""
+    return {resource[id_key]: {tag['Key']: tag['Value'] for tag in resource.get('Tags', [])} for resource in resources}
+
+
+class NatSubnetSelector:
+    """
+    Escolhe uma subnet por AZ para os NAT Gateways, entre as subnets 'available' contidas no CIDR informado.
+    Subnets com menos de min_free_ips IPs livres são descartadas. As demais são ordenadas por:
+      1. NAT Gateway gerenciado (ManagedBy=HarnessPipeline) já existente na subnet: reutilizado em re-execuções;
+      2. menor número de NAT Gateways não gerenciados na subnet;
+      3. tag Name contendo 'public';
+      4. menor ocupação de IPs (densidade de ENIs) e, em seguida, mais IPs livres.
+    Cada escolha (ou ausência de escolha) vem acompanhada de uma explicação.
+    """
+
+    def __init__(self, subnets, nat_gateways=(), min_free_ips=DEFAULT_MIN_FREE_IPS):
+        self.subnets = [subnet for subnet in subnets if subnet.get('State', 'available') == 'available']
+        self.min_free_ips = min_free_ips
+        self.subnet_tags = build_tag_index(self.subnets, 'SubnetId')
+        nat_tags = build_tag_index(nat_gateways, 'NatGatewayId')
+        self.managed_nats = {}
+        self.unmanaged_nat_counts = {}
+        for nat in nat_gateways:
+            if nat.get('State') not in ('pending', 'available'):
+                continue
+            if nat_tags[nat['NatGatewayId']].get(MANAGED_TAG[0]) == MANAGED_TAG[1]:
+                self.managed_nats.setdefault(nat['SubnetId'], []).append(nat['NatGatewayId'])
+            else:
+                self.unmanaged_nat_counts[nat['SubnetId']] = self.unmanaged_nat_counts.get(nat['SubnetId'], 0) + 1
+
+    def describe_candidate(self, subnet):
+        network = ipaddress.ip_network(subnet['CidrBlock'])
+        usable_ips = max(network.num_addresses - AWS_RESERVED_IPS_PER_SUBNET, 1)
+        free_ips = subnet['AvailableIpAddressCount']
+        name = self.subnet_tags[subnet['SubnetId']].get('Name', '')
+        return {
+            'subnet_id': subnet['SubnetId'],
+            'name': name,
+            'cidr_block': subnet['CidrBlock'],
+            'free_ips': free_ips,
+            'utilization': round(1 - free_ips / usable_ips, 3),
+            'managed_nat_gateways': self.managed_nats.get(subnet['SubnetId'], []),
+            'unmanaged_nat_gateways': self.unmanaged_nat_counts.get(subnet['SubnetId'], 0),
+            'public': 'public' in name.lower()
+        }
+
+    @staticmethod
+    def _rank_key(candidate):
+        return (not candidate['managed_nat_gateways'], candidate['unmanaged_nat_gateways'], not candidate['public'],
+                candidate['utilization'], -candidate['free_ips'], candidate['subnet_id'])
+
+    def select(self, network_cidr, availability_zones):
+        """
+        Retorna {az_name: {'subnet_id', 'explanation', 'candidates', 'rejected'}}; subnet_id é None quando
+        nenhuma subnet da AZ tem capacidade suficiente.
+        """
+        network = ipaddress.ip_network(network_cidr)
+        selection = {}
+        for az_name in availability_zones:
+            candidates, rejected = [], []
+            for subnet in self.subnets:
+                if subnet['AvailabilityZone'] != az_name:
+                    continue
+                subnet_network = ipaddress.ip_network(subnet['CidrBlock'])
+                if subnet_network.version != network.version or not subnet_network.subnet_of(network):
+                    continue
+                candidate = self.describe_candidate(subnet)
+                # Um NAT gerenciado existente é reutilizado e não consome IPs novos
+                if candidate['free_ips'] < self.min_free_ips and not candidate['managed_nat_gateways']:
+                    rejected.append(dict(candidate, reason=f"{candidate['free_ips']} IPs livres (mínimo {self.min_free_ips})"))
+                else:
+                    candidates.append(candidate)
+            candidates.sort(key=self._rank_key)
+            selection[az_name] = {
+                'subnet_id': candidates[0]['subnet_id'] if candidates else None,
+                'explanation': self._explain(az_name, network_cidr, candidates, rejected),
+                'candidates': candidates,
+                'rejected': rejected
+            }
+        return selection
+
+    def _explain(self, az_name, network_cidr, candidates, rejected):
+        if not candidates:
+            if not rejected:
+                return f"Nenhuma subnet 'available' dentro do CIDR '{network_cidr}' na AZ '{az_name}'."
+            details = '; '.join(f"{item['subnet_id']}: {item['reason']}" for item in rejected)
+            return f"Nenhuma subnet com capacidade para o NAT Gateway na AZ '{az_name}' ({details})."
+        chosen = candidates[0]
+        if chosen['managed_nat_gateways']:
+            reason = f"já possui o NAT Gateway gerenciado {chosen['managed_nat_gateways'][0]} (reutilizado)"
+        else:
+            reason = (f"{chosen['free_ips']} IPs livres, ocupação de {chosen['utilization']:.0%}, "
+                      f"{chosen['unmanaged_nat_gateways']} NAT Gateways existentes"
+                      + (", tag Name 'public'" if chosen['public'] else ''))
+        explanation = f"AZ '{az_name}': subnet '{chosen['subnet_id']}' ({chosen['name'] or chosen['cidr_block']}) escolhida: {reason}."
+        if len(candidates) > 1:
+            explanation += f" {len(candidates) - 1} outras candidatas: " + ', '.join(
+                f"{item['subnet_id']} ({item['free_ips']} IPs livres)" for item in candidates[1:]) + '.'
+        if rejected:
+            explanation += " Descartadas por falta de IPs: " + ', '.join(item['subnet_id'] for item in rejected) + '.'
+        return explanation
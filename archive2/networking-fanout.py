@@ -0,0 +1,256 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import boto3
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SETUP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'networking-setup.py')
+INVENTORY_FIELDS = ['account', 'region', 'vpc_id', 'main_vpc_cidr', 'security_group_ids', 'role_arn', 'profile']
+# Variáveis que não podem vazar do ambiente do runner para as execuções por VPC
+ISOLATED_ENV_VARS = ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_PROFILE',
+                     'AWS_DEFAULT_PROFILE', 'AWS_ROLE_ARN', 'AWS_WEB_IDENTITY_TOKEN_FILE']
+
+def load_inventory(inventory_file):
+    """
+    Carrega o inventário de VPCs a partir de um CSV (com cabeçalho) ou de uma lista JSON.
+    Campos obrigatórios: account, region, vpc_id, main_vpc_cidr, security_group_ids.
+    Campos opcionais: role_arn (role assumida para a conta) ou profile (perfil local do AWS CLI).
+    """
+    with open(inventory_file) as f:
+        if inventory_file.endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = list(csv.DictReader(f))
+
+    inventory = []
+    for line_number, entry in enumerate(entries, start=1):
+        missing = [field for field in INVENTORY_FIELDS[:5] if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Entrada {line_number} do inventário sem os campos obrigatórios {missing}: {entry}")
+        security_group_ids = entry['security_group_ids']
+        if isinstance(security_group_ids, str):
+            security_group_ids = security_group_ids.split()
+        inventory.append({
+            'account': str(entry['account']),
+            'region': entry['region'],
+            'vpc_id': entry['vpc_id'],
+            'main_vpc_cidr': entry['main_vpc_cidr'],
+            'security_group_ids': security_group_ids,
+            'role_arn': entry.get('role_arn') or None,
+            'profile': entry.get('profile') or None
+        })
+    return inventory
+
+class AccountCredentials:
+    """
+    Resolve e reaproveita as credenciais temporárias de cada conta do inventário.
+    Cada execução recebe credenciais válidas por pelo menos min_validity_seconds: as credenciais de
+    role assumida são renovadas (novo assume_role) quando estão perto do 'Expiration', então VPCs que
+    ficaram na fila do semáforo da conta não começam com credenciais do STS já vencidas.
+    """
+
+    def __init__(self, session_name='networking-fanout', session_duration=3600, min_validity_seconds=3600):
+        self.session_name = session_name
+        self.session_duration = session_duration
+        # Uma renovação nunca produz mais validade que a duração da sessão (menos uma folga)
+        self.min_validity_seconds = min(min_validity_seconds, session_duration - 300)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, entry):
+        key = (entry['account'], entry['role_arn'], entry['profile'])
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None or (cached['expiration'] is not None and
+                                  cached['expiration'] - time.time() < self.min_validity_seconds):
+                if cached is not None:
+                    logging.info(f"Renovando as credenciais da conta '{entry['account']}' (expiram em "
+                                 f"{max(cached['expiration'] - time.time(), 0):.0f}s).")
+                cached = self._cache[key] = self._resolve(entry)
+            if 'credentials' in cached:
+                # Credenciais de perfil: o botocore renova as que forem temporárias ao congelá-las
+                return self._frozen(cached['credentials'])
+            return dict(cached['env'])
+
+    def _resolve(self, entry):
+        if entry['role_arn']:
+            sts_client = boto3.client('sts', region_name=entry['region'])
+            credentials = sts_client.assume_role(
+                RoleArn=entry['role_arn'],
+                RoleSessionName=f"{self.session_name}-{entry['account']}",
+                DurationSeconds=self.session_duration
+            )['Credentials']
+            return {
+                'env': {
+                    'AWS_ACCESS_KEY_ID': credentials['AccessKeyId'],
+                    'AWS_SECRET_ACCESS_KEY': credentials['SecretAccessKey'],
+                    'AWS_SESSION_TOKEN': credentials['SessionToken']
+                },
+                'expiration': credentials['Expiration'].timestamp()
+            }
+        session = boto3.Session(profile_name=entry['profile']) if entry['profile'] else boto3.Session()
+        credentials = session.get_credentials()
+        if credentials is None:
+            raise RuntimeError(f"Nenhuma credencial encontrada para a conta '{entry['account']}'.")
+        return {'credentials': credentials, 'expiration': None}
+
+    @staticmethod
+    def _frozen(credentials):
+        frozen = credentials.get_frozen_credentials()
+        resolved = {'AWS_ACCESS_KEY_ID': frozen.access_key, 'AWS_SECRET_ACCESS_KEY': frozen.secret_key}
+        if frozen.token:
+            resolved['AWS_SESSION_TOKEN'] = frozen.token
+        return resolved
+
+def run_vpc_setup(entry, credentials, api_rate_per_run, log_dir, extra_args, timeout):
+    """
+    Executa networking-setup.py para uma VPC em um processo próprio, com as credenciais da conta
+    isoladas no ambiente do processo. Retorna o resultado da execução para o relatório agregado.
+    """
+    result = {
+        'account': entry['account'],
+        'region': entry['region'],
+        'vpc_id': entry['vpc_id'],
+        'status': 'failed'
+    }
+    log_file = os.path.join(log_dir, f"{entry['account']}-{entry['vpc_id']}.log")
+    report_fd, report_file = tempfile.mkstemp(prefix=f"{entry['vpc_id']}-", suffix='.json')
+    os.close(report_fd)
+
+    command = [
+        sys.executable, SETUP_SCRIPT,
+        '--region', entry['region'],
+        '--vpc-id', entry['vpc_id'],
+        '--main-vpc-cidr', entry['main_vpc_cidr'],
+        '--security-group-ids', *entry['security_group_ids'],
+        # Conta já conhecida pelo inventário: usada na chave do lock da VPC sem uma chamada extra ao STS
+        '--account-id', entry['account'],
+        '--report-file', report_file
+    ]
+    if api_rate_per_run:
+        command += ['--max-api-rate', str(api_rate_per_run)]
+    command += extra_args
+
+    started = time.monotonic()
+    try:
+        env = {key: value for key, value in os.environ.items() if key not in ISOLATED_ENV_VARS}
+        env.update(credentials.get(entry))
+        env['AWS_DEFAULT_REGION'] = entry['region']
+        logging.info(f"Iniciando configuração da VPC '{entry['vpc_id']}' (conta {entry['account']}, região {entry['region']}).")
+        with open(log_file, 'w') as log:
+            completed = subprocess.run(command, env=env, stdout=log, stderr=subprocess.STDOUT, timeout=timeout)
+        result['returncode'] = completed.returncode
+        result['status'] = 'succeeded' if completed.returncode == 0 else 'failed'
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+    except Exception as e:
+        result['error'] = str(e)
+    result['duration_seconds'] = round(time.monotonic() - started, 3)
+
+    result['log_file'] = log_file
+    try:
+        with open(report_file) as f:
+            run_report = json.load(f)
+        result['steps'] = run_report.get('steps', [])
+        if 'failed_step' in run_report:
+            result['failed_step'] = run_report['failed_step']
+    except (OSError, ValueError):
+        pass
+    finally:
+        os.remove(report_file)
+
+    logging.info(f"VPC '{entry['vpc_id']}' finalizada com status '{result['status']}' em {result['duration_seconds']}s.")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Executa networking-setup.py em paralelo para todas as VPCs de um inventário (várias contas e regiões). "
+                    "Argumentos não reconhecidos são repassados ao networking-setup.py."
+    )
+    parser.add_argument('--inventory', type=str, required=True, help='Arquivo CSV ou JSON com account, region, vpc_id, main_vpc_cidr e security_group_ids.')
+    parser.add_argument('--max-workers', type=int, default=8, help='Número máximo de VPCs configuradas ao mesmo tempo.')
+    parser.add_argument('--max-concurrent-per-account', type=int, default=2, help='Número máximo de VPCs da mesma conta configuradas ao mesmo tempo.')
+    parser.add_argument('--account-api-rate', type=float, default=10.0, help='Chamadas AWS por segundo permitidas por conta, divididas entre as execuções simultâneas da conta.')
+    parser.add_argument('--timeout', type=int, default=3600, help='Tempo máximo (segundos) de cada execução por VPC.')
+    parser.add_argument('--role-session-duration', type=int, default=3600, help='Duração (segundos) das sessões de role_arn; limitada pelo MaxSessionDuration da role.')
+    parser.add_argument('--log-dir', type=str, default='fanout-logs', help='Diretório dos logs por VPC.')
+    parser.add_argument('--report', type=str, default='fanout-report.json', help='Arquivo do relatório agregado.')
+
+    args, extra_args = parser.parse_known_args()
+
+    inventory = load_inventory(args.inventory)
+    os.makedirs(args.log_dir, exist_ok=True)
+    logging.info(f"Inventário com {len(inventory)} VPCs em {len({entry['account'] for entry in inventory})} contas.")
+
+    if args.timeout > args.role_session_duration - 300:
+        logging.warning(f"--timeout ({args.timeout}s) maior que a validade das sessões de role ({args.role_session_duration}s): "
+                        "execuções longas podem terminar com credenciais vencidas.")
+    credentials = AccountCredentials(session_duration=args.role_session_duration, min_validity_seconds=args.timeout)
+    # Uma fila por conta: uma VPC só é enviada ao pool quando sua conta tem vaga, então nenhuma thread do pool
+    # fica bloqueada esperando a conta enquanto VPCs de outras contas aguardam na fila
+    pending_by_account = {}
+    for entry in inventory:
+        pending_by_account.setdefault(entry['account'], deque()).append(entry)
+    running_by_account = {account: 0 for account in pending_by_account}
+    api_rate_per_run = args.account_api_rate / args.max_concurrent_per_account if args.account_api_rate else None
+
+    started = time.monotonic()
+    results = []
+    # Cada VPC roda em um processo próprio (subprocess); as threads apenas acompanham esses processos
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        running = {}
+
+        def submit_ready():
+            # Uma VPC por conta a cada volta, para intercalar as contas na fila do pool
+            submitted = True
+            while submitted:
+                submitted = False
+                for account, pending in pending_by_account.items():
+                    if pending and running_by_account[account] < args.max_concurrent_per_account:
+                        future = executor.submit(run_vpc_setup, pending.popleft(), credentials, api_rate_per_run,
+                                                 args.log_dir, extra_args, args.timeout)
+                        running[future] = account
+                        running_by_account[account] += 1
+                        submitted = True
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running_by_account[running.pop(future)] -= 1
+                results.append(future.result())
+            submit_ready()
+
+    results.sort(key=lambda result: (result['account'], result['region'], result['vpc_id']))
+    status_counts = {}
+    for result in results:
+        status_counts[result['status']] = status_counts.get(result['status'], 0) + 1
+
+    report = {
+        'total_vpcs': len(results),
+        'status_counts': status_counts,
+        'wall_clock_seconds': round(time.monotonic() - started, 3),
+        'serial_seconds': round(sum(result.get('duration_seconds', 0) for result in results), 3),
+        'results': results
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    logging.info(f"Relatório agregado gravado em '{args.report}': {status_counts} em {report['wall_clock_seconds']}s.")
+    if status_counts.get('succeeded', 0) != len(results):
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,36 @@
+import time
+_IMPORTS_STARTED = time.perf_counter()
+
 import boto3
 import argparse
+import atexit
+import datetime
+import importlib
+import json
 import logging
 import os
+import signal
+import tempfile
 import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_rate_limiter import install_process_rate_limiter
+from aws_tracing import TRACER, traced, with_current_span
+from aws_waiters import (CANCEL_EVENT, WAIT_METRICS, PollSchedule, WaiterCancelled, WaiterTimeout, nat_gateway_states,
+                         vpc_endpoint_states, wait_for_resources)
+from cidr_allocator import ALLOCATION_STRATEGIES, CidrAllocator
+from nat_subnet_selector import DEFAULT_MIN_FREE_IPS as DEFAULT_NAT_MIN_FREE_IPS, NatSubnetSelector
+
+# Tempos de inicialização exibidos com --timings (segundos). Cassette, lock e cache de metadados só são
+# importados quando as opções correspondentes são usadas (ver import_optional)
+STARTUP_TIMINGS = {'imports': time.perf_counter() - _IMPORTS_STARTED}
+
+# Mesmos valores de aws_cassette.CASSETTE_MODES e run_lock (LOCK_BACKENDS, DEFAULT_LEASE_SECONDS),
+# repetidos para que a linha de comando não importe esses módulos
+CASSETTE_MODES = ('record', 'replay')
+LOCK_BACKENDS = ('none', 'file', 'dynamodb')
+DEFAULT_LEASE_SECONDS = 300
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,26 +50,45 @@ service_endpoints_to_create = [
     'com.amazonaws.sa-east-1.ec2instanceconnect'
 ]
 
+DEFAULT_SUBNET_PREFIX_LENGTH = 20
+DEFAULT_ASSOCIATION_WORKERS = 8
+
+# Agendamento de polling e prazo dos waiters de NAT Gateway e VPC Endpoint (ajustáveis pela linha de comando)
+waiter_settings = {'schedule': PollSchedule(initial_delay=2.0, factor=2.0, max_delay=15.0), 'deadline_seconds': 900}
+
+# Clientes reutilizados entre os passos: criar um cliente carrega o modelo do serviço novamente
+_aws_clients = {}
+_aws_clients_lock = threading.Lock()
+
 def get_aws_client(service_name, region_name='sa-east-1',
                    aws_access_key_id=None, aws_secret_access_key=None, aws_session_token=None):
     """
     Retorna um cliente boto3 para o serviço especificado,
     com credenciais explicitamente fornecidas.
+    Os clientes são criados uma única vez por serviço, região e credenciais e reutilizados.
     """
+    client_key = (service_name, region_name, aws_access_key_id, aws_secret_access_key, aws_session_token)
     try:
-        if aws_access_key_id and aws_secret_access_key:
-            client_args = {
-                'service_name': service_name,
-                'region_name': region_name,
-                'aws_access_key_id': aws_access_key_id,
-                'aws_secret_access_key': aws_secret_access_key
-            }
-            if aws_session_token:
-                client_args['aws_session_token'] = aws_session_token
-            return boto3.client(**client_args)
-        else:
-            logging.warning("Credenciais AWS não fornecidas explicitamente. Boto3 tentará usar o default (variáveis de ambiente, perfis, roles de instância).")
-            return boto3.client(service_name, region_name=region_name)
+        with _aws_clients_lock:
+            if client_key in _aws_clients:
+                return _aws_clients[client_key]
+            client_started = time.perf_counter()
+            if aws_access_key_id and aws_secret_access_key:
+                client_args = {
+                    'service_name': service_name,
+                    'region_name': region_name,
+                    'aws_access_key_id': aws_access_key_id,
+                    'aws_secret_access_key': aws_secret_access_key
+                }
+                if aws_session_token:
+                    client_args['aws_session_token'] = aws_session_token
+                client = boto3.client(**client_args)
+            else:
+                logging.warning("Credenciais AWS não fornecidas explicitamente. Boto3 tentará usar o default (variáveis de ambiente, perfis, roles de instância).")
+                client = boto3.client(service_name, region_name=region_name)
+            STARTUP_TIMINGS.setdefault(f'first_client_{service_name}', time.perf_counter() - client_started)
+            _aws_clients[client_key] = client
+            return client
     except Exception as e:
         logging.error(f"Erro ao obter cliente para {service_name}: {e}")
         raise
@@ -70,6 +117,7 @@ def get_aws_resource(service_name, region_name='sa-east-1',
         logging.error(f"Erro ao obter recurso para {service_name}: {e}")
         raise
 
+@traced()
 def update_security_group_rules(sg_id, vpc_id, target_cidr, port, protocol, direction, region,
                                 aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -119,15 +167,86 @@ def update_security_group_rules(sg_id, vpc_id, target_cidr, port, protocol, dire
         logging.error(f"Erro ao adicionar regra {direction} ao Security Group '{sg_id}': {e}")
         return False
 
+def _security_group_rule_key(direction, protocol, from_port, to_port, cidr):
+    """Chave hashável que identifica uma regra de Security Group por direção, protocolo, portas e CIDR."""
+    return (direction, str(protocol).lower(), from_port, to_port, cidr)
+
+@traced()
+def reconcile_security_group_rules(desired_rules_by_sg, region,
+                                   aws_access_key_id, aws_secret_access_key, aws_session_token):
+    """
+    Garante que um conjunto de regras desejadas exista em vários Security Groups de uma só vez.
+    desired_rules_by_sg é um dicionário {sg_id: [regra, ...]} onde cada regra é um dicionário com
+    'direction' ('inbound'/'outbound'), 'protocol', 'from_port', 'to_port' e 'cidr'.
+    Busca as regras de todos os SGs em uma única passada paginada de describe_security_group_rules
+    e envia no máximo uma chamada de authorize por SG e direção com todas as permissões faltantes.
+    Retorna um dicionário {sg_id: bool} indicando sucesso por SG.
+    """
+    ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
+    sg_ids = list(desired_rules_by_sg)
+    logging.info(f"Reconciliando regras de Security Group para os SGs: {sg_ids}")
+
+    existing_rule_keys = set()
+    try:
+        paginator = ec2_client.get_paginator('describe_security_group_rules')
+        # O filtro group-id aceita no máximo 200 valores por chamada
+        for i in range(0, len(sg_ids), 200):
+            for page in paginator.paginate(Filters=[{'Name': 'group-id', 'Values': sg_ids[i:i + 200]}]):
+                for rule in page['SecurityGroupRules']:
+                    if 'CidrIpv4' not in rule:
+                        continue
+                    direction = 'outbound' if rule.get('IsEgress') else 'inbound'
+                    existing_rule_keys.add((rule['GroupId'],) + _security_group_rule_key(
+                        direction, rule.get('IpProtocol'), rule.get('FromPort'), rule.get('ToPort'), rule['CidrIpv4']))
+    except Exception as e:
+        logging.error(f"Erro ao listar regras dos Security Groups {sg_ids}: {e}")
+        return {sg_id: False for sg_id in sg_ids}
+
+    results = {}
+    for sg_id, desired_rules in desired_rules_by_sg.items():
+        results[sg_id] = True
+        missing_by_direction = {'inbound': {}, 'outbound': {}}
+        for rule in desired_rules:
+            key = _security_group_rule_key(rule['direction'], rule['protocol'], rule['from_port'], rule['to_port'], rule['cidr'])
+            if (sg_id,) + key in existing_rule_keys:
+                logging.info(f"Regra {rule['direction']} (Porta {rule['from_port']}-{rule['to_port']}/{rule['protocol']} de/para {rule['cidr']}) já existe no SG '{sg_id}'.")
+                continue
+            # Agrupa CIDRs faltantes com o mesmo protocolo/portas em uma única IpPermission
+            permission = missing_by_direction[rule['direction']].setdefault(
+                (key[1], rule['from_port'], rule['to_port']),
+                {'IpProtocol': key[1], 'FromPort': rule['from_port'], 'ToPort': rule['to_port'], 'IpRanges': []}
+            )
+            if {'CidrIp': rule['cidr']} not in permission['IpRanges']:
+                permission['IpRanges'].append({'CidrIp': rule['cidr']})
+
+        for direction, permissions in missing_by_direction.items():
+            if not permissions:
+                continue
+            ip_permissions = list(permissions.values())
+            try:
+                if direction == 'inbound':
+                    ec2_client.authorize_security_group_ingress(GroupId=sg_id, IpPermissions=ip_permissions)
+                else:
+                    ec2_client.authorize_security_group_egress(GroupId=sg_id, IpPermissions=ip_permissions)
+                logging.info(f"{sum(len(p['IpRanges']) for p in ip_permissions)} regra(s) {direction} adicionada(s) ao SG '{sg_id}'.")
+            except Exception as e:
+                logging.error(f"Erro ao adicionar regras {direction} ao Security Group '{sg_id}': {e}")
+                results[sg_id] = False
+    return results
+
+@traced()
 def create_vpc_endpoints(service_names, vpc_id, subnet_ids, security_group_ids, region,
-                         aws_access_key_id, aws_secret_access_key, aws_session_token):
+                         aws_access_key_id, aws_secret_access_key, aws_session_token,
+                         wait_until_available=True):
     """
     Cria VPC Endpoints para os serviços especificados.
     Assume que os IDs da VPC, Subnets e Security Groups já existem.
+    Com wait_until_available, aguarda todos os endpoints criados ficarem 'available' com polling em lote.
     """
     ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
     logging.info(f"Iniciando a criação de VPC Endpoints na VPC: {vpc_id}")
 
+    endpoints_started = time.monotonic()
     created_endpoints = []
     for service_name in service_names:
         try:
@@ -175,8 +294,23 @@ def create_vpc_endpoints(service_names, vpc_id, subnet_ids, security_group_ids,
                 logging.info(f"VPC Endpoint '{endpoint_id}' para '{service_name}' criado com sucesso.")
         except Exception as e:
             logging.error(f"Erro ao criar VPC Endpoint para '{service_name}': {e}")
+
+    if wait_until_available and created_endpoints:
+        try:
+            wait_for_resources(
+                vpc_endpoint_states(ec2_client), created_endpoints, 'vpc_endpoint',
+                ready_states={'available'}, failed_states={'failed', 'rejected', 'deleted'},
+                schedule=waiter_settings['schedule'], deadline_seconds=waiter_settings['deadline_seconds'],
+                started_at=endpoints_started
+            )
+        except (WaiterCancelled, WaiterTimeout):
+            # Cancelamento (SIGTERM, lease perdido) e prazo esgotado abortam a execução em main()
+            raise
+        except Exception as e:
+            logging.error(f"Erro aguardando os VPC Endpoints {created_endpoints} ficarem disponíveis: {e}")
     return created_endpoints
 
+@traced()
 def identify_routable_network(vpc_id, region,
                               aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -205,55 +339,108 @@ def identify_routable_network(vpc_id, region,
         logging.error(f"Erro ao identificar rede roteável: {e}")
         return None
 
-def associate_subnets_to_route_table(route_table_id, subnet_ids, region,
-                                     aws_access_key_id, aws_secret_access_key, aws_session_token):
+@traced()
+def build_subnet_route_table_index(ec2_client, vpc_id=None, subnet_ids=None):
     """
-    Associa uma lista de subnets a uma tabela de roteamento específica.
+    Monta o índice {subnet_id: (route_table_id, association_id)} das associações explícitas
+    em uma única passada paginada de describe_route_tables (filtrando pela VPC ou pelas subnets).
     """
-    ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
-    logging.info(f"Associando subnets {subnet_ids} à tabela de roteamento '{route_table_id}'.")
-    
-    successful_associations = []
-    for subnet_id in subnet_ids:
-        try:
-            # Verifica se a subnet já está explicitamente associada a esta tabela de roteamento
-            current_associations = ec2_client.describe_route_tables(
-                Filters=[
-                    {'Name': 'association.subnet-id', 'Values': [subnet_id]},
-                    {'Name': 'route-table-id', 'Values': [route_table_id]}
-                ]
-            )['RouteTables']
-
-            already_explicitly_associated = False
-            for rt in current_associations:
+    if vpc_id:
+        filter_batches = [[{'Name': 'vpc-id', 'Values': [vpc_id]}]]
+    else:
+        subnet_ids = list(subnet_ids or [])
+        # O filtro association.subnet-id aceita no máximo 200 valores por chamada
+        filter_batches = [[{'Name': 'association.subnet-id', 'Values': subnet_ids[i:i + 200]}]
+                          for i in range(0, len(subnet_ids), 200)]
+
+    index = {}
+    paginator = ec2_client.get_paginator('describe_route_tables')
+    for filters in filter_batches:
+        for page in paginator.paginate(Filters=filters):
+            for rt in page['RouteTables']:
                 for assoc in rt.get('Associations', []):
-                    # Verifica se é uma associação explícita (não a associação principal da VPC)
-                    if assoc.get('SubnetId') == subnet_id and assoc.get('RouteTableId') == route_table_id and not assoc.get('Main', False):
-                        already_explicitly_associated = True
-                        break
-                if already_explicitly_associated:
-                    break
+                    if assoc.get('SubnetId') and not assoc.get('Main', False):
+                        index[assoc['SubnetId']] = (assoc['RouteTableId'], assoc['RouteTableAssociationId'])
+    return index
 
-            if not already_explicitly_associated:
-                logging.info(f"Associando subnet '{subnet_id}' à tabela de roteamento '{route_table_id}'.")
-                ec2_client.associate_route_table(
+@traced()
+def apply_route_table_associations(ec2_client, desired_route_tables, subnet_route_table_index,
+                                   max_workers=DEFAULT_ASSOCIATION_WORKERS):
+    """
+    Aplica concorrentemente as associações {subnet_id: route_table_id} desejadas.
+    Subnets já associadas à tabela correta são ignoradas, associações com outra tabela são
+    substituídas (replace_route_table_association) e as demais são criadas.
+    O subnet_route_table_index é atualizado a cada operação concluída.
+    Retorna a lista de subnets associadas com sucesso (incluindo as que já estavam associadas).
+    """
+    index_lock = threading.Lock()
+
+    def associate(subnet_id, route_table_id):
+        with index_lock:
+            current = subnet_route_table_index.get(subnet_id)
+        try:
+            if current and current[0] == route_table_id:
+                logging.info(f"Subnet '{subnet_id}' já está explicitamente associada à tabela de roteamento '{route_table_id}'.")
+                return subnet_id
+            if current:
+                response = ec2_client.replace_route_table_association(
+                    AssociationId=current[1],
+                    RouteTableId=route_table_id
+                )
+                association_id = response['NewAssociationId']
+                logging.info(f"Associação da subnet '{subnet_id}' substituída de '{current[0]}' para a tabela de roteamento '{route_table_id}'.")
+            else:
+                response = ec2_client.associate_route_table(
                     RouteTableId=route_table_id,
                     SubnetId=subnet_id
                 )
+                association_id = response['AssociationId']
                 logging.info(f"Subnet '{subnet_id}' associada com sucesso à tabela de roteamento '{route_table_id}'.")
-                successful_associations.append(subnet_id)
-            else:
-                logging.info(f"Subnet '{subnet_id}' já está explicitamente associada à tabela de roteamento '{route_table_id}'.")
-                successful_associations.append(subnet_id) # Considera sucesso se já estava associada
-
+            with index_lock:
+                subnet_route_table_index[subnet_id] = (route_table_id, association_id)
+            return subnet_id
         except Exception as e:
             logging.error(f"Erro ao associar subnet '{subnet_id}' à tabela de roteamento '{route_table_id}': {e}")
-    return successful_associations
+            return None
+
+    if not desired_route_tables:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(desired_route_tables))) as executor:
+        results = executor.map(with_current_span(lambda item: associate(*item)), desired_route_tables.items())
+        return [subnet_id for subnet_id in results if subnet_id]
+
+@traced()
+def associate_subnets_to_route_table(route_table_id, subnet_ids, region,
+                                     aws_access_key_id, aws_secret_access_key, aws_session_token,
+                                     subnet_route_table_index=None):
+    """
+    Associa uma lista de subnets a uma tabela de roteamento específica.
+    Se subnet_route_table_index não for informado, ele é montado a partir das próprias subnets.
+    """
+    ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
+    logging.info(f"Associando subnets {subnet_ids} à tabela de roteamento '{route_table_id}'.")
+
+    try:
+        if subnet_route_table_index is None:
+            subnet_route_table_index = build_subnet_route_table_index(ec2_client, subnet_ids=subnet_ids)
+    except Exception as e:
+        logging.error(f"Erro ao listar associações atuais das subnets {subnet_ids}: {e}")
+        return []
+
+    return apply_route_table_associations(
+        ec2_client,
+        {subnet_id: route_table_id for subnet_id in subnet_ids},
+        subnet_route_table_index
+    )
 
+@traced()
 def create_private_nat_gateway(subnet_id, az_suffix, region,
-                               aws_access_key_id, aws_secret_access_key, aws_session_token):
+                               aws_access_key_id, aws_secret_access_key, aws_session_token,
+                               wait_until_available=True):
     """
     Cria um NAT Gateway privado na subnet especificada.
+    Com wait_until_available=False retorna logo após a criação, para que vários NAT Gateways
+    possam ser aguardados em lote com wait_for_nat_gateways.
     Retorna o ID do NAT Gateway.
     """
     ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
@@ -287,22 +474,43 @@ def create_private_nat_gateway(subnet_id, az_suffix, region,
             ]
         )
         nat_gateway_id = response['NatGateway']['NatGatewayId']
-        logging.info(f"NAT Gateway privado '{nat_gateway_id}' criado. Aguardando status 'available'...")
+        if not wait_until_available:
+            logging.info(f"NAT Gateway privado '{nat_gateway_id}' criado.")
+            return nat_gateway_id
 
-        waiter = ec2_client.get_waiter('nat_gateway_available')
-        waiter.wait(NatGatewayIds=[nat_gateway_id])
+        logging.info(f"NAT Gateway privado '{nat_gateway_id}' criado. Aguardando status 'available'...")
+        wait_for_nat_gateways([nat_gateway_id], region, aws_access_key_id, aws_secret_access_key, aws_session_token)
         logging.info(f"NAT Gateway '{nat_gateway_id}' está agora disponível.")
         return nat_gateway_id
     except Exception as e:
         logging.error(f"Erro ao criar NAT Gateway privado na subnet {subnet_id}: {e}")
         return None
 
+@traced()
+def wait_for_nat_gateways(nat_gateway_ids, region,
+                          aws_access_key_id, aws_secret_access_key, aws_session_token, started_at=None):
+    """
+    Aguarda vários NAT Gateways ficarem 'available' com uma única chamada describe_nat_gateways por poll.
+    Levanta uma exceção do aws_waiters em caso de falha, prazo esgotado ou cancelamento.
+    """
+    ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
+    return wait_for_resources(
+        nat_gateway_states(ec2_client), nat_gateway_ids, 'nat_gateway',
+        ready_states={'available'}, failed_states={'failed', 'deleting', 'deleted'},
+        schedule=waiter_settings['schedule'], deadline_seconds=waiter_settings['deadline_seconds'],
+        started_at=started_at
+    )
+
+@traced()
 def get_subnets_for_nat_gateway(vpc_id, main_vpc_cidr, region,
-                               aws_access_key_id, aws_secret_access_key, aws_session_token):
+                               aws_access_key_id, aws_secret_access_key, aws_session_token,
+                               min_free_ips=DEFAULT_NAT_MIN_FREE_IPS):
     """
     Encontra subnets adequadas para os NAT Gateways, uma em cada AZ permitida (sa-east-1a, sa-east-1b).
-    Prioriza subnets com 'public' no nome da tag se possível, ou a primeira disponível.
-    Retorna um dicionário {az_name: subnet_id}.
+    As subnets do main_vpc_cidr com menos de min_free_ips IPs livres são descartadas e as demais são
+    ordenadas por NAT Gateway gerenciado já existente, densidade de NAT Gateways e de ENIs e tag 'public'
+    (ver NatSubnetSelector). A escolha de cada AZ é explicada no log.
+    Retorna um dicionário {az_name: subnet_id} apenas com as AZs que têm uma subnet com capacidade.
     """
     ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
     logging.info(f"Buscando subnets para NAT Gateways no CIDR '{main_vpc_cidr}' da VPC '{vpc_id}'")
@@ -311,42 +519,20 @@ def get_subnets_for_nat_gateway(vpc_id, main_vpc_cidr, region,
     nat_gateway_subnets = {}
 
     try:
-        # Filtra subnets que estão dentro do main_vpc_cidr
-        all_subnets_in_vpc = ec2_client.describe_subnets(
-            Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-        )['Subnets']
-
-        main_network = ipaddress.ip_network(main_vpc_cidr)
-        
-        for az_name in allowed_azs:
-            candidate_subnets_in_az = []
-            for subnet in all_subnets_in_vpc:
-                if subnet['AvailabilityZone'] == az_name:
-                    subnet_network = ipaddress.ip_network(subnet['CidrBlock'])
-                    if subnet_network.subnet_of(main_network):
-                        candidate_subnets_in_az.append(subnet)
-            
-            if not candidate_subnets_in_az:
-                logging.warning(f"Nenhuma subnet encontrada dentro do CIDR '{main_vpc_cidr}' na AZ '{az_name}' da VPC '{vpc_id}'.")
-                continue
-
-            found_subnet = None
-            # Prioriza subnets com tags de nome 'public'
-            for subnet in candidate_subnets_in_az:
-                for tag in subnet.get('Tags', []):
-                    if tag['Key'] == 'Name' and 'public' in tag['Value'].lower():
-                        found_subnet = subnet
-                        logging.info(f"Subnet pública ideal para NAT Gateway encontrada na AZ '{az_name}': {subnet['SubnetId']}")
-                        break
-                if found_subnet:
-                    break
-            
-            if not found_subnet:
-                # Se nenhuma subnet 'public' for encontrada, retorna a primeira candidata
-                found_subnet = candidate_subnets_in_az[0]
-                logging.info(f"Nenhuma subnet 'public' ideal encontrada na AZ '{az_name}'. Usando a primeira subnet candidata: {found_subnet['SubnetId']}")
-            
-            nat_gateway_subnets[az_name] = found_subnet['SubnetId']
+        vpc_filter = [{'Name': 'vpc-id', 'Values': [vpc_id]}]
+        all_subnets_in_vpc = [subnet for page in ec2_client.get_paginator('describe_subnets').paginate(Filters=vpc_filter)
+                              for subnet in page['Subnets']]
+        nat_gateways_in_vpc = [nat for page in ec2_client.get_paginator('describe_nat_gateways').paginate(Filters=vpc_filter)
+                               for nat in page['NatGateways']]
+
+        selector = NatSubnetSelector(all_subnets_in_vpc, nat_gateways_in_vpc, min_free_ips=min_free_ips)
+        for az_name, choice in selector.select(main_vpc_cidr, allowed_azs).items():
+            if choice['subnet_id']:
+                logging.info(choice['explanation'])
+                nat_gateway_subnets[az_name] = choice['subnet_id']
+            else:
+                # Falha antes da criação do NAT Gateway, e não depois da espera de vários minutos
+                logging.error(choice['explanation'])
 
         if not nat_gateway_subnets:
             logging.error(f"Nenhuma subnet adequada encontrada para NAT Gateway nas AZs {allowed_azs} dentro do CIDR '{main_vpc_cidr}'.")
@@ -355,17 +541,20 @@ def get_subnets_for_nat_gateway(vpc_id, main_vpc_cidr, region,
         logging.error(f"Erro ao encontrar subnets para NAT Gateway: {e}")
         return {}
 
+@traced()
 def create_subnets(vpc_id, base_cidr_block, subnet_prefix_length, region,
-                   aws_access_key_id, aws_secret_access_key, aws_session_token):
+                   aws_access_key_id, aws_secret_access_key, aws_session_token,
+                   allocation_strategy='first-fit'):
     """
     Cria um número especificado de subnets em diferentes AZs a partir de um CIDR block base.
-    As subnets serão divididas com o subnet_prefix_length.
+    As subnets serão alocadas com o subnet_prefix_length (int, ou dict {tipo: prefixo} para prefixos mistos),
+    somente em ranges do CIDR base que ainda não estão em uso na VPC.
     Usará somente as AZs 'sa-east-1a' e 'sa-east-1b'.
     Retorna um dicionário de IDs de subnets criadas, mapeado por nome fixo.
     As tags de nome serão 'app-non-routable-1a', 'app-non-routable-1b', 'database-non-routable-1a', 'database-non-routable-1b'.
     """
     ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
-    logging.info(f"Iniciando a criação de subnets na VPC '{vpc_id}' a partir do CIDR base '{base_cidr_block}' com prefixo /{subnet_prefix_length}")
+    logging.info(f"Iniciando a criação de subnets na VPC '{vpc_id}' a partir do CIDR base '{base_cidr_block}' com prefixo(s) {subnet_prefix_length}")
 
     created_subnet_ids = {}
     
@@ -398,87 +587,105 @@ def create_subnets(vpc_id, base_cidr_block, subnet_prefix_length, region,
     # Mapeamento de AZ para sufixo (a, b) para nomes de tags
     az_suffixes = {'sa-east-1a': '1a', 'sa-east-1b': '1b'}
     tag_types = ['app', 'database']
-    expected_num_subnets = len(allowed_azs) * len(tag_types) # Deve ser 4
+
+    # Prefixo por tipo de subnet: um inteiro vale para todos, um dict permite prefixos mistos
+    if isinstance(subnet_prefix_length, dict):
+        prefix_by_tag_type = {tag_type: subnet_prefix_length.get(tag_type, DEFAULT_SUBNET_PREFIX_LENGTH) for tag_type in tag_types}
+    else:
+        prefix_by_tag_type = {tag_type: subnet_prefix_length for tag_type in tag_types}
 
     try:
-        # Calcular os blocos CIDR para as novas subnets
-        network = ipaddress.ip_network(base_cidr_block)
-        subnets_to_create_cidrs = list(network.subnets(new_prefix=subnet_prefix_length))
+        pool_network = ipaddress.ip_network(base_cidr_block)
 
-        if len(subnets_to_create_cidrs) < expected_num_subnets:
-            logging.error(f"O CIDR base '{base_cidr_block}' (/{(network.prefixlen)}) não pode ser dividido em {expected_num_subnets} subnets de prefixo /{subnet_prefix_length}. São possíveis apenas {len(subnets_to_create_cidrs)}.")
-            return {}
-        
-        cidr_idx = 0
-        
+        # Carrega todas as subnets da VPC uma única vez: servem tanto para reutilização quanto como ranges ocupados
+        all_subnets_in_vpc = []
+        paginator = ec2_client.get_paginator('describe_subnets')
+        for page in paginator.paginate(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]):
+            all_subnets_in_vpc.extend(page['Subnets'])
+
+        # Reutiliza subnets já existentes no pool com o mesmo nome de tag e AZ (re-execuções idempotentes)
+        pending_slots = []
         for tag_type in tag_types:
             for az_name in available_azs:
-                if cidr_idx >= len(subnets_to_create_cidrs):
-                    logging.warning("Não há mais CIDRs disponíveis para alocar. Saindo da criação de subnets.")
-                    break
-                
-                subnet_cidr = str(subnets_to_create_cidrs[cidr_idx])
                 final_tag_name = f"{tag_type}-non-routable-{az_suffixes.get(az_name)}"
+                existing_subnet = None
+                for subnet in all_subnets_in_vpc:
+                    subnet_name = next((tag['Value'] for tag in subnet.get('Tags', []) if tag['Key'] == 'Name'), None)
+                    if (subnet_name == final_tag_name and subnet['AvailabilityZone'] == az_name and
+                            ipaddress.ip_network(subnet['CidrBlock']).subnet_of(pool_network)):
+                        existing_subnet = subnet
+                        break
 
-                # Verificar se já existe uma subnet com este CIDR e AZ na VPC
-                existing_subnets = ec2_client.describe_subnets(
-                    Filters=[
-                        {'Name': 'vpc-id', 'Values': [vpc_id]},
-                        {'Name': 'cidr-block', 'Values': [subnet_cidr]},
-                        {'Name': 'availability-zone', 'Values': [az_name]} 
-                    ]
-                )['Subnets']
-
-                subnet_id = None
-                if existing_subnets:
-                    subnet_id = existing_subnets[0]['SubnetId']
-                    logging.info(f"Subnet com CIDR '{subnet_cidr}' e AZ '{az_name}' (Tag: {final_tag_name}) já existe na VPC '{vpc_id}' como '{subnet_id}'. Reutilizando.")
+                if existing_subnet:
+                    created_subnet_ids[final_tag_name] = existing_subnet['SubnetId']
+                    logging.info(f"Subnet '{final_tag_name}' já existe na VPC '{vpc_id}' como '{existing_subnet['SubnetId']}' (CIDR '{existing_subnet['CidrBlock']}'). Reutilizando.")
                 else:
-                    logging.info(f"Tentando criar subnet com CIDR '{subnet_cidr}' na AZ '{az_name}' com tag: {final_tag_name}")
-                    try:
-                        subnet = ec2_client.create_subnet(
-                            VpcId=vpc_id,
-                            CidrBlock=subnet_cidr,
-                            AvailabilityZone=az_name,
-                            TagSpecifications=[
-                                {
-                                    'ResourceType': 'subnet',
-                                    'Tags': [
-                                        {'Key': 'Name', 'Value': final_tag_name},
-                                        {'Key': 'ManagedBy', 'Value': 'HarnessPipeline'}
-                                    ]
-                                },
-                            ]
-                        )
-                        subnet_id = subnet['Subnet']['SubnetId']
-                        logging.info(f"Subnet '{subnet_id}' com CIDR '{subnet_cidr}' criada na AZ '{az_name}'.")
-                    except Exception as e:
-                        logging.error(f"Erro ao criar subnet '{subnet_cidr}' na AZ '{az_name}': {e}")
-                        continue # Continuar para a próxima iteração se houver um erro na criação
+                    pending_slots.append((tag_type, az_name, final_tag_name))
+
+        if not pending_slots:
+            return created_subnet_ids
 
-                if subnet_id:
-                    created_subnet_ids[final_tag_name] = subnet_id
-                cidr_idx += 1
+        # Aloca os CIDRs faltantes considerando os ranges já em uso na VPC
+        allocator = CidrAllocator(
+            base_cidr_block,
+            occupied_cidrs=[subnet['CidrBlock'] for subnet in all_subnets_in_vpc],
+            strategy=allocation_strategy
+        )
+        requested_prefixes = [prefix_by_tag_type[tag_type] for tag_type, _, _ in pending_slots]
+        allocated_cidrs = allocator.allocate_many(requested_prefixes)
+
+        if allocated_cidrs is None:
+            logging.error(f"O CIDR base '{base_cidr_block}' não possui espaço livre para {len(pending_slots)} subnets com prefixos {requested_prefixes}, considerando as subnets já existentes na VPC.")
+            return created_subnet_ids
+
+        for (tag_type, az_name, final_tag_name), subnet_network in zip(pending_slots, allocated_cidrs):
+            subnet_cidr = str(subnet_network)
+            logging.info(f"Tentando criar subnet com CIDR '{subnet_cidr}' na AZ '{az_name}' com tag: {final_tag_name}")
+            try:
+                subnet = ec2_client.create_subnet(
+                    VpcId=vpc_id,
+                    CidrBlock=subnet_cidr,
+                    AvailabilityZone=az_name,
+                    TagSpecifications=[
+                        {
+                            'ResourceType': 'subnet',
+                            'Tags': [
+                                {'Key': 'Name', 'Value': final_tag_name},
+                                {'Key': 'ManagedBy', 'Value': 'HarnessPipeline'}
+                            ]
+                        },
+                    ]
+                )
+                subnet_id = subnet['Subnet']['SubnetId']
+                created_subnet_ids[final_tag_name] = subnet_id
+                logging.info(f"Subnet '{subnet_id}' com CIDR '{subnet_cidr}' criada na AZ '{az_name}'.")
+            except Exception as e:
+                logging.error(f"Erro ao criar subnet '{subnet_cidr}' na AZ '{az_name}': {e}")
+                continue # Continuar para a próxima subnet se houver um erro na criação
 
     except Exception as e:
         logging.error(f"Erro geral ao criar subnets: {e}")
 
     return created_subnet_ids
 
+@traced()
 def create_new_route_table_and_associate(vpc_id, subnet_ids_map, nat_gateway_ids_map, region,
-                                         aws_access_key_id, aws_secret_access_key, aws_session_token):
+                                         aws_access_key_id, aws_secret_access_key, aws_session_token,
+                                         subnet_route_table_index=None):
     """
     Cria DUAS novas tabelas de roteamento (uma para 'a', outra para 'b'),
     adiciona rota para o NAT Gateway correspondente à sua AZ, e associa as subnets fornecidas.
     Esta RT será para as subnets "não roteáveis" (do CIDR 100.99.0.0/16) que usam o NAT Gateway.
     subnet_ids_map é um dicionário {nome_da_tag: subnet_id}.
     nat_gateway_ids_map é um dicionário {az_name: nat_gateway_id}.
+    subnet_route_table_index é o índice {subnet_id: (route_table_id, association_id)} da VPC; é montado se não for informado.
     Retorna um dicionário {az_name: route_table_id}.
     """
     ec2_client = get_aws_client('ec2', region, aws_access_key_id, aws_secret_access_key, aws_session_token)
     logging.info(f"Criando novas tabelas de roteamento na VPC '{vpc_id}' para subnets não roteáveis e associando.")
 
     new_non_routable_rts = {}
+    desired_route_tables = {}
     allowed_azs = ['sa-east-1a', 'sa-east-1b']
     az_suffixes = {'sa-east-1a': '1a', 'sa-east-1b': '1b'}
 
@@ -546,39 +753,21 @@ def create_new_route_table_and_associate(vpc_id, subnet_ids_map, nat_gateway_ids
             ]
             
             for subnet_id in subnets_for_this_az:
-                try:
-                    current_associations = ec2_client.describe_route_tables(
-                        Filters=[
-                            {'Name': 'association.subnet-id', 'Values': [subnet_id]},
-                            {'Name': 'route-table-id', 'Values': [route_table_id]}
-                        ]
-                    )['RouteTables']
-
-                    already_explicitly_associated = False
-                    for rt in current_associations:
-                        for assoc in rt.get('Associations', []):
-                            if assoc.get('SubnetId') == subnet_id and assoc.get('RouteTableId') == route_table_id and not assoc.get('Main', False):
-                                already_explicitly_associated = True
-                                break
-                        if already_explicitly_associated:
-                            break
-
-                    if not already_explicitly_associated:
-                        ec2_client.associate_route_table(
-                            RouteTableId=route_table_id,
-                            SubnetId=subnet_id
-                        )
-                        logging.info(f"Subnet '{subnet_id}' associada à nova tabela de roteamento '{route_table_id}'.")
-                    else:
-                        logging.info(f"Subnet '{subnet_id}' já estava explicitamente associada à nova tabela de roteamento '{route_table_id}'.")
-
-                except Exception as e:
-                    logging.error(f"Erro ao associar subnet '{subnet_id}' à nova tabela de roteamento '{route_table_id}': {e}")
+                desired_route_tables[subnet_id] = route_table_id
 
         except Exception as e:
             logging.error(f"Erro ao criar e configurar tabela de roteamento para AZ '{az_name}': {e}")
+
+    # Associa as subnets de todas as AZs de uma vez, a partir do índice de associações da VPC
+    try:
+        if subnet_route_table_index is None:
+            subnet_route_table_index = build_subnet_route_table_index(ec2_client, vpc_id=vpc_id)
+        apply_route_table_associations(ec2_client, desired_route_tables, subnet_route_table_index)
+    except Exception as e:
+        logging.error(f"Erro ao associar subnets às novas tabelas de roteamento na VPC '{vpc_id}': {e}")
     return new_non_routable_rts
 
+@traced()
 def get_existing_subnets_in_cidr(vpc_id, cidr_block, region,
                                   aws_access_key_id, aws_secret_access_key, aws_session_token):
     """
@@ -605,28 +794,216 @@ def get_existing_subnets_in_cidr(vpc_id, cidr_block, region,
         logging.error(f"Erro ao buscar subnets existentes no CIDR '{cidr_block}': {e}")
         return []
 
+def begin_step(run_report, step_name):
+    """Encerra o passo anterior do relatório de execução e inicia a contagem de tempo de um novo passo."""
+    end_step(run_report)
+    if CANCEL_EVENT.is_set():
+        # SIGTERM da pipeline ou perda do lease do lock da VPC: nenhum passo novo é iniciado
+        logging.error(f"Execução cancelada antes do passo '{step_name}'. Abortando.")
+        exit(1)
+    logging.debug(f"Iniciando passo '{step_name}'.")
+    run_report['steps'].append({
+        'name': step_name,
+        '_started': time.monotonic(),
+        '_span': TRACER.start_span(f'step.{step_name}', vpc_id=run_report['vpc_id'], region=run_report['region'])
+    })
+
+def end_step(run_report):
+    if run_report['steps'] and '_started' in run_report['steps'][-1]:
+        step = run_report['steps'][-1]
+        step['duration_seconds'] = round(time.monotonic() - step.pop('_started'), 3)
+        span = step.pop('_span', None)
+        if span is not None:
+            span.finish()
+
+def write_run_report(run_report, report_file, rate_limiter=None):
+    """Grava o relatório da execução (status, duração por passo e métricas do limitador de taxa) em JSON."""
+    end_step(run_report)
+    if rate_limiter is not None:
+        run_report['rate_limiter'] = rate_limiter.metrics()
+    run_report['waiters'] = WAIT_METRICS.summary()
+    if run_report['status'] != 'succeeded' and run_report['steps']:
+        run_report['failed_step'] = run_report['steps'][-1]['name']
+    run_report['duration_seconds'] = round(time.monotonic() - run_report.pop('_started', time.monotonic()), 3)
+    with open(report_file, 'w') as f:
+        json.dump(run_report, f, indent=2)
+
+def import_optional(module_name):
+    """Importa um módulo usado apenas por uma opção da linha de comando, registrando o tempo em --timings."""
+    import_started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    STARTUP_TIMINGS.setdefault(f'import_{module_name}', time.perf_counter() - import_started)
+    return module
+
+def install_startup_timings():
+    """Registra o instante da primeira chamada AWS e exibe o detalhamento da inicialização ao final."""
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+
+    def first_call(**kwargs):
+        STARTUP_TIMINGS.setdefault('time_to_first_api_call', time.perf_counter() - _IMPORTS_STARTED)
+
+    boto3.DEFAULT_SESSION.events.register('before-call.*.*', first_call)
+    atexit.register(log_startup_timings)
+
+def log_startup_timings():
+    bootstrap = os.environ.get('NETWORKING_BUNDLE_BOOTSTRAP_SECONDS')
+    timings = dict(STARTUP_TIMINGS)
+    if bootstrap:
+        timings['bundle_bootstrap'] = float(bootstrap)
+    logging.info("Tempos de inicialização: " + ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items()))
+
 def main():
     parser = argparse.ArgumentParser(description="Script para configurar recursos de rede AWS em uma pipeline Harness.")
     parser.add_argument('--region', type=str, default='sa-east-1', help='Região AWS a ser usada.')
     parser.add_argument('--vpc-id', type=str, required=True, help='ID da VPC onde os recursos serão criados.')
     parser.add_argument('--security-group-ids', nargs='+', required=True, help='IDs dos Security Groups para os VPC Endpoints.')
     # num-subnets e new-subnet-tag-name-prefix serão controlados internamente para nomes fixos e 4 subnets
-    parser.add_argument('--subnet-prefix-length', type=int, default=20, help='Comprimento do prefixo das novas subnets do 100.99.0.0/16 (e.g., 20 para /20).')
+    parser.add_argument('--subnet-prefix-length', type=int, default=DEFAULT_SUBNET_PREFIX_LENGTH, help='Comprimento do prefixo das novas subnets do 100.99.0.0/16 (e.g., 20 para /20).')
+    parser.add_argument('--subnet-prefix-overrides', nargs='*', default=[], help="Prefixo por tipo de subnet no formato tipo=prefixo (e.g., 'database=24'). Sobrescreve --subnet-prefix-length para o tipo.")
+    parser.add_argument('--cidr-allocation-strategy', choices=ALLOCATION_STRATEGIES, default='first-fit', help='Estratégia de alocação dos CIDRs livres do CIDR não roteável.')
     parser.add_argument('--non-routable-cidr', type=str, default='100.99.0.0/16', help='CIDR a ser dividido em novas subnets (este será o CIDR "não roteável" via TGW).')
     parser.add_argument('--main-vpc-cidr', type=str, required=True, help='CIDR principal da VPC onde o NAT Gateway deve ser criado e onde as subnets roteáveis existentes estão.')
 
+    parser.add_argument('--nat-min-free-ips', type=int, default=DEFAULT_NAT_MIN_FREE_IPS, help='Mínimo de IPs livres para uma subnet receber um NAT Gateway; subnets abaixo disso são descartadas.')
+
+    parser.add_argument('--waiter-initial-delay', type=float, default=2.0, help='Primeiro intervalo (segundos) de polling dos NAT Gateways e VPC Endpoints; dobra a cada poll.')
+    parser.add_argument('--waiter-max-delay', type=float, default=15.0, help='Intervalo máximo (segundos) de polling, mantido constante após ser atingido.')
+    parser.add_argument('--waiter-deadline', type=int, default=900, help='Prazo total (segundos) de cada espera por NAT Gateways ou VPC Endpoints.')
+    parser.add_argument('--skip-endpoint-wait', action='store_true', help='Não aguarda os VPC Endpoints de interface ficarem disponíveis.')
+    parser.add_argument('--timings', action='store_true', help='Exibe o detalhamento do tempo de importação e inicialização até a primeira chamada AWS.')
+    parser.add_argument('--trace-file', type=str, help='Arquivo do trace no formato Chrome/Perfetto (spans por passo e por chamada AWS).')
+    parser.add_argument('--trace-log', type=str, help='Arquivo JSON Lines com um registro estruturado por span.')
+    parser.add_argument('--report-file', type=str, help='Arquivo JSON onde o relatório da execução (status e tempo por passo) será gravado.')
+    parser.add_argument('--max-api-rate', type=float, help='Número máximo de chamadas AWS por segundo (por categoria de API) para esta execução.')
+
+    parser.add_argument('--lock-backend', choices=LOCK_BACKENDS, default='none', help="Lock por (conta, VPC) que enfileira execuções concorrentes na mesma VPC: 'file' (local, para testes) ou 'dynamodb'.")
+    parser.add_argument('--lock-dir', type=str, default=os.path.join(tempfile.gettempdir(), 'networking-locks'), help='Diretório dos leases com --lock-backend file.')
+    parser.add_argument('--lock-table', type=str, default='networking-run-locks', help="Tabela DynamoDB dos leases (chave de partição 'lock_key') com --lock-backend dynamodb.")
+    parser.add_argument('--lock-lease', type=int, default=DEFAULT_LEASE_SECONDS, help='Duração (segundos) do lease; renovado a cada um terço desse tempo enquanto a execução estiver viva.')
+    parser.add_argument('--lock-wait', type=int, default=3600, help='Tempo máximo (segundos) de espera na fila pelo lock da VPC.')
+    parser.add_argument('--account-id', type=str, help='Conta AWS usada na chave do lock e na partição do cache de metadados; obtida via STS se omitida.')
+
+    parser.add_argument('--no-metadata-cache', action='store_true', help='Não usa o cache em disco de metadados (AZs, serviços de endpoint, tipos de instância) entre execuções.')
+    parser.add_argument('--metadata-cache-dir', type=str, help='Diretório do cache de metadados (padrão: $NETWORKING_METADATA_CACHE ou ~/.cache/networking-metadata).')
+
+    parser.add_argument('--cassette', type=str, help='Arquivo de cassette para gravar (record) ou reproduzir (replay) as chamadas AWS.')
+    parser.add_argument('--cassette-mode', choices=CASSETTE_MODES, default='replay', help='Grava uma execução real ou reproduz um cassette sem acesso à AWS.')
+    parser.add_argument('--cassette-latency', type=str, default=None, help="Latência simulada por chamada no replay: segundos ou 'recorded' para usar a duração gravada.")
+    parser.add_argument('--cassette-operation-latency', nargs='*', default=[], help="Latência simulada por operação no replay, no formato Operacao=segundos (e.g., 'CreateNatGateway=2').")
+
     args = parser.parse_args()
 
     aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
     aws_secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
     aws_session_token = os.environ.get('AWS_SESSION_TOKEN')
 
+    waiter_settings['schedule'] = PollSchedule(initial_delay=args.waiter_initial_delay, factor=2.0, max_delay=args.waiter_max_delay)
+    waiter_settings['deadline_seconds'] = args.waiter_deadline
+    # Um abort da pipeline (SIGTERM) cancela as esperas em andamento em vez de deixá-las até o prazo
+    signal.signal(signal.SIGTERM, lambda signum, frame: CANCEL_EVENT.set())
+
+    # Conta usada no cache de metadados e na chave do lock; sem --account-id é obtida via STS uma única vez
+    account_id = args.account_id
+
+    # Cache de metadados entre execuções, por conta (credenciais temporárias mudam a cada execução). Instalado antes
+    # do limitador de taxa para que acertos não consumam tokens; com cassette todas as chamadas vêm do cassette
+    if not args.no_metadata_cache and not args.cassette and aws_access_key_id:
+        try:
+            account_id = account_id or get_aws_client(
+                'sts', args.region, aws_access_key_id, aws_secret_access_key, aws_session_token
+            ).get_caller_identity()['Account']
+        except Exception as e:
+            logging.warning(f"Não foi possível identificar a conta via STS ({e}); cache de metadados desativado.")
+        if account_id:
+            metadata_cache = import_optional('aws_metadata_cache').install_metadata_cache(account_id, args.metadata_cache_dir)
+            atexit.register(lambda: logging.info(f"Cache de metadados: {metadata_cache.summary()}"))
+
+    # Limitador de taxa compartilhado por todas as threads, com buckets 'describe'/'mutating' como no EC2.
+    # Instalado antes do cassette para que o replay também respeite os limites
+    rate_limiter = install_process_rate_limiter(max_rate=args.max_api_rate)
+    atexit.register(lambda: logging.info(f"Métricas do limitador de taxa: {rate_limiter.metrics()}"))
+
+    if args.trace_file or args.trace_log:
+        TRACER.enable(trace_file=args.trace_file, log_file=args.trace_log)
+        atexit.register(TRACER.export)
+
+    if args.timings:
+        install_startup_timings()
+
+    if args.cassette:
+        aws_cassette = import_optional('aws_cassette')
+        cassette = aws_cassette.Cassette(
+            args.cassette,
+            args.cassette_mode,
+            latency=aws_cassette.parse_latency(args.cassette_latency),
+            latency_overrides=aws_cassette.parse_latency_overrides(args.cassette_operation_latency)
+        )
+        cassette.install()
+        atexit.register(lambda: logging.info(f"Resumo do cassette: {cassette.summary()}"))
+        atexit.register(cassette.save)
+        if args.cassette_mode == 'replay':
+            # No replay nenhuma requisição é assinada; credenciais fictícias bastam
+            aws_access_key_id = aws_access_key_id or 'cassette-replay'
+            aws_secret_access_key = aws_secret_access_key or 'cassette-replay'
+
     if not aws_access_key_id or not aws_secret_access_key:
         logging.error("Variáveis de ambiente AWS_ACCESS_KEY_ID e/ou AWS_SECRET_ACCESS_KEY não encontradas. Por favor, configure-as na pipeline do Harness.")
         exit(1)
 
+    # Lock da VPC obtido antes de registrar o relatório: os handlers do atexit rodam em ordem inversa,
+    # então o lock só é liberado depois que o relatório e o trace forem gravados
+    run_lock = None
+    if args.lock_backend != 'none':
+        run_lock_module = import_optional('run_lock')
+        try:
+            account_id = account_id or get_aws_client(
+                'sts', args.region, aws_access_key_id, aws_secret_access_key, aws_session_token
+            ).get_caller_identity()['Account']
+            if args.lock_backend == 'file':
+                lock_backend = run_lock_module.FileLeaseBackend(args.lock_dir)
+            else:
+                lock_backend = run_lock_module.DynamoDbLeaseBackend(args.lock_table, get_aws_client(
+                    'dynamodb', args.region, aws_access_key_id, aws_secret_access_key, aws_session_token))
+            # Perder o lease cancela as esperas em andamento e impede o início de novos passos
+            lock_key = run_lock_module.vpc_lock_key(account_id, args.vpc_id)
+            run_lock = run_lock_module.LeaseLock(lock_backend, lock_key, lease_seconds=args.lock_lease, on_lost=CANCEL_EVENT.set)
+            run_lock.acquire(timeout=args.lock_wait)
+            atexit.register(run_lock.release)
+        except run_lock_module.LockTimeout as e:
+            logging.error(f"{e} Abortando.")
+            exit(1)
+        except Exception as e:
+            logging.error(f"Erro ao obter o lock da VPC '{args.vpc_id}': {e}. Abortando.")
+            exit(1)
+
+    run_report = {
+        'vpc_id': args.vpc_id,
+        'region': args.region,
+        'status': 'failed',
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'steps': [],
+        '_started': time.monotonic()
+    }
+    if run_lock is not None:
+        run_report['lock'] = {'key': run_lock.key, 'owner': run_lock.owner, 'wait_seconds': round(run_lock.wait_seconds, 3)}
+    # Encerra o último passo (e seu span) também quando a execução aborta com exit(1)
+    atexit.register(end_step, run_report)
+    if args.report_file:
+        # Registrado via atexit para que o relatório também seja gravado quando a execução abortar
+        atexit.register(write_run_report, run_report, args.report_file, rate_limiter)
+
+    subnet_prefix_lengths = {'app': args.subnet_prefix_length, 'database': args.subnet_prefix_length}
+    for override in args.subnet_prefix_overrides:
+        tag_type, _, prefix = override.partition('=')
+        if tag_type not in subnet_prefix_lengths or not prefix.isdigit():
+            logging.error(f"Override de prefixo inválido '{override}'. Use o formato tipo=prefixo com tipo em {list(subnet_prefix_lengths)}.")
+            exit(1)
+        subnet_prefix_lengths[tag_type] = int(prefix)
+
     logging.info(f"Iniciando configuração de rede na VPC '{args.vpc_id}' na região '{args.region}'.")
     
+    begin_step(run_report, 'identify_routable_network')
     # 1. Identificar a tabela de roteamento roteável (com TGW) - OK
     logging.info("Passo 1: Identificando tabela de roteamento roteável (com TGW).")
     routable_route_table_id = identify_routable_network(args.vpc_id, args.region,
@@ -636,40 +1013,56 @@ def main():
         logging.error("Nenhuma tabela de roteamento com rota para Transit Gateway encontrada. Não é possível configurar a rede roteável. Abortando.")
         exit(1)
 
+    begin_step(run_report, 'select_nat_gateway_subnets')
     # 2. Identificar uma subnet existente para o NAT Gateway (no main_vpc_cidr)
     logging.info(f"Passo 2: Identificando subnets para os NAT Gateways no CIDR '{args.main_vpc_cidr}' nas AZs 'sa-east-1a' e 'sa-east-1b'.")
     nat_gateway_subnets = get_subnets_for_nat_gateway(args.vpc_id, args.main_vpc_cidr, args.region,
-                                                       aws_access_key_id, aws_secret_access_key, aws_session_token)
+                                                       aws_access_key_id, aws_secret_access_key, aws_session_token,
+                                                       min_free_ips=args.nat_min_free_ips)
     
     if not nat_gateway_subnets or len(nat_gateway_subnets) < 2:
         logging.error(f"Não foi possível encontrar subnets adequadas em ambas as AZs ('sa-east-1a', 'sa-east-1b') no CIDR '{args.main_vpc_cidr}' para criar os NAT Gateways. Abortando.")
         exit(1)
     
+    begin_step(run_report, 'create_nat_gateways')
     # 3. Criar NAT Gateways privados (um em cada AZ)
     logging.info("Passo 3: Criando NAT Gateways privados (um em cada AZ).")
     nat_gateway_ids = {}
+    nat_gateways_started = time.monotonic()
     for az_name, subnet_id in nat_gateway_subnets.items():
         az_suffix = az_name.split('-')[-1] # 'a' or 'b'
+        # Os NAT Gateways são criados em sequência e aguardados juntos logo abaixo
         nat_gw_id = create_private_nat_gateway(subnet_id, az_suffix, args.region,
-                                            aws_access_key_id, aws_secret_access_key, aws_session_token)
+                                            aws_access_key_id, aws_secret_access_key, aws_session_token,
+                                            wait_until_available=False)
         if nat_gw_id:
             nat_gateway_ids[az_name] = nat_gw_id
         else:
             logging.error(f"Falha ao criar NAT Gateway privado na AZ '{az_name}'. Abortando.")
             exit(1)
 
+    try:
+        wait_for_nat_gateways(list(nat_gateway_ids.values()), args.region,
+                              aws_access_key_id, aws_secret_access_key, aws_session_token,
+                              started_at=nat_gateways_started)
+    except Exception as e:
+        logging.error(f"NAT Gateways {nat_gateway_ids} não ficaram disponíveis: {e}. Abortando.")
+        exit(1)
+
     if len(nat_gateway_ids) < 2:
         logging.error("Não foi possível criar NAT Gateways em ambas as AZs. Abortando.")
         exit(1)
 
+    begin_step(run_report, 'create_subnets')
     # 4. Criar as novas subnets (do non-routable-cidr, e.g., 100.99.0.0/16)
     logging.info(f"Passo 4: Criando as novas subnets a partir do CIDR '{args.non_routable_cidr}' (nomes fixos e AZs '1a' e '1b').")
     created_subnets_map = create_subnets(
         args.vpc_id,
         args.non_routable_cidr,
-        args.subnet_prefix_length,
+        subnet_prefix_lengths,
         args.region,
-        aws_access_key_id, aws_secret_access_key, aws_session_token
+        aws_access_key_id, aws_secret_access_key, aws_session_token,
+        allocation_strategy=args.cidr_allocation_strategy
     )
 
     if not created_subnets_map or len(created_subnets_map) < 4:
@@ -678,6 +1071,15 @@ def main():
     
     logging.info(f"Subnets criadas/reutilizadas com sucesso: {created_subnets_map}")
 
+    begin_step(run_report, 'create_route_tables')
+    # Índice subnet -> (tabela de roteamento, associação) da VPC, compartilhado pelos passos 5 e 6
+    try:
+        ec2_client = get_aws_client('ec2', args.region, aws_access_key_id, aws_secret_access_key, aws_session_token)
+        subnet_route_table_index = build_subnet_route_table_index(ec2_client, vpc_id=args.vpc_id)
+    except Exception as e:
+        logging.error(f"Erro ao montar o índice de associações de tabelas de roteamento da VPC '{args.vpc_id}': {e}. Abortando.")
+        exit(1)
+
     # 5. Criar uma NOVA Tabela de Roteamento para as Novas Subnets e associá-las, com rota para NAT GW
     logging.info("Passo 5: Criando NOVAS tabelas de roteamento para as subnets recém-criadas (do 100.99.0.0/16) e associando-as com rota para NAT Gateway.")
     new_non_routable_rts_map = create_new_route_table_and_associate(
@@ -685,13 +1087,15 @@ def main():
         created_subnets_map,
         nat_gateway_ids,
         args.region,
-        aws_access_key_id, aws_secret_access_key, aws_session_token
+        aws_access_key_id, aws_secret_access_key, aws_session_token,
+        subnet_route_table_index=subnet_route_table_index
     )
 
     if not new_non_routable_rts_map or len(new_non_routable_rts_map) < 2:
         logging.error("Falha ao criar e configurar as novas tabelas de roteamento para as subnets 100.99.0.0/16. Abortando.")
         exit(1)
     
+    begin_step(run_report, 'associate_main_cidr_subnets')
     # 6. Associar subnets EXISTENTES do main_vpc_cidr à Tabela de Roteamento do TGW
     logging.info(f"Passo 6: Verificando e associando subnets existentes do CIDR '{args.main_vpc_cidr}' à Tabela de Roteamento do TGW ('{routable_route_table_id}').")
     
@@ -708,43 +1112,47 @@ def main():
             routable_route_table_id,
             existing_main_cidr_subnets,
             args.region,
-            aws_access_key_id, aws_secret_access_key, aws_session_token
+            aws_access_key_id, aws_secret_access_key, aws_session_token,
+            subnet_route_table_index=subnet_route_table_index
         )
     else:
         logging.warning(f"Nenhuma subnet existente encontrada no CIDR '{args.main_vpc_cidr}' para associação à RT do TGW.")
 
+    begin_step(run_report, 'security_group_rules')
     # NOVO REQUISITO: Adicionar regras de Security Group para o VPC Endpoint
     logging.info(f"Adicionando regras de Security Group (inbound/outbound) para VPC Endpoints na rede {args.non_routable_cidr} na porta 443.")
-    for sg_id in args.security_group_ids:
-        # Regra de Inbound (para permitir que o 100.99.0.0/16 se conecte ao endpoint)
-        success_inbound = update_security_group_rules(
-            sg_id, args.vpc_id, args.non_routable_cidr, 443, 'tcp', 'inbound', args.region,
-            aws_access_key_id, aws_secret_access_key, aws_session_token
-        )
-        if not success_inbound:
-            logging.error(f"Falha ao adicionar regra de inbound para SG '{sg_id}'. Pode afetar a conectividade do VPC Endpoint.")
-
-        # Regra de Outbound (para permitir que o endpoint responda ao 100.99.0.0/16)
-        success_outbound = update_security_group_rules(
-            sg_id, args.vpc_id, args.non_routable_cidr, 443, 'tcp', 'outbound', args.region,
-            aws_access_key_id, aws_secret_access_key, aws_session_token
-        )
-        if not success_outbound:
-            logging.error(f"Falha ao adicionar regra de outbound para SG '{sg_id}'. Pode afetar a conectividade do VPC Endpoint.")
+    # Inbound permite que o 100.99.0.0/16 se conecte ao endpoint; outbound permite que o endpoint responda
+    endpoint_sg_rules = [
+        {'direction': direction, 'protocol': 'tcp', 'from_port': 443, 'to_port': 443, 'cidr': args.non_routable_cidr}
+        for direction in ('inbound', 'outbound')
+    ]
+    sg_results = reconcile_security_group_rules(
+        {sg_id: endpoint_sg_rules for sg_id in args.security_group_ids},
+        args.region,
+        aws_access_key_id, aws_secret_access_key, aws_session_token
+    )
+    for sg_id, success in sg_results.items():
+        if not success:
+            logging.error(f"Falha ao adicionar regras de inbound/outbound para SG '{sg_id}'. Pode afetar a conectividade do VPC Endpoint.")
 
+    begin_step(run_report, 'create_vpc_endpoints')
     # 7. Criar VPC Endpoints (nas novas subnets do 100.99.0.0/16)
     logging.info("Passo 7: Criando VPC Endpoints nas subnets 'app-non-routable-1a' e 'app-non-routable-1b' e Gateway Endpoints.")
     
     # Lidar com S3 Gateway Endpoint
     s3_service_name = 'com.amazonaws.sa-east-1.s3'
-    create_vpc_endpoints(
-        [s3_service_name], # S3 tratado separadamente como Gateway
-        args.vpc_id,
-        [], # Subnet IDs não são usadas para Gateway Endpoints
-        [], # Security Group IDs não são usadas para Gateway Endpoints
-        args.region,
-        aws_access_key_id, aws_secret_access_key, aws_session_token
-    )
+    try:
+        create_vpc_endpoints(
+            [s3_service_name], # S3 tratado separadamente como Gateway
+            args.vpc_id,
+            [], # Subnet IDs não são usadas para Gateway Endpoints
+            [], # Security Group IDs não são usadas para Gateway Endpoints
+            args.region,
+            aws_access_key_id, aws_secret_access_key, aws_session_token
+        )
+    except (WaiterCancelled, WaiterTimeout) as e:
+        logging.error(f"Gateway Endpoint do S3 não ficou disponível: {e}. Abortando.")
+        exit(1)
 
     # Filtrar as subnets para os VPC Endpoints de Interface
     app_non_routable_subnets_for_endpoints = []
@@ -758,15 +1166,25 @@ def main():
         exit(1)
     
     # Lidar com Interface Endpoints
-    create_vpc_endpoints(
-        service_endpoints_to_create, # Lista de Interface Endpoints
-        args.vpc_id,
-        app_non_routable_subnets_for_endpoints, # Usar as subnets 'app' de diferentes AZs
-        args.security_group_ids,
-        args.region,
-        aws_access_key_id, aws_secret_access_key, aws_session_token
-    )
+    try:
+        create_vpc_endpoints(
+            service_endpoints_to_create, # Lista de Interface Endpoints
+            args.vpc_id,
+            app_non_routable_subnets_for_endpoints, # Usar as subnets 'app' de diferentes AZs
+            args.security_group_ids,
+            args.region,
+            aws_access_key_id, aws_secret_access_key, aws_session_token,
+            wait_until_available=not args.skip_endpoint_wait
+        )
+    except (WaiterCancelled, WaiterTimeout) as e:
+        logging.error(f"VPC Endpoints de interface não ficaram disponíveis: {e}. Abortando.")
+        exit(1)
 
+    if CANCEL_EVENT.is_set():
+        # SIGTERM ou perda do lease depois do último passo: a execução não é reportada como bem-sucedida
+        logging.error("Execução cancelada durante o último passo. Abortando.")
+        exit(1)
+    run_report['status'] = 'succeeded'
     logging.info("Configuração de rede AWS concluída através do script Python.")
 
 if __name__ == "__main__":
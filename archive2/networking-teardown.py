@@ -0,0 +1,358 @@
+import argparse
+import atexit
+import datetime
+import json
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+from aws_rate_limiter import install_process_rate_limiter
+from aws_tracing import TRACER, traced, with_current_span
+from aws_waiters import (CANCEL_EVENT, WAIT_METRICS, PollSchedule, WaiterCancelled, WaiterError,
+                         nat_gateway_deletion_states, vpc_endpoint_deletion_states, wait_for_resources)
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Tag aplicada pelos scripts de rede a todos os recursos que eles criam
+MANAGED_TAG_KEY = 'ManagedBy'
+MANAGED_TAG_VALUE = 'HarnessPipeline'
+
+DEFAULT_TEARDOWN_WORKERS = 8
+# Limite de IDs por chamada de DeleteVpcEndpoints
+VPC_ENDPOINT_DELETE_BATCH_SIZE = 25
+
+# Tipos removidos de forma assíncrona pela AWS: a remoção só termina quando o estado chega a 'deleted'
+DELETION_STATES = {
+    'vpc_endpoint': vpc_endpoint_deletion_states,
+    'nat_gateway': nat_gateway_deletion_states
+}
+# Erros de recurso inexistente: a remoção é considerada concluída (ex.: re-execução após uma falha)
+NOT_FOUND_ERROR_CODES = {
+    'InvalidVpcEndpointId.NotFound', 'NatGatewayNotFound', 'InvalidSubnetID.NotFound',
+    'InvalidRouteTableID.NotFound', 'InvalidAssociationID.NotFound', 'InvalidRoute.NotFound'
+}
+
+# Agendamento de polling e prazo das esperas pela remoção (ajustáveis pela linha de comando)
+waiter_settings = {'schedule': PollSchedule(initial_delay=2.0, factor=2.0, max_delay=15.0), 'deadline_seconds': 900}
+
+def _is_managed(resource):
+    return any(tag['Key'] == MANAGED_TAG_KEY and tag['Value'] == MANAGED_TAG_VALUE for tag in resource.get('Tags', []))
+
+def _paginate(ec2_client, operation_name, result_key, filters):
+    paginator = ec2_client.get_paginator(operation_name)
+    return [item for page in paginator.paginate(Filters=filters) for item in page[result_key]]
+
+@traced()
+def discover_managed_resources(ec2_client, vpc_id):
+    """
+    Lista os recursos da VPC com a tag ManagedBy=HarnessPipeline (uma consulta paginada por tipo).
+    Todas as tabelas de roteamento da VPC são retornadas: as não gerenciadas podem ter rotas para NAT Gateways gerenciados.
+    """
+    vpc_filter = {'Name': 'vpc-id', 'Values': [vpc_id]}
+    managed_filter = {'Name': f'tag:{MANAGED_TAG_KEY}', 'Values': [MANAGED_TAG_VALUE]}
+    vpc_endpoints = _paginate(ec2_client, 'describe_vpc_endpoints', 'VpcEndpoints', [vpc_filter, managed_filter])
+    nat_gateways = _paginate(ec2_client, 'describe_nat_gateways', 'NatGateways', [vpc_filter, managed_filter])
+    return {
+        'vpc_endpoints': [endpoint for endpoint in vpc_endpoints if endpoint['State'].lower() != 'deleted'],
+        'nat_gateways': [nat for nat in nat_gateways if nat['State'] != 'deleted'],
+        'subnets': _paginate(ec2_client, 'describe_subnets', 'Subnets', [vpc_filter, managed_filter]),
+        'route_tables': _paginate(ec2_client, 'describe_route_tables', 'RouteTables', [vpc_filter])
+    }
+
+def build_teardown_graph(resources):
+    """
+    Monta o grafo de remoção {(tipo, id): nó}: cada nó lista em 'depends_on' os recursos que precisam
+    ser removidos antes dele (o inverso da ordem de criação).
+    - subnet: depois dos VPC Endpoints de interface (ENIs) e NAT Gateways que estão nela;
+    - route_table: depois das suas associações com subnets;
+    - vpc_endpoint, nat_gateway, associações e rotas para NAT Gateways gerenciados em tabelas
+      não gerenciadas não dependem de nada e são removidos em paralelo logo no início.
+    """
+    graph = {}
+
+    def add_node(resource_type, resource_id, **params):
+        graph[(resource_type, resource_id)] = {'type': resource_type, 'id': resource_id, 'params': params, 'depends_on': set()}
+
+    for endpoint in resources['vpc_endpoints']:
+        add_node('vpc_endpoint', endpoint['VpcEndpointId'], subnet_ids=endpoint.get('SubnetIds', []),
+                 already_deleting=endpoint['State'].lower() == 'deleting')
+    for nat in resources['nat_gateways']:
+        add_node('nat_gateway', nat['NatGatewayId'], subnet_ids=[nat['SubnetId']],
+                 already_deleting=nat['State'] == 'deleting')
+    managed_nat_gateway_ids = {nat['NatGatewayId'] for nat in resources['nat_gateways']}
+
+    for route_table in resources['route_tables']:
+        route_table_id = route_table['RouteTableId']
+        if not _is_managed(route_table):
+            # Rotas para NAT Gateways removidos ficariam como 'blackhole' na tabela não gerenciada
+            for route in route_table.get('Routes', []):
+                if route.get('NatGatewayId') in managed_nat_gateway_ids and route.get('DestinationCidrBlock'):
+                    add_node('route', f"{route_table_id}|{route['DestinationCidrBlock']}",
+                             route_table_id=route_table_id, destination_cidr_block=route['DestinationCidrBlock'])
+            continue
+        if any(association.get('Main') for association in route_table.get('Associations', [])):
+            logging.warning(f"Tabela de roteamento '{route_table_id}' é a tabela principal da VPC e não será removida.")
+            continue
+        add_node('route_table', route_table_id)
+        for association in route_table.get('Associations', []):
+            if association.get('AssociationState', {}).get('State') in ('disassociating', 'disassociated'):
+                continue
+            association_id = association['RouteTableAssociationId']
+            add_node('route_table_association', association_id, route_table_id=route_table_id)
+            graph[('route_table', route_table_id)]['depends_on'].add(('route_table_association', association_id))
+
+    for subnet in resources['subnets']:
+        subnet_id = subnet['SubnetId']
+        add_node('subnet', subnet_id)
+        for key, node in graph.items():
+            if node['type'] in DELETION_STATES and subnet_id in node['params']['subnet_ids']:
+                graph[('subnet', subnet_id)]['depends_on'].add(key)
+    return graph
+
+def teardown_waves(graph):
+    """Ordena o grafo em ondas (ordenação topológica por níveis): os nós de uma onda não dependem entre si."""
+    remaining = {key: set(node['depends_on']) & set(graph) for key, node in graph.items()}
+    waves = []
+    while remaining:
+        wave = sorted(key for key, depends_on in remaining.items() if not depends_on)
+        if not wave:
+            raise ValueError(f"Dependência circular entre os recursos: {sorted(remaining)}")
+        waves.append(wave)
+        for key in wave:
+            del remaining[key]
+        for depends_on in remaining.values():
+            depends_on.difference_update(wave)
+    return waves
+
+def _error_code(error):
+    return error.response.get('Error', {}).get('Code') if isinstance(error, ClientError) else None
+
+def _retry_dependency_violation(call, description):
+    """
+    Repete a remoção enquanto a AWS responder DependencyViolation: ENIs de VPC Endpoints e NAT Gateways
+    podem levar alguns segundos para serem liberadas mesmo depois do estado 'deleted'.
+    """
+    deadline = time.monotonic() + waiter_settings['deadline_seconds']
+    for delay in waiter_settings['schedule'].delays():
+        try:
+            return call()
+        except ClientError as e:
+            if _error_code(e) != 'DependencyViolation' or time.monotonic() + delay > deadline:
+                raise
+            logging.info(f"{description} ainda possui dependências. Nova tentativa em {delay:.0f}s.")
+            if CANCEL_EVENT.wait(delay):
+                raise WaiterCancelled(f"Remoção cancelada: {description}.")
+
+def delete_vpc_endpoints(ec2_client, vpc_endpoint_ids):
+    """Remove os VPC Endpoints em lotes de até 25 IDs por chamada. Retorna {vpc_endpoint_id: erro}."""
+    errors = {}
+    for start in range(0, len(vpc_endpoint_ids), VPC_ENDPOINT_DELETE_BATCH_SIZE):
+        batch = vpc_endpoint_ids[start:start + VPC_ENDPOINT_DELETE_BATCH_SIZE]
+        response = ec2_client.delete_vpc_endpoints(VpcEndpointIds=batch)
+        for item in response.get('Unsuccessful', []):
+            if item['Error']['Code'] not in NOT_FOUND_ERROR_CODES:
+                errors[item['ResourceId']] = f"{item['Error']['Code']}: {item['Error']['Message']}"
+    return errors
+
+def delete_resource(ec2_client, node):
+    """Remove um único recurso do grafo (exceto VPC Endpoints, removidos em lote)."""
+    resource_type, resource_id, params = node['type'], node['id'], node['params']
+    if resource_type == 'nat_gateway':
+        ec2_client.delete_nat_gateway(NatGatewayId=resource_id)
+    elif resource_type == 'route':
+        ec2_client.delete_route(RouteTableId=params['route_table_id'], DestinationCidrBlock=params['destination_cidr_block'])
+    elif resource_type == 'route_table_association':
+        ec2_client.disassociate_route_table(AssociationId=resource_id)
+    elif resource_type == 'route_table':
+        _retry_dependency_violation(lambda: ec2_client.delete_route_table(RouteTableId=resource_id),
+                                    f"Tabela de roteamento '{resource_id}'")
+    elif resource_type == 'subnet':
+        _retry_dependency_violation(lambda: ec2_client.delete_subnet(SubnetId=resource_id), f"Subnet '{resource_id}'")
+    else:
+        raise ValueError(f"Tipo de recurso desconhecido: {resource_type}")
+
+@traced()
+def run_wave(ec2_client, graph, wave, max_workers):
+    """
+    Remove em paralelo os recursos de uma onda e aguarda, em lote por tipo, os que são removidos de forma
+    assíncrona (uma chamada describe por tipo a cada poll). Retorna {(tipo, id): erro} dos que falharam.
+    """
+    errors = {}
+    endpoint_ids = [node_id for node_type, node_id in wave
+                    if node_type == 'vpc_endpoint' and not graph[(node_type, node_id)]['params']['already_deleting']]
+    single_nodes = [graph[key] for key in wave
+                    if key[0] not in DELETION_STATES or (key[0] == 'nat_gateway' and not graph[key]['params']['already_deleting'])]
+
+    def delete(node):
+        try:
+            delete_resource(ec2_client, node)
+            logging.info(f"Remoção de {node['type']} '{node['id']}' solicitada.")
+        except Exception as e:
+            if _error_code(e) in NOT_FOUND_ERROR_CODES:
+                logging.info(f"{node['type']} '{node['id']}' já não existe.")
+                return
+            logging.error(f"Erro ao remover {node['type']} '{node['id']}': {e}")
+            errors[(node['type'], node['id'])] = str(e)
+
+    def delete_endpoints():
+        try:
+            endpoint_errors = delete_vpc_endpoints(ec2_client, endpoint_ids)
+            logging.info(f"Remoção de {len(endpoint_ids) - len(endpoint_errors)} VPC Endpoints solicitada.")
+            for endpoint_id, error in endpoint_errors.items():
+                logging.error(f"Erro ao remover vpc_endpoint '{endpoint_id}': {error}")
+                errors[('vpc_endpoint', endpoint_id)] = error
+        except Exception as e:
+            logging.error(f"Erro ao remover VPC Endpoints {endpoint_ids}: {e}")
+            errors.update({('vpc_endpoint', endpoint_id): str(e) for endpoint_id in endpoint_ids})
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if endpoint_ids:
+            executor.submit(with_current_span(delete_endpoints))
+        list(executor.map(with_current_span(delete), single_nodes))
+
+    def wait(resource_type, resource_ids):
+        try:
+            wait_for_resources(
+                DELETION_STATES[resource_type](ec2_client), resource_ids, f'{resource_type}_deletion',
+                ready_states={'deleted'}, failed_states={'failed'},
+                schedule=waiter_settings['schedule'], deadline_seconds=waiter_settings['deadline_seconds']
+            )
+        except WaiterError as e:
+            logging.error(f"Remoção de {resource_type} não concluída: {e}")
+            errors.update({(resource_type, resource_id): str(e) for resource_id in resource_ids})
+
+    pending_by_type = {}
+    for resource_type, resource_id in wave:
+        if resource_type in DELETION_STATES and (resource_type, resource_id) not in errors:
+            pending_by_type.setdefault(resource_type, []).append(resource_id)
+    if pending_by_type:
+        with ThreadPoolExecutor(max_workers=len(pending_by_type)) as executor:
+            list(executor.map(with_current_span(lambda item: wait(*item)), pending_by_type.items()))
+    return errors
+
+def run_teardown(ec2_client, graph, max_workers=DEFAULT_TEARDOWN_WORKERS):
+    """
+    Executa as ondas em ordem. Recursos que dependem de um recurso com falha não são removidos.
+    Retorna {(tipo, id): {'status': 'deleted'|'failed'|'skipped', 'error': ...}}.
+    """
+    results = {}
+    for wave_number, wave in enumerate(teardown_waves(graph), start=1):
+        runnable = []
+        for key in wave:
+            blocked_by = [dependency for dependency in graph[key]['depends_on'] if results.get(dependency, {}).get('status') != 'deleted']
+            if blocked_by:
+                results[key] = {'status': 'skipped', 'error': f"Dependências não removidas: {sorted(blocked_by)}"}
+            else:
+                runnable.append(key)
+        if CANCEL_EVENT.is_set():
+            results.update({key: {'status': 'skipped', 'error': 'Remoção cancelada.'} for key in runnable})
+            continue
+        logging.info(f"Onda {wave_number}: removendo {len(runnable)} recursos em paralelo.")
+        wave_started = time.monotonic()
+        errors = run_wave(ec2_client, graph, runnable, max_workers)
+        for key in runnable:
+            results[key] = {'status': 'failed', 'error': errors[key]} if key in errors else {'status': 'deleted'}
+        logging.info(f"Onda {wave_number} concluída em {time.monotonic() - wave_started:.1f}s ({len(errors)} falhas).")
+    return results
+
+def remaining_managed_resources(ec2_client, vpc_id):
+    """Recursos gerenciados que ainda existem na VPC após a remoção (órfãos)."""
+    resources = discover_managed_resources(ec2_client, vpc_id)
+    return {
+        'vpc_endpoints': [endpoint['VpcEndpointId'] for endpoint in resources['vpc_endpoints']],
+        'nat_gateways': [nat['NatGatewayId'] for nat in resources['nat_gateways']],
+        'subnets': [subnet['SubnetId'] for subnet in resources['subnets']],
+        'route_tables': [route_table['RouteTableId'] for route_table in resources['route_tables'] if _is_managed(route_table)]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove os recursos de rede com a tag ManagedBy=HarnessPipeline de uma VPC, em ordem de dependência.")
+    parser.add_argument('--region', type=str, default='sa-east-1', help='Região AWS a ser usada.')
+    parser.add_argument('--vpc-id', type=str, required=True, help='ID da VPC cujos recursos gerenciados serão removidos.')
+    parser.add_argument('--yes', action='store_true', help='Executa a remoção. Sem esta opção apenas o plano (ondas de remoção) é exibido.')
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_TEARDOWN_WORKERS, help='Número máximo de remoções simultâneas em cada onda.')
+    parser.add_argument('--waiter-initial-delay', type=float, default=2.0, help='Primeiro intervalo (segundos) de polling das remoções; dobra a cada poll.')
+    parser.add_argument('--waiter-max-delay', type=float, default=15.0, help='Intervalo máximo (segundos) de polling, mantido constante após ser atingido.')
+    parser.add_argument('--waiter-deadline', type=int, default=900, help='Prazo total (segundos) de cada espera por remoção.')
+    parser.add_argument('--max-api-rate', type=float, help='Número máximo de chamadas AWS por segundo (por categoria de API).')
+    parser.add_argument('--trace-file', type=str, help='Arquivo do trace no formato Chrome/Perfetto (spans por onda e por chamada AWS).')
+    parser.add_argument('--trace-log', type=str, help='Arquivo JSON Lines com um registro estruturado por span.')
+    parser.add_argument('--report-file', type=str, help='Arquivo JSON onde o resultado por recurso e os órfãos restantes serão gravados.')
+    args = parser.parse_args()
+
+    aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+    aws_secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+    aws_session_token = os.environ.get('AWS_SESSION_TOKEN')
+
+    if not aws_access_key_id or not aws_secret_access_key:
+        logging.error("Variáveis de ambiente AWS_ACCESS_KEY_ID e/ou AWS_SECRET_ACCESS_KEY não encontradas. Por favor, configure-as na pipeline do Harness.")
+        exit(1)
+
+    waiter_settings['schedule'] = PollSchedule(initial_delay=args.waiter_initial_delay, factor=2.0, max_delay=args.waiter_max_delay)
+    waiter_settings['deadline_seconds'] = args.waiter_deadline
+    # Um abort da pipeline (SIGTERM) cancela as esperas e as ondas seguintes
+    signal.signal(signal.SIGTERM, lambda signum, frame: CANCEL_EVENT.set())
+
+    install_process_rate_limiter(max_rate=args.max_api_rate)
+    if args.trace_file or args.trace_log:
+        TRACER.enable(trace_file=args.trace_file, log_file=args.trace_log)
+        atexit.register(TRACER.export)
+
+    ec2_client = boto3.client(
+        'ec2',
+        region_name=args.region,
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        aws_session_token=aws_session_token
+    )
+
+    try:
+        graph = build_teardown_graph(discover_managed_resources(ec2_client, args.vpc_id))
+        waves = teardown_waves(graph)
+    except Exception as e:
+        logging.error(f"Erro ao montar o plano de remoção da VPC '{args.vpc_id}': {e}")
+        exit(1)
+
+    if not graph:
+        logging.info(f"Nenhum recurso com a tag {MANAGED_TAG_KEY}={MANAGED_TAG_VALUE} encontrado na VPC '{args.vpc_id}'.")
+        return
+    for wave_number, wave in enumerate(waves, start=1):
+        logging.info(f"Plano - onda {wave_number}: {[f'{resource_type}:{resource_id}' for resource_type, resource_id in wave]}")
+    if not args.yes:
+        logging.info("Nenhum recurso removido. Use --yes para executar o plano.")
+        return
+
+    started = time.monotonic()
+    results = run_teardown(ec2_client, graph, max_workers=args.max_workers)
+    orphans = remaining_managed_resources(ec2_client, args.vpc_id)
+    orphan_count = sum(len(resource_ids) for resource_ids in orphans.values())
+    failures = {key: result for key, result in results.items() if result['status'] != 'deleted'}
+
+    logging.info(f"Remoção concluída em {time.monotonic() - started:.1f}s: {len(results) - len(failures)} de {len(results)} recursos removidos.")
+    if args.report_file:
+        with open(args.report_file, 'w') as f:
+            json.dump({
+                'vpc_id': args.vpc_id,
+                'region': args.region,
+                'finished_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'duration_seconds': round(time.monotonic() - started, 3),
+                'resources': [dict(result, type=resource_type, id=resource_id) for (resource_type, resource_id), result in sorted(results.items())],
+                'orphans': orphans,
+                'waiters': WAIT_METRICS.summary()
+            }, f, indent=2)
+
+    for (resource_type, resource_id), result in sorted(failures.items()):
+        logging.error(f"{resource_type} '{resource_id}' não removido ({result['status']}): {result['error']}")
+    if orphan_count:
+        logging.error(f"{orphan_count} recursos gerenciados ainda existem na VPC '{args.vpc_id}': {orphans}")
+    if failures or orphan_count:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import ipaddress
+import json
+import logging
+import time
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_PROBE = '0.0.0.0/0'
+# Número máximo de saltos seguidos via NAT Gateway ao resolver o próximo salto efetivo
+MAX_NAT_HOPS = 4
+
+class PrefixTrie:
+    """
+    Trie binária de prefixos IPv4 para longest-prefix-match.
+    Cada nó é uma lista [filho_0, filho_1, alvo]; o alvo é o próximo salto da rota terminada no nó.
+    """
+
+    def __init__(self):
+        self.root = [None, None, None]
+
+    def insert(self, network, target):
+        node = self.root
+        address = int(network.network_address)
+        for bit_index in range(network.prefixlen):
+            bit = (address >> (31 - bit_index)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = target
+
+    def lookup(self, network):
+        """Retorna (comprimento do prefixo, alvo) da rota mais específica que contém o prefixo inteiro, ou (None, None)."""
+        node = self.root
+        address = int(network.network_address)
+        best = (0, node[2]) if node[2] is not None else (None, None)
+        for bit_index in range(network.prefixlen):
+            node = node[(address >> (31 - bit_index)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                best = (bit_index + 1, node[2])
+        return best
+
+def route_target(route):
+    """Identifica o próximo salto de uma rota do describe_route_tables ('local', 'nat-...', 'tgw-...', 'vpce-...')."""
+    if route.get('State') == 'blackhole':
+        return 'blackhole'
+    for key in ('NatGatewayId', 'TransitGatewayId', 'VpcPeeringConnectionId', 'NetworkInterfaceId',
+                'LocalGatewayId', 'CarrierGatewayId', 'EgressOnlyInternetGatewayId', 'InstanceId', 'CoreNetworkArn'):
+        if route.get(key):
+            return route[key]
+    return route.get('GatewayId', 'unknown')
+
+def build_route_table_tries(vpc_snapshot):
+    """Monta uma trie por tabela de roteamento, expandindo rotas de prefix list nas suas entradas."""
+    prefix_lists = vpc_snapshot.get('prefix_lists', {})
+    tries = {}
+    for route_table in vpc_snapshot['route_tables']:
+        trie = PrefixTrie()
+        for route in route_table.get('Routes', []):
+            target = route_target(route)
+            if route.get('DestinationCidrBlock'):
+                trie.insert(ipaddress.ip_network(route['DestinationCidrBlock']), target)
+            elif route.get('DestinationPrefixListId'):
+                for cidr in prefix_lists.get(route['DestinationPrefixListId'], {}).get('cidrs', []):
+                    network = ipaddress.ip_network(cidr)
+                    if network.version == 4:
+                        trie.insert(network, target)
+        tries[route_table['RouteTableId']] = trie
+    return tries
+
+def subnet_route_tables(vpc_snapshot):
+    """Retorna {subnet_id: route_table_id} efetivo (associação explícita ou a tabela principal da VPC)."""
+    main_route_table = None
+    explicit = {}
+    for route_table in vpc_snapshot['route_tables']:
+        for association in route_table.get('Associations', []):
+            if association.get('Main'):
+                main_route_table = route_table['RouteTableId']
+            elif association.get('SubnetId'):
+                explicit[association['SubnetId']] = route_table['RouteTableId']
+    return {subnet['SubnetId']: explicit.get(subnet['SubnetId'], main_route_table) for subnet in vpc_snapshot['subnets']}
+
+class VpcRouteResolver:
+    """Resolve o próximo salto de destinos a partir de uma subnet, seguindo NAT Gateways até o salto final."""
+
+    def __init__(self, vpc_snapshot):
+        self.tries = build_route_table_tries(vpc_snapshot)
+        self.route_table_by_subnet = subnet_route_tables(vpc_snapshot)
+        self.nat_subnets = {nat['NatGatewayId']: nat['SubnetId'] for nat in vpc_snapshot.get('nat_gateways', [])}
+        self._cache = {}
+
+    def next_hop(self, route_table_id, destination):
+        key = (route_table_id, destination)
+        if key not in self._cache:
+            trie = self.tries.get(route_table_id)
+            self._cache[key] = trie.lookup(destination)[1] if trie else None
+        return self._cache[key]
+
+    def path(self, subnet_id, destination):
+        """Lista de saltos até o destino: o primeiro é o salto da subnet; NATs são seguidos pela tabela da subnet do NAT."""
+        hops = []
+        route_table_id = self.route_table_by_subnet.get(subnet_id)
+        for _ in range(MAX_NAT_HOPS):
+            hop = self.next_hop(route_table_id, destination)
+            hops.append(hop)
+            if not hop or not hop.startswith('nat-') or hop not in self.nat_subnets:
+                break
+            route_table_id = self.route_table_by_subnet.get(self.nat_subnets[hop])
+        return hops
+
+def validate_vpc(vpc_snapshot, non_routable_network, corporate_networks, s3_prefix_list_id):
+    """
+    Valida o desenho de roteamento de uma VPC e retorna a lista de violações:
+    - subnets não roteáveis: 0.0.0.0/0 deve ter o NAT Gateway como primeiro salto;
+    - todas as subnets: os CIDRs corporativos devem terminar no Transit Gateway (seguindo NATs);
+    - todas as subnets: os CIDRs da prefix list do S3 devem ir para o Gateway Endpoint.
+    """
+    resolver = VpcRouteResolver(vpc_snapshot)
+    s3_networks = []
+    if s3_prefix_list_id:
+        s3_networks = [ipaddress.ip_network(cidr) for cidr in vpc_snapshot.get('prefix_lists', {}).get(s3_prefix_list_id, {}).get('cidrs', [])]
+        if not s3_networks:
+            logging.warning(f"Prefix list '{s3_prefix_list_id}' sem CIDRs no snapshot da VPC '{vpc_snapshot['vpc_id']}'.")
+    default_network = ipaddress.ip_network(DEFAULT_PROBE)
+
+    violations = []
+
+    def check(subnet, probe, hops, expected_prefix, rule):
+        hop = hops[-1] if rule == 'corporate_via_tgw' else hops[0]
+        if not hop or not hop.startswith(expected_prefix):
+            violations.append({
+                'vpc_id': vpc_snapshot['vpc_id'],
+                'subnet_id': subnet['SubnetId'],
+                'subnet_cidr': subnet['CidrBlock'],
+                'route_table_id': resolver.route_table_by_subnet.get(subnet['SubnetId']),
+                'rule': rule,
+                'probe': str(probe),
+                'expected': f'{expected_prefix}*',
+                'path': hops
+            })
+
+    for subnet in vpc_snapshot['subnets']:
+        subnet_id = subnet['SubnetId']
+        if resolver.route_table_by_subnet.get(subnet_id) is None:
+            violations.append({'vpc_id': vpc_snapshot['vpc_id'], 'subnet_id': subnet_id, 'subnet_cidr': subnet['CidrBlock'],
+                               'rule': 'route_table', 'expected': 'tabela de roteamento associada', 'path': []})
+            continue
+        if ipaddress.ip_network(subnet['CidrBlock']).subnet_of(non_routable_network):
+            check(subnet, default_network, resolver.path(subnet_id, default_network), 'nat-', 'default_via_nat')
+        for corporate_network in corporate_networks:
+            check(subnet, corporate_network, resolver.path(subnet_id, corporate_network), 'tgw-', 'corporate_via_tgw')
+        for s3_network in s3_networks:
+            check(subnet, s3_network, resolver.path(subnet_id, s3_network), 'vpce-', 's3_via_gateway_endpoint')
+    return violations
+
+def capture_snapshot(vpc_ids, region):
+    """Gera o snapshot (tabelas de roteamento, subnets, NAT Gateways e prefix lists) das VPCs informadas."""
+    import boto3 # Importado aqui: a validação offline não depende do boto3
+    ec2_client = boto3.client('ec2', region_name=region)
+
+    def paginate(operation, key, **kwargs):
+        items = []
+        for page in ec2_client.get_paginator(operation).paginate(**kwargs):
+            items.extend(page[key])
+        return items
+
+    prefix_lists = {
+        prefix_list['PrefixListId']: {'name': prefix_list['PrefixListName'], 'cidrs': prefix_list.get('Cidrs', [])}
+        for prefix_list in paginate('describe_prefix_lists', 'PrefixLists')
+    }
+    vpcs = []
+    for vpc_id in vpc_ids:
+        vpc_filter = [{'Name': 'vpc-id', 'Values': [vpc_id]}]
+        route_tables = paginate('describe_route_tables', 'RouteTables', Filters=vpc_filter)
+        vpc_prefix_lists = dict(prefix_lists)
+        # Prefix lists gerenciadas pelo cliente referenciadas nas rotas
+        for route_table in route_tables:
+            for route in route_table.get('Routes', []):
+                prefix_list_id = route.get('DestinationPrefixListId')
+                if prefix_list_id and prefix_list_id not in vpc_prefix_lists:
+                    entries = paginate('get_managed_prefix_list_entries', 'Entries', PrefixListId=prefix_list_id)
+                    vpc_prefix_lists[prefix_list_id] = {'name': prefix_list_id, 'cidrs': [entry['Cidr'] for entry in entries]}
+        vpcs.append({
+            'vpc_id': vpc_id,
+            'region': region,
+            'route_tables': route_tables,
+            'subnets': paginate('describe_subnets', 'Subnets', Filters=vpc_filter),
+            'nat_gateways': paginate('describe_nat_gateways', 'NatGateways', Filters=vpc_filter),
+            'prefix_lists': vpc_prefix_lists
+        })
+    return {'vpcs': vpcs}
+
+def find_prefix_list_id(vpc_snapshot, prefix_list_name):
+    for prefix_list_id, prefix_list in vpc_snapshot.get('prefix_lists', {}).items():
+        if prefix_list.get('name') == prefix_list_name:
+            return prefix_list_id
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Valida offline o roteamento do desenho de subnets não roteáveis a partir de um snapshot.")
+    parser.add_argument('--snapshot', type=str, required=True, help='Arquivo JSON do snapshot (lido na validação, gravado com --capture).')
+    parser.add_argument('--capture', action='store_true', help='Captura o snapshot das VPCs informadas em --vpc-ids em vez de validar.')
+    parser.add_argument('--vpc-ids', nargs='+', default=[], help='VPCs a capturar (somente com --capture).')
+    parser.add_argument('--region', type=str, default='sa-east-1', help='Região AWS usada na captura e no nome da prefix list do S3.')
+    parser.add_argument('--non-routable-cidr', type=str, default='100.99.0.0/16', help='CIDR das subnets que devem sair pelo NAT Gateway.')
+    parser.add_argument('--corporate-cidrs', nargs='*', default=['10.0.0.0/8'], help='CIDRs corporativos que devem terminar no Transit Gateway.')
+    parser.add_argument('--skip-s3', action='store_true', help='Não valida a rota da prefix list do S3 para o Gateway Endpoint.')
+    parser.add_argument('--report', type=str, help='Arquivo JSON onde as violações serão gravadas.')
+    args = parser.parse_args()
+
+    if args.capture:
+        if not args.vpc_ids:
+            logging.error("Informe --vpc-ids para capturar o snapshot.")
+            exit(1)
+        snapshot = capture_snapshot(args.vpc_ids, args.region)
+        with open(args.snapshot, 'w') as f:
+            json.dump(snapshot, f, indent=2, default=str)
+        logging.info(f"Snapshot de {len(snapshot['vpcs'])} VPCs gravado em '{args.snapshot}'.")
+        return
+
+    with open(args.snapshot) as f:
+        snapshot = json.load(f)
+
+    non_routable_network = ipaddress.ip_network(args.non_routable_cidr)
+    corporate_networks = [ipaddress.ip_network(cidr) for cidr in args.corporate_cidrs]
+
+    started = time.perf_counter()
+    violations = []
+    subnet_count = 0
+    for vpc_snapshot in snapshot['vpcs']:
+        s3_prefix_list_id = None
+        if not args.skip_s3:
+            s3_prefix_list_id = find_prefix_list_id(vpc_snapshot, f"com.amazonaws.{vpc_snapshot.get('region', args.region)}.s3")
+        violations.extend(validate_vpc(vpc_snapshot, non_routable_network, corporate_networks, s3_prefix_list_id))
+        subnet_count += len(vpc_snapshot['subnets'])
+    elapsed = time.perf_counter() - started
+
+    for violation in violations:
+        logging.error(f"Violação '{violation['rule']}' na subnet '{violation['subnet_id']}' ({violation['subnet_cidr']}) da VPC '{violation['vpc_id']}': "
+                      f"destino {violation.get('probe', '-')} esperado {violation['expected']}, caminho {violation['path']}.")
+    logging.info(f"{subnet_count} subnets em {len(snapshot['vpcs'])} VPCs validadas em {elapsed * 1000:.1f}ms: {len(violations)} violações.")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'subnets_checked': subnet_count, 'elapsed_seconds': round(elapsed, 4), 'violations': violations}, f, indent=2)
+
+    if violations:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+from aws_waiters import CANCEL_EVENT, PollSchedule
+
+LOCK_BACKENDS = ('none', 'file', 'dynamodb')
+DEFAULT_LEASE_SECONDS = 300
+
+
+class LockTimeout(Exception):
+    """O lock não foi obtido dentro do prazo de espera."""
+
+
+class LockLost(Exception):
+    """O lease expirou ou foi tomado por outra execução enquanto era mantido."""
+
+
+def default_owner():
+    """Identificador da execução: host, PID e um sufixo aleatório (PIDs se repetem entre containers)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class FileLeaseBackend:
+    """
+    Leases em arquivos JSON locais (um por chave), para testes e execuções em um único runner.
+    Cada leitura-e-escrita é feita sob flock no próprio arquivo, então processos concorrentes não se sobrepõem.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace('/', '_').replace(':', '_') + '.lease')
+
+    def _update(self, key, change):
+        with open(self._path(key), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                lease = json.loads(content) if content else None
+                accepted, new_lease = change(lease)
+                if accepted:
+                    f.seek(0)
+                    f.truncate()
+                    if new_lease is not None:
+                        json.dump(new_lease, f)
+                    f.flush()
+                return accepted, lease
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self, key, owner, lease_seconds, now):
+        """Grava o lease se não houver um válido de outro dono. Retorna (obtido, lease_anterior)."""
+        def change(lease):
+            if lease and lease['owner'] != owner and lease['expires_at'] > now:
+                return False, None
+            return True, {'owner': owner, 'expires_at': now + lease_seconds, 'version': (lease or {}).get('version', 0) + 1}
+        return self._update(key, change)
+
+    def renew(self, key, owner, lease_seconds, now):
+        def change(lease):
+            if not lease or lease['owner'] != owner:
+                return False, None
+            return True, dict(lease, expires_at=now + lease_seconds)
+        return self._update(key, change)[0]
+
+    def release(self, key, owner):
+        def change(lease):
+            return bool(lease and lease['owner'] == owner), None
+        return self._update(key, change)[0]
+
+
+class DynamoDbLeaseBackend:
+    """
+    Leases em uma tabela DynamoDB (chave de partição 'lock_key', string) com escritas condicionais:
+    o lease só é gravado se não existir, estiver expirado ou já pertencer ao mesmo dono.
+    O atributo 'expires_at' (epoch) pode ser configurado como TTL da tabela para limpar leases abandonados.
+    """
+
+    def __init__(self, table_name, dynamodb_client=None, region=None):
+        self.table_name = table_name
+        self.client = dynamodb_client or boto3.client('dynamodb', region_name=region)
+
+    @staticmethod
+    def _is_condition_failure(error):
+        return error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+    def try_acquire(self, key, owner, lease_seconds, now):
+        try:
+            response = self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'lock_key': {'S': key},
+                    'owner': {'S': owner},
+                    'expires_at': {'N': str(int(now + lease_seconds))},
+                    'acquired_at': {'N': str(int(now))}
+                },
+                ConditionExpression='attribute_not_exists(lock_key) OR expires_at < :now OR #owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':now': {'N': str(int(now))}, ':owner': {'S': owner}},
+                ReturnValues='ALL_OLD'
+            )
+        except ClientError as e:
+            if self._is_condition_failure(e):
+                return False, None
+            raise
+        previous = response.get('Attributes')
+        if not previous:
+            return True, None
+        return True, {'owner': previous['owner']['S'], 'expires_at': float(previous['expires_at']['N'])}
+
+    def renew(self, key, owner, lease_seconds, now):
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={'lock_key': {'S': key}},
+                UpdateExpression='SET expires_at = :expires_at',
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':expires_at': {'N': str(int(now + lease_seconds))}, ':owner': {'S': owner}}
+            )
+            return True
+        except ClientError as e:
+            if self._is_condition_failure(e):
+                return False
+            raise
+
+    def release(self, key, owner):
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={'lock_key': {'S': key}},
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':owner': {'S': owner}}
+            )
+            return True
+        except ClientError as e:
+            if self._is_condition_failure(e):
+                return False
+            raise
+
+
+class LeaseLock:
+    """
+    Lock por lease com heartbeat: enquanto mantido, uma thread renova o lease a cada lease_seconds / 3.
+    Um lease não renovado (execução morta ou travada) expira e pode ser tomado por outra execução.
+    Se a renovação falhar, on_lost é chamado (o lease pode já pertencer a outra execução).
+    """
+
+    def __init__(self, backend, key, owner=None, lease_seconds=DEFAULT_LEASE_SECONDS, on_lost=None):
+        self.backend = backend
+        self.key = key
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.on_lost = on_lost
+        self.wait_seconds = None
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def acquire(self, timeout=3600, schedule=None, cancel_event=CANCEL_EVENT):
+        """Aguarda o lock (fila por polling) por até timeout segundos. Levanta LockTimeout."""
+        schedule = schedule or PollSchedule(initial_delay=1.0, factor=2.0, max_delay=15.0)
+        started = time.monotonic()
+        deadline = started + timeout
+        for delay in schedule.delays():
+            acquired, previous = self.backend.try_acquire(self.key, self.owner, self.lease_seconds, time.time())
+            if acquired:
+                self.wait_seconds = time.monotonic() - started
+                if previous and previous['owner'] != self.owner:
+                    logging.warning(f"Lease expirado de '{previous['owner']}' recuperado para o lock '{self.key}'.")
+                logging.info(f"Lock '{self.key}' obtido por '{self.owner}' após {self.wait_seconds:.1f}s.")
+                self._start_heartbeat()
+                return self
+            if time.monotonic() + delay > deadline:
+                raise LockTimeout(f"Lock '{self.key}' não obtido em {timeout}s.")
+            logging.info(f"Lock '{self.key}' em uso por outra execução. Nova tentativa em {delay:.0f}s.")
+            if cancel_event.wait(delay):
+                raise LockTimeout(f"Espera pelo lock '{self.key}' cancelada.")
+
+    def _start_heartbeat(self):
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name=f'lease-heartbeat-{self.key}', daemon=True)
+        self._heartbeat.start()
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                renewed = self.backend.renew(self.key, self.owner, self.lease_seconds, time.time())
+            except Exception as e:
+                # Falha transitória: o lease ainda vale até expirar, tenta de novo no próximo heartbeat
+                logging.warning(f"Erro ao renovar o lease do lock '{self.key}': {e}")
+                continue
+            if not renewed:
+                logging.error(f"Lease do lock '{self.key}' perdido: expirou ou foi tomado por outra execução.")
+                self.lost.set()
+                if self.on_lost:
+                    self.on_lost()
+                return
+
+    def release(self):
+        if self._heartbeat is None:
+            return
+        self._stop.set()
+        self._heartbeat.join()
+        self._heartbeat = None
+        if not self.lost.is_set():
+            try:
+                self.backend.release(self.key, self.owner)
+                logging.info(f"Lock '{self.key}' liberado.")
+            except Exception as e:
+                logging.error(f"Erro ao liberar o lock '{self.key}' (expira em até {self.lease_seconds}s): {e}")
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        if self.lost.is_set() and exc_type is None:
+            raise LockLost(f"Lease do lock '{self.key}' perdido durante a execução.")
+
+
+def vpc_lock_key(account_id, vpc_id):
+    return f"networking/{account_id}/{vpc_id}"